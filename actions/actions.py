@@ -1,15 +1,15 @@
 # actions.py
 import os
-import re
 import mimetypes
 import json
-import sqlite3
-from typing import Any, Text, Dict, List, Tuple
+import uuid
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Text, Dict, List, Tuple
 from datetime import datetime
 
 import pytz
-import requests
-import pandas as pd
 
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
@@ -21,6 +21,17 @@ import google.generativeai as genai
 
 # ---------- 실시간 파일 로깅 (패키지 임포트 경로) ----------
 from actions.log_utils import ConversationLogger
+from actions.kb_utils import KBCache, clean_and_linkify, is_time_question
+from actions.history_utils import HistoryStore, recent_from_jsonl
+from actions.mask_utils import build_masker
+from actions.upload_utils import SummaryCache, file_sha256
+from actions.pdf_utils import HAS_PDF_TEXT, PdfChunk, chunk_pages, extract_pages, map_reduce, page_count
+from actions.profile_utils import profile_markdown
+from actions.pool_utils import JobTimeout, ProcessJobPool
+from actions.gemini_utils import (
+    AdaptiveTimeout, AnswerCache, CircuitBreaker, ConcurrencyGate,
+    GeminiClient, GeminiHTTPError, GeminiUnavailable, SingleFlight, StreamFanout, StreamPusher,
+)
 
 
 # =========================
@@ -32,12 +43,137 @@ CHAT_MODEL_URL: str = (
     f"https://generativelanguage.googleapis.com/v1beta/models/"
     f"gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
 )
+CHAT_STREAM_URL: str = (
+    f"https://generativelanguage.googleapis.com/v1beta/models/"
+    f"gemini-1.5-flash:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+)
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "100"))       # 동시 커넥션(keep-alive 풀) 상한
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))           # 시도 1회 타임아웃 상한(초)
+GEMINI_TIMEOUT_MIN = float(os.getenv("GEMINI_TIMEOUT_MIN", "10"))   # 적응형 타임아웃 하한(초)
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "45"))         # 대기+재시도 포함 전체 상한(초), Flask /send 60초보다 작게
+GEMINI_KEEPALIVE = float(os.getenv("GEMINI_KEEPALIVE", "30"))       # 유휴 커넥션 유지 시간(초)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "50"))  # 동시 호출 상한
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "200"))        # 대기열 상한 (초과 시 즉시 실패)
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "2"))              # 429/5xx/연결 오류 재시도 횟수
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+GEMINI_CB_FAILURES = int(os.getenv("GEMINI_CB_FAILURES", "5"))      # 연속 실패 n회 → 서킷 오픈
+GEMINI_CB_RESET = float(os.getenv("GEMINI_CB_RESET", "30"))         # 오픈 유지 시간(초) 후 시험 호출
+gemini_client = GeminiClient(
+    CHAT_MODEL_URL, pool_size=GEMINI_POOL_SIZE, timeout=GEMINI_TIMEOUT, keepalive=GEMINI_KEEPALIVE,
+    stream_url=CHAT_STREAM_URL,
+    gate=ConcurrencyGate(GEMINI_MAX_CONCURRENCY, GEMINI_MAX_QUEUE),
+    timeouts=AdaptiveTimeout(GEMINI_TIMEOUT_MIN, GEMINI_TIMEOUT),
+    breaker=CircuitBreaker(GEMINI_CB_FAILURES, GEMINI_CB_RESET),
+    retries=GEMINI_RETRIES,
+    backoff_base=GEMINI_BACKOFF_BASE,
+    backoff_max=GEMINI_BACKOFF_MAX,
+    deadline=GEMINI_DEADLINE,
+)
+
+# socket.io 클라이언트에게 답변을 조각 단위로 먼저 전송 (최종본은 기존처럼 utter_message)
+# - 받는 곳: 메시지 metadata.socket_id (REST 게이트웨이 경유 index.html), 없으면 socketio 채널의 sender_id
+GEMINI_STREAM = os.getenv("GEMINI_STREAM", "false").lower() in ("1", "true", "yes")
+STREAM_PUSH_URL = os.getenv("STREAM_PUSH_URL", "http://localhost:5005/webhooks/socketio/stream")
+STREAM_PUSH_TOKEN = os.getenv("STREAM_PUSH_TOKEN")   # my_socketio와 같은 값 (선택)
+stream_pusher = StreamPusher(STREAM_PUSH_URL, token=STREAM_PUSH_TOKEN)
+stream_fanout = StreamFanout(stream_pusher)
+
+# 외부 모드 프롬프트 (문구를 바꾸면 버전도 올려서 기존 캐시 무효화)
+GEMINI_PROMPT_VERSION = "v1"
+GEMINI_PROMPT_TEMPLATE = (
+    "너는 '엔지켐생명과학'의 사내 업무를 도와주는 친절한 AI 비서야. "
+    "과도한 수식어 없이 간결하고 정확하게 답해줘.\n\n"
+    "질문: {message}"
+)
+
+GEMINI_CACHE = os.getenv("GEMINI_CACHE", "true").lower() in ("1", "true", "yes")
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))            # 초
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "1000"))            # 메모리 LRU 항목 수
+GEMINI_CACHE_SQLITE = os.getenv("GEMINI_CACHE_SQLITE", "")                  # 경로 지정 시 디스크 캐시 사용
+GEMINI_CACHE_SQLITE_SIZE = int(os.getenv("GEMINI_CACHE_SQLITE_SIZE", "100000"))
+answer_cache = AnswerCache(
+    ttl=GEMINI_CACHE_TTL,
+    max_size=GEMINI_CACHE_SIZE,
+    sqlite_path=GEMINI_CACHE_SQLITE or None,
+    sqlite_max_size=GEMINI_CACHE_SQLITE_SIZE,
+) if GEMINI_CACHE else None
+
+# 같은 질문이 동시에 몰리면 업스트림 호출 1건으로 병합 (통계: gemini_flight.stats())
+gemini_flight = SingleFlight()
+
 FILE_MODEL_NAME: str = "models/gemini-1.5-pro"
 genai.configure(api_key=GEMINI_API_KEY)
 g_model = genai.GenerativeModel(FILE_MODEL_NAME)
 
+# 파일 요약 프롬프트 (문구나 모델을 바꾸면 버전도 올려서 기존 요약 캐시 무효화)
+FILE_PROMPT_VERSION = "v1"
+PDF_SUMMARY_PROMPT = "이 문서의 핵심을 5~7개 불릿으로 요약하고, 액션아이템이 있으면 따로 정리해줘."
+EXCEL_SUMMARY_PROMPT = """
+다음 표 데이터에서 핵심 인사이트/추세/이상치/추천 액션을 간결한 불릿으로 요약해줘.
+[미리보기(최대 30행)]
+{head}
+
+[기본 통계]
+{stats}
+"""
+# 대용량 PDF 맵-리듀스: 구간 요약 → (묶음 중간 요약) → 최종 요약
+PDF_CHUNK_PROMPT = """
+다음은 긴 문서의 {first}~{last}쪽 본문이야. 이 구간의 핵심 내용, 수치, 결정/요구사항, 액션아이템을 빠짐없이 짧은 불릿으로 정리해줘.
+
+{text}
+"""
+PDF_MERGE_PROMPT = """
+다음은 한 문서의 구간별 요약이야. 중복을 합치고 중요한 내용과 액션아이템은 남겨서 더 짧은 불릿으로 정리해줘.
+
+{summaries}
+"""
+PDF_REDUCE_PROMPT = """
+다음은 한 문서의 구간별 요약이야. 문서 전체의 핵심을 5~7개 불릿으로 요약하고, 액션아이템이 있으면 따로 정리해줘.
+
+{summaries}
+"""
+CSV_SUMMARY_PROMPT = """
+CSV 데이터 요약: 핵심 지표/추세/이상치/권고사항을 불릿으로 정리해줘.
+[미리보기]
+{head}
+
+[기본 통계]
+{stats}
+"""
+
+# 업로드 파일 요약 캐시: (sha256, mime, 프롬프트 버전) → 요약, PDF 원격 URI는 만료 전까지 재사용
+FILE_CACHE = os.getenv("FILE_CACHE", "true").lower() in ("1", "true", "yes")
+FILE_REMOTE_TTL = float(os.getenv("FILE_REMOTE_TTL", str(47 * 3600)))   # 만료 시각을 못 받았을 때 (Files API 보관 48시간)
+
+# 대용량 PDF는 로컬 텍스트 추출(pypdf) 후 구간별 요약 → 최종 요약 (pypdf가 없거나 작은 PDF는 기존 단일 요청)
+PDF_MAPREDUCE = os.getenv("PDF_MAPREDUCE", "true").lower() in ("1", "true", "yes")
+PDF_MAPREDUCE_MIN_PAGES = int(os.getenv("PDF_MAPREDUCE_MIN_PAGES", "40"))   # 이 쪽수 이상일 때만
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "20"))                   # 구간당 최대 쪽수
+PDF_CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", "30000"))                # 구간당 최대 글자 수
+PDF_MAP_WORKERS = int(os.getenv("PDF_MAP_WORKERS", "4"))                    # 동시 구간 요약 수
+PDF_REDUCE_CHARS = int(os.getenv("PDF_REDUCE_CHARS", "60000"))              # 최종 요약 입력 상한 (넘으면 중간 요약)
+
+# CSV/Excel 스트리밍 프로파일 (메모리는 청크 크기 + 컬럼별 고정 크기 요약)
+PROFILE_CHUNK_ROWS = int(os.getenv("PROFILE_CHUNK_ROWS", "50000"))
+PROFILE_TOP_CAPACITY = int(os.getenv("PROFILE_TOP_CAPACITY", "200"))   # 컬럼별 빈도 카운터 수
+PROFILE_SAMPLE_SIZE = int(os.getenv("PROFILE_SAMPLE_SIZE", "10000"))   # 컬럼별 분위수 표본 크기
+
+# 파일 파싱/프로파일/PDF 텍스트 추출용 프로세스 풀 (false면 스레드에서 실행)
+FILE_PARSE_POOL = os.getenv("FILE_PARSE_POOL", "true").lower() in ("1", "true", "yes")
+FILE_PARSE_WORKERS = int(os.getenv("FILE_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+FILE_PARSE_TIMEOUT = float(os.getenv("FILE_PARSE_TIMEOUT", "120"))        # 작업 1건 제한(초), 넘으면 워커 종료
+FILE_PARSE_MAX_TASKS = int(os.getenv("FILE_PARSE_MAX_TASKS", "0"))        # >0 이면 워커당 작업 수 후 교체 (Python 3.11+)
+PDF_EXTRACT_PAGES_PER_JOB = int(os.getenv("PDF_EXTRACT_PAGES_PER_JOB", "50"))   # PDF 텍스트 추출 작업 단위(쪽)
+
 KB_PATH = os.getenv("KB_PATH", "kb.txt")
 KB_SEP = os.getenv("KB_SEP", "\t")
+KB_CSV_CHUNKSIZE = int(os.getenv("KB_CSV_CHUNKSIZE", "0"))          # >0 이면 TXT/CSV 청크 스트리밍
+KB_SNAPSHOT = os.getenv("KB_SNAPSHOT", "true").lower() in ("1", "true", "yes")
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH", f"{KB_PATH}.snapshot.pkl")  # mtime+size로 유효성 확인
+KB_RELOAD_INTERVAL = float(os.getenv("KB_RELOAD_INTERVAL", "2.0"))  # 백그라운드 변경 감시 주기(초), 0이면 끔
+KB_FUZZY = os.getenv("KB_FUZZY", "false").lower() in ("1", "true", "yes")  # 정확 매칭 실패 시 오타/띄어쓰기 허용 검색 (켜기 전 bench_kb.py 라벨 세트로 오답 확인)
+KB_FUZZY_THRESHOLD = float(os.getenv("KB_FUZZY_THRESHOLD", "0.8"))       # 0~1, 이 점수 이상이면 내부 답변
 
 BASE_DIR_FROM_ENV = os.getenv("CHAT_LOG_DIR")
 if BASE_DIR_FROM_ENV:
@@ -53,6 +189,8 @@ SQLITE_PATH             = os.path.join(CHAT_LOG_DIR, "history.sqlite")
 
 AUTO_SAVE_HISTORY = os.getenv("AUTO_SAVE_HISTORY", "true").lower() in ("1", "true", "yes")
 SAVE_BACKEND = os.getenv("SAVE_BACKEND", "both").lower()  # both | jsonl | sqlite
+# 세션별 저장 워터마크 이후 이벤트만 저장 (false면 매 턴 전체 대화를 다시 저장하던 기존 방식)
+HISTORY_INCREMENTAL = os.getenv("HISTORY_INCREMENTAL", "true").lower() in ("1", "true", "yes")
 
 print(f"[HISTORY] CHAT_LOG_DIR={CHAT_LOG_DIR}")
 print(f"[HISTORY] JSONL_PATH(all)     ={JSONL_PATH}")
@@ -60,83 +198,38 @@ print(f"[HISTORY] JSONL_PATH(internal)={JSONL_PATH_INTERNAL}")
 print(f"[HISTORY] JSONL_PATH(gemini)  ={JSONL_PATH_GEMINI}")
 print(f"[HISTORY] SQLITE_PATH         ={SQLITE_PATH}")
 
-# ▶ ▶ 실시간 이벤트 로거: 모드별 분리 저장
-logger = ConversationLogger(base_dir=CHAT_LOG_DIR, split_by_mode=True)
-
-
-# =========================
-# 1) KB 캐시 (TXT/CSV/XLSX)
-# =========================
-class KBCache:
-    def __init__(self, path: str):
-        self.path = path
-        self.mtime = 0.0
-        self.topics: Dict[str, str] = {}
-        self.synonyms: Dict[str, str] = {}
-        self._load(force=True)
-
-    def _load(self, force: bool = False):
-        if not os.path.exists(self.path):
-            if force:
-                print(f"[KB] 파일이 없습니다: {self.path}")
-            return
-
-        cur = os.path.getmtime(self.path)
-        if (cur == self.mtime) and not force:
-            return
-
-        ext = os.path.splitext(self.path)[1].lower()
-        if ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(self.path, sheet_name="kb")
-        elif ext == ".csv":
-            df = pd.read_csv(self.path)
-        else:
-            df = pd.read_csv(self.path, sep=KB_SEP)
-
-        cols_lower = {c.lower(): c for c in df.columns}
-
-        def need(col: str) -> str:
-            if col in cols_lower:
-                return cols_lower[col]
-            raise ValueError(f"[KB] '{col}' 컬럼이 없습니다. 현재 컬럼: {list(df.columns)}")
+# ▶ ▶ 실시간 이벤트 로거: 모드별 분리 저장 (write-behind: 요청 스레드는 큐에 넣기만)
+LOG_WRITE_BEHIND = os.getenv("LOG_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))   # 초
+LOG_PUT_TIMEOUT = float(os.getenv("LOG_PUT_TIMEOUT", "0.05"))        # 초, 큐가 가득 차면 이만큼 기다린 뒤 직접 기록
+logger = ConversationLogger(base_dir=CHAT_LOG_DIR, split_by_mode=True, write_behind=LOG_WRITE_BEHIND,
+                            flush_interval=LOG_FLUSH_INTERVAL, put_timeout=LOG_PUT_TIMEOUT)
 
-        tcol = need("topic")
-        acol = need("answer")
-        scol = cols_lower.get("synonyms")
+# ▶ SQLite 히스토리 저장소 (스키마 1회 초기화, 커넥션 재사용, WAL)
+history_store = HistoryStore(SQLITE_PATH)
 
-        topics: Dict[str, str] = {}
-        synonyms: Dict[str, str] = {}
+# ▶ 업로드 파일 요약 캐시 (SQLite)
+FILE_CACHE_SQLITE = os.getenv("FILE_CACHE_SQLITE", os.path.join(CHAT_LOG_DIR, "file_cache.sqlite"))
+file_cache = SummaryCache(FILE_CACHE_SQLITE) if FILE_CACHE else None
 
-        for _, row in df.iterrows():
-            topic = "" if pd.isna(row[tcol]) else str(row[tcol]).strip()
-            if not topic:
-                continue
-            answer = "" if pd.isna(row[acol]) else str(row[acol]).strip()
-            topics[topic] = answer
+# ▶ 파일 처리 프로세스 풀 (첫 업로드 때 워커 생성)
+parse_pool = ProcessJobPool(
+    workers=FILE_PARSE_WORKERS, timeout=FILE_PARSE_TIMEOUT, max_tasks_per_child=FILE_PARSE_MAX_TASKS or None,
+) if FILE_PARSE_POOL else None
 
-            synonyms[topic.lower()] = topic
-            if scol and not pd.isna(row[scol]):
-                for phrase in [s.strip() for s in str(row[scol]).split(",") if str(s).strip()]:
-                    synonyms[phrase.lower()] = topic
 
-        self.topics, self.synonyms, self.mtime = topics, synonyms, cur
-        print(f"[KB] 로드 완료: {self.path} (rows={len(self.topics)})")
-
-    def maybe_reload(self): self._load()
-
-    def find_topic(self, user_text: str) -> str:
-        self.maybe_reload()
-        text = (user_text or "").lower()
-        keys = sorted(self.synonyms.keys(), key=len, reverse=True)
-        for k in keys:
-            if k and (k in text):
-                return self.synonyms[k]
-        return ""
-
-    def get_answer(self, topic: str) -> str:
-        return self.topics.get(topic, "")
-
-KB = KBCache(KB_PATH)
+# =========================
+# 1) KB 캐시 (TXT/CSV/XLSX) - 구현은 kb_utils.KBCache (app.py 빠른 경로와 공유)
+# =========================
+KB = KBCache(
+    KB_PATH,
+    reload_interval=KB_RELOAD_INTERVAL,
+    sep=KB_SEP,
+    chunksize=KB_CSV_CHUNKSIZE,
+    snapshot_path=KB_SNAPSHOT_PATH if KB_SNAPSHOT else None,
+    fuzzy=KB_FUZZY,
+    fuzzy_threshold=KB_FUZZY_THRESHOLD,
+)
 
 
 # =========================
@@ -146,47 +239,48 @@ def now_in_seoul() -> str:
     seoul_time = datetime.now(pytz.timezone("Asia/Seoul"))
     return seoul_time.strftime("%Y년 %m월 %d일 %A %p %I시 %M분")
 
-def is_time_question(msg: str) -> bool:
-    msg = (msg or "").lower()
-    triggers = ["현재 시간", "지금 몇시", "몇시", "오늘 날짜", "날짜", "오늘"]
-    return any(t.lower() in msg for t in triggers)
-
-URL_RE = re.compile(r"\b(https?://[^\s<>'\"]+)", re.IGNORECASE)
-def clean_and_linkify(text: str) -> str:
-    if not text: return text
-    s = text.replace("https//", "https://").replace("http//", "http://")
-    s = re.sub(r"<a[^>]*href=['\"]([^'\">]+)['\"][^>]*>.*?</a>", r"\1", s, flags=re.IGNORECASE | re.DOTALL)
-    return URL_RE.sub(r"<a href='\1' target='_blank'>\1</a>", s)
-
 
 # =========================
 # 2-1) 히스토리 저장 유틸 (마스킹/JSONL/SQLite + 모드분리)
 # =========================
-EMAIL_RE = re.compile(r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)")
-PHONE_RE = re.compile(r"(\b01[016789]-?\d{3,4}-?\d{4}\b|\b\d{2,3}-\d{3,4}-\d{4}\b)")
-RRN_RE = re.compile(r"\b\d{6}-\d{7}\b")
+# ▶ 마스킹: 단일 패스 엔진 + 텍스트 단위 메모 (선택/사용자 패턴은 환경변수로 추가)
+MASK_EXTRA = os.getenv("MASK_EXTRA", "")                 # 예: "CARD"
+MASK_PATTERNS = os.getenv("MASK_PATTERNS", "")           # 예: '[{"name":"EMPNO","pattern":"\\bE\\d{6}\\b"}]'
+MASK_CACHE_SIZE = int(os.getenv("MASK_CACHE_SIZE", "10000"))
+masker = build_masker(MASK_EXTRA, MASK_PATTERNS, cache_size=MASK_CACHE_SIZE)
+print(f"[MASK] patterns={masker.names} cache={MASK_CACHE_SIZE}")
 
 def mask_text(text: str) -> str:
-    if not text: return text
-    text = EMAIL_RE.sub("[EMAIL]", text)
-    text = PHONE_RE.sub("[PHONE]", text)
-    text = RRN_RE.sub("[RRN]", text)
-    return text
-
-def extract_history(tracker: Tracker) -> List[Dict[str, Any]]:
+    return masker.mask(text)
+
+def _events_since(events: List[Dict[str, Any]], since_ts: float | None) -> List[Dict[str, Any]]:
+    """since_ts 이후 이벤트만 (뒤에서부터 훑어서 턴당 비용이 대화 길이와 무관)"""
+    if since_ts is None:
+        return events
+    start = len(events)
+    while start > 0 and (events[start - 1].get("timestamp") or 0) > since_ts:
+        start -= 1
+    return events[start:]
+
+def extract_history(tracker: Tracker, since_ts: float | None = None) -> List[Dict[str, Any]]:
     history: List[Dict[str, Any]] = []
-    for e in tracker.events:
+    for e in _events_since(tracker.events, since_ts):
         et = e.get("event")
         ts = e.get("timestamp")
         tstr = datetime.fromtimestamp(ts).isoformat() if ts else None
         if et == "user":
-            history.append({
+            msg = {
                 "type": "user",
                 "text": mask_text(e.get("text")),
                 "intent": (e.get("parse_data") or {}).get("intent", {}).get("name"),
                 "entities": (e.get("parse_data") or {}).get("entities", []),
                 "time": tstr,
-            })
+            }
+            # 게이트웨이 빠른 경로 적중은 액션을 거치지 않으므로 이벤트 메타데이터의 토픽을 집계에 사용
+            topic = (e.get("metadata") or {}).get("topic")
+            if topic:
+                msg["topic"] = topic
+            history.append(msg)
         elif et == "bot":
             history.append({
                 "type": "bot",
@@ -195,34 +289,70 @@ def extract_history(tracker: Tracker) -> List[Dict[str, Any]]:
             })
     return history
 
-def _split_history_by_mode(history: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+def _mode_of_set_mode(m: Dict[str, Any]) -> str:
+    """set_mode 메시지의 mode 엔티티 → internal | gemini | unknown"""
+    mode_val = None
+    for ent in (m.get("entities") or []):
+        if ent.get("entity") == "mode":
+            mode_val = (ent.get("value") or "").lower()
+            break
+    if mode_val in ("internal", "내부"):
+        return "internal"
+    if mode_val in ("gemini", "외부"):
+        return "gemini"
+    return "unknown"
+
+def _split_history_by_mode(history: List[Dict[str, Any]], start_mode: str = "unknown") -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
     set_mode intent를 기준으로 내부/외부 구간을 나눕니다.
+    - start_mode: 증분 저장 시 직전 저장 시점의 모드
     반환: (internal_list, gemini_list, unknown_list)
     """
-    current = "unknown"
+    current = start_mode
     internal, gemini, unknown = [], [], []
     for m in history:
         # set_mode 명령이 있으면 모드 갱신
         if m.get("type") == "user" and m.get("intent") == "set_mode":
-            # entities에서 mode 값 추출
-            mode_val = None
-            for ent in (m.get("entities") or []):
-                if ent.get("entity") == "mode":
-                    mode_val = (ent.get("value") or "").lower()
-                    break
-            if mode_val in ("internal", "내부"):
-                current = "internal"
-            elif mode_val in ("gemini", "외부"):
-                current = "gemini"
-            else:
-                current = "unknown"
+            current = _mode_of_set_mode(m)
             continue
 
         target = internal if current=="internal" else gemini if current=="gemini" else unknown
         target.append(m)
     return internal, gemini, unknown
 
+def _final_mode(history: List[Dict[str, Any]], start_mode: str = "unknown") -> str:
+    current = start_mode
+    for m in history:
+        if m.get("type") == "user" and m.get("intent") == "set_mode":
+            current = _mode_of_set_mode(m)
+    return current
+
+def _annotate_for_rollup(history: List[Dict[str, Any]], start_mode: str = "unknown",
+                         outcome: Dict[str, Any] | None = None) -> List[Dict[str, Any]]:
+    """
+    SQLite 집계 롤업용 주석 (사본에만 추가, JSONL 레코드는 그대로)
+    - mode: set_mode 기준 메시지별 모드
+    - outcome: 이번 턴 답변 결과 {"topic": ...} 또는 {"src": "gemini" | "kb_miss"} → 마지막 사용자 메시지에 부착
+    """
+    last_user = max((i for i, m in enumerate(history) if m.get("type") == "user"), default=-1)
+    current = start_mode
+    annotated = []
+    for i, m in enumerate(history):
+        if m.get("type") == "user" and m.get("intent") == "set_mode":
+            current = _mode_of_set_mode(m)
+        a = dict(m, mode=current)
+        if outcome and i == last_user:
+            a.update(outcome)
+        annotated.append(a)
+    return annotated
+
+def _stream_recipient(tracker: Tracker) -> str | None:
+    """스트리밍 조각을 받을 socket.io 연결 ID (없으면 None → 스트리밍 없이 응답)"""
+    socket_id = ((tracker.latest_message or {}).get("metadata") or {}).get("socket_id")
+    if socket_id:
+        return socket_id
+    return tracker.sender_id if tracker.get_latest_input_channel() == "socketio" else None
+
 def get_session_id(tracker: Tracker) -> str:
     sid = tracker.sender_id or "unknown"
     first_user = next((e for e in tracker.events if e.get("event") == "user"), None)
@@ -238,8 +368,8 @@ def append_jsonl(sender_id: str, session_id: str, history: List[Dict[str, Any]])
     record = {"sender_id": sender_id, "session_id": session_id, "saved_at": datetime.now().isoformat(), "history": history}
     _append_jsonl_to(JSONL_PATH, record)
 
-def append_jsonl_split_by_mode(sender_id: str, session_id: str, history: List[Dict[str, Any]]) -> None:
-    internal, gemini, unknown = _split_history_by_mode(history)
+def append_jsonl_split_by_mode(sender_id: str, session_id: str, history: List[Dict[str, Any]], start_mode: str = "unknown") -> None:
+    internal, gemini, unknown = _split_history_by_mode(history, start_mode)
     ts = datetime.now().isoformat()
     if internal:
         _append_jsonl_to(JSONL_PATH_INTERNAL, {"sender_id": sender_id, "session_id": session_id, "saved_at": ts, "history": internal})
@@ -247,58 +377,73 @@ def append_jsonl_split_by_mode(sender_id: str, session_id: str, history: List[Di
         _append_jsonl_to(JSONL_PATH_GEMINI,   {"sender_id": sender_id, "session_id": session_id, "saved_at": ts, "history": gemini})
 
 def init_sqlite():
-    conn = sqlite3.connect(SQLITE_PATH)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS conversations(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sender_id TEXT,
-        session_id TEXT,
-        saved_at TEXT
-    )
-    """)
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS messages(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        conv_id INTEGER,
-        role TEXT,   -- 'user' or 'bot'
-        text TEXT,
-        intent TEXT,
-        time TEXT,
-        FOREIGN KEY(conv_id) REFERENCES conversations(id)
-    )
-    """)
-    conn.commit()
-    conn.close()
-
-def insert_sqlite(sender_id: str, session_id: str, history: List[Dict[str, Any]]):
-    init_sqlite()
-    conn = sqlite3.connect(SQLITE_PATH)
-    c = conn.cursor()
-    saved_at = datetime.now().isoformat()
-    c.execute("INSERT INTO conversations(sender_id, session_id, saved_at) VALUES(?,?,?)",
-              (sender_id, session_id, saved_at))
-    conv_id = c.lastrowid
-    for m in history:
-        c.execute(
-            "INSERT INTO messages(conv_id, role, text, intent, time) VALUES(?,?,?,?,?)",
-            (conv_id, m.get("type"), m.get("text"), m.get("intent"), m.get("time"))
-        )
-    conn.commit()
-    conn.close()
-
-def save_history_all(tracker: Tracker):
-    """선택 백엔드에 따라 저장 (both | jsonl | sqlite) + 모드별 JSONL 추가"""
+    """스키마는 HistoryStore 생성 시 이미 초기화됨 (기존 호출부 호환용)"""
+    return history_store
+
+def insert_sqlite(sender_id: str, session_id: str, history: List[Dict[str, Any]], append: bool = False,
+                  watermark: Tuple[float, str] | None = None, rollup: List[Dict[str, Any]] | None = None):
+    """append=True면 세션의 기존 conversations 행에 메시지만 이어 붙임 (증분 저장)"""
+    history_store.save(sender_id, session_id, history, append=append, watermark=watermark, rollup=rollup)
+
+_WATERMARKS: Dict[str, Tuple[float, str]] = {}
+_WATERMARK_LOCK = threading.Lock()
+
+def get_watermark(session_id: str) -> Tuple[float | None, str]:
+    """(마지막 저장 이벤트 시각, 그 시점 모드) - 메모리 우선, 재시작 후엔 SQLite에서 복구"""
+    with _WATERMARK_LOCK:
+        if session_id in _WATERMARKS:
+            return _WATERMARKS[session_id]
+    return history_store.get_watermark(session_id) or (None, "unknown")
+
+def set_watermark(session_id: str, last_ts: float, mode: str, persist: bool = True):
+    with _WATERMARK_LOCK:
+        _WATERMARKS[session_id] = (last_ts, mode)
+    if persist:
+        history_store.set_watermark(session_id, last_ts, mode)
+
+def save_history_all(tracker: Tracker, outcome: Dict[str, Any] | None = None):
+    """
+    선택 백엔드에 따라 저장 (both | jsonl | sqlite) + 모드별 JSONL 추가
+    - outcome: 이번 턴 답변 결과 (SQLite 집계 롤업용, _annotate_for_rollup 참고)
+    """
     sender_id = tracker.sender_id
     session_id = get_session_id(tracker)
-    history = extract_history(tracker)
 
-    if SAVE_BACKEND in ("both", "jsonl"):
-        append_jsonl(sender_id, session_id, history)
-        # ▶ 추가: 모드별 분리 저장
-        append_jsonl_split_by_mode(sender_id, session_id, history)
-    if SAVE_BACKEND in ("both", "sqlite"):
-        insert_sqlite(sender_id, session_id, history)
+    if not HISTORY_INCREMENTAL:
+        history = extract_history(tracker)
+        if SAVE_BACKEND in ("both", "jsonl"):
+            append_jsonl(sender_id, session_id, history)
+            # ▶ 추가: 모드별 분리 저장
+            append_jsonl_split_by_mode(sender_id, session_id, history)
+        if SAVE_BACKEND in ("both", "sqlite"):
+            # 메시지는 대화 전체를 저장하되, 집계 롤업은 워터마크 이후 새 메시지만 (턴마다 중복 집계 방지)
+            last_ts, start_mode = get_watermark(session_id)
+            tail = extract_history(tracker, since_ts=last_ts)
+            latest_ts = next((e.get("timestamp") for e in reversed(tracker.events) if e.get("timestamp")), None)
+            watermark = (latest_ts, _final_mode(tail, start_mode)) if latest_ts is not None else None
+            insert_sqlite(sender_id, session_id, history, watermark=watermark,
+                          rollup=_annotate_for_rollup(tail, start_mode, outcome))
+            if watermark is not None:
+                set_watermark(session_id, *watermark, persist=False)
+        return
+
+    # ▶ 증분 저장: 워터마크 이후 이벤트만 (턴당 저장량 일정, 전체 저장량은 대화 길이에 선형)
+    last_ts, start_mode = get_watermark(session_id)
+    history = extract_history(tracker, since_ts=last_ts)
+    latest_ts = next((e.get("timestamp") for e in reversed(tracker.events) if e.get("timestamp")), None)
+    watermark = (latest_ts, _final_mode(history, start_mode)) if latest_ts is not None else None
+    persisted = False
+    if history:
+        if SAVE_BACKEND in ("both", "jsonl"):
+            append_jsonl(sender_id, session_id, history)
+            append_jsonl_split_by_mode(sender_id, session_id, history, start_mode)
+        if SAVE_BACKEND in ("both", "sqlite"):
+            # 메시지와 워터마크를 한 트랜잭션으로
+            insert_sqlite(sender_id, session_id, _annotate_for_rollup(history, start_mode, outcome),
+                          append=True, watermark=watermark)
+            persisted = True
+    if watermark is not None:
+        set_watermark(session_id, *watermark, persist=not persisted)
 
 
 # =========================
@@ -307,7 +452,7 @@ def save_history_all(tracker: Tracker):
 class ActionSmartAnswer(Action):
     def name(self) -> Text: return "action_smart_answer"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         mode = tracker.get_slot("mode")
         user_message = tracker.latest_message.get("text", "").strip()
 
@@ -335,13 +480,12 @@ class ActionSmartAnswer(Action):
 
             topic = KBCache.find_topic.__get__(KB, KBCache)(user_message)
             if topic:
-                ans = KB.get_answer(topic).strip()
-                msg = clean_and_linkify(ans) if ans else "내부 지식에서 답변이 비어 있습니다. KB를 확인해 주세요."
+                msg = KB.get_rendered_answer(topic) or "내부 지식에서 답변이 비어 있습니다. KB를 확인해 주세요."
                 dispatcher.utter_message(text=msg)
                 try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=mode, meta={"topic": topic})
                 except Exception as e: print(f"[LOGGER][bot] {e}")
                 if AUTO_SAVE_HISTORY:
-                    try: save_history_all(tracker)
+                    try: save_history_all(tracker, outcome={"topic": topic})
                     except Exception as e: print(f"[HISTORY][AUTO] save error: {e}")
                 return []
 
@@ -350,14 +494,14 @@ class ActionSmartAnswer(Action):
             try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=mode)
             except Exception as e: print(f"[LOGGER][bot] {e}")
             if AUTO_SAVE_HISTORY:
-                try: save_history_all(tracker)
+                try: save_history_all(tracker, outcome={"src": "kb_miss"})
                 except Exception as e: print(f"[HISTORY][AUTO] save error: {e}")
             return []
 
         elif mode == "gemini":
-            self._call_gemini_api(dispatcher, tracker, user_message, mode)
+            await self._call_gemini_api(dispatcher, tracker, user_message, mode)
             if AUTO_SAVE_HISTORY:
-                try: save_history_all(tracker)
+                try: save_history_all(tracker, outcome={"src": "gemini"})
                 except Exception as e: print(f"[HISTORY][AUTO] save error: {e}")
             return []
 
@@ -368,28 +512,17 @@ class ActionSmartAnswer(Action):
             except Exception as e: print(f"[LOGGER][bot] {e}")
             return []
 
-    def _call_gemini_api(self, dispatcher: CollectingDispatcher, tracker: Tracker, message: str, mode: str | None):
-        headers = {"Content-Type": "application/json"}
-        prompt = (
-            "너는 '엔지켐생명과학'의 사내 업무를 도와주는 친절한 AI 비서야. "
-            "과도한 수식어 없이 간결하고 정확하게 답해줘.\n\n"
-            f"질문: {message}"
-        )
-        data = {"contents": [{"parts": [{"text": prompt}]}]}
+    async def _call_gemini_api(self, dispatcher: CollectingDispatcher, tracker: Tracker, message: str, mode: str | None):
+        prompt = GEMINI_PROMPT_TEMPLATE.format(message=message)
+        cache_key = AnswerCache.make_key(message, mode=mode, version=GEMINI_PROMPT_VERSION)
         try:
-            r = requests.post(CHAT_MODEL_URL, headers=headers, json=data, timeout=30)
-            if not r.ok:
-                msg = f"Gemini API 오류: HTTP {r.status_code}\n{r.text[:800]}"
-                dispatcher.utter_message(text=msg)
-                try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=mode, meta={"status": r.status_code})
-                except Exception as e: print(f"[LOGGER][system] {e}")
-                return
-            j = r.json()
-            text = ""
-            if j.get("candidates"):
-                parts = j["candidates"][0].get("content", {}).get("parts", [])
-                if parts and parts[0].get("text"):
-                    text = parts[0]["text"]
+            text = answer_cache.get(cache_key) if answer_cache else None
+            cached = text is not None
+            recipient_id = _stream_recipient(tracker) if GEMINI_STREAM else None
+            if not cached and recipient_id:
+                text = await self._stream_gemini(recipient_id, prompt, cache_key)
+            elif not cached:
+                text = await gemini_flight.do(cache_key, lambda: self._fetch_gemini(prompt, cache_key))
             if not text:
                 msg = "Gemini 응답이 비어 있습니다. 잠시 후 다시 시도해 주세요."
                 dispatcher.utter_message(text=msg)
@@ -398,19 +531,61 @@ class ActionSmartAnswer(Action):
                 return
             msg = text.strip()
             dispatcher.utter_message(text=msg)
-            try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=mode, meta={"src":"gemini"})
+            try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=mode, meta={"src":"gemini", "cached": cached})
             except Exception as e: print(f"[LOGGER][bot] {e}")
-        except requests.exceptions.Timeout:
+        except GeminiHTTPError as e:
+            msg = f"Gemini API 오류: HTTP {e.status}\n{e.body[:800]}"
+            dispatcher.utter_message(text=msg)
+            try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=mode, meta={"status": e.status})
+            except Exception as le: print(f"[LOGGER][system] {le}")
+        except asyncio.TimeoutError:
             msg = "Gemini 응답 지연(타임아웃)입니다. 잠시 후 다시 시도해 주세요."
             dispatcher.utter_message(text=msg)
             try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=mode, meta={"error":"timeout"})
             except Exception as e: print(f"[LOGGER][system] {e}")
+        except GeminiUnavailable as e:
+            # 서킷 오픈/대기열 초과: 호출 없이 즉시 실패 (사용자 안내는 타임아웃과 동일)
+            msg = "Gemini 응답 지연(타임아웃)입니다. 잠시 후 다시 시도해 주세요."
+            dispatcher.utter_message(text=msg)
+            try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=mode, meta={"error":"unavailable", "reason": str(e)})
+            except Exception as le: print(f"[LOGGER][system] {le}")
         except Exception as e:
             msg = f"Gemini 호출 중 예외: {e}"
             dispatcher.utter_message(text=msg)
             try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=mode, meta={"error":"exception"})
             except Exception as le: print(f"[LOGGER][system] {le}")
 
+    async def _fetch_gemini(self, prompt: str, cache_key: str) -> str:
+        text = await gemini_client.generate(prompt)
+        if text and answer_cache:
+            answer_cache.set(cache_key, text)
+        return text
+
+    async def _stream_gemini(self, recipient_id: str, prompt: str, cache_key: str) -> str:
+        """
+        조각을 받는 즉시 socket.io로 중계하고, 끝나면 전체 답변(done)을 한 번 더 보냄
+        - 같은 질문이 동시에 오면 업스트림 스트림 1개를 공유 (gemini_flight + stream_fanout)
+        - 오류/취소로 끝나도 done은 항상 보냄 (text="" → 클라이언트는 조각 말풍선을 지우고 최종 메시지를 기다림)
+        """
+        stream_id = uuid.uuid4().hex
+        stream_fanout.subscribe(cache_key, recipient_id, stream_id)
+        text = ""
+        try:
+            text = await gemini_flight.do(cache_key, lambda: self._run_stream(prompt, cache_key))
+            return text
+        finally:
+            stream_fanout.unsubscribe(cache_key, stream_id)
+            await stream_pusher.push(recipient_id, stream_id, (text or "").strip(), done=True)
+
+    async def _run_stream(self, prompt: str, cache_key: str) -> str:
+        text = ""
+        async for chunk in gemini_client.stream(prompt):
+            text += chunk
+            await stream_fanout.publish(cache_key, text)
+        if text and answer_cache:
+            answer_cache.set(cache_key, text)
+        return text
+
     def _is_company_category_query(self, message: str) -> bool:
         msg = message or ""
         return any(w in msg for w in ["부서", "팀", "업무", "프로세스", "신청", "복리", "후생", "규정", "정책", "연락처"])
@@ -456,10 +631,127 @@ class ActionSetMode(Action):
 # =========================
 # 5) 파일 요약 액션 (PDF/Excel/CSV)
 # =========================
+# ▶ 파일 요약 (PDF는 Gemini 파일 업로드, 표는 미리보기+통계 프롬프트)
+PDF_MIME = "application/pdf"
+EXCEL_MIMES = ("application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+CSV_MIME = "text/csv"
+SUMMARY_MIMES = (PDF_MIME, *EXCEL_MIMES, CSV_MIME)
+
+def _pdf_file_uri(file_path: str, sha: str) -> Tuple[str, bool]:
+    """(원격 URI, 새로 올렸는지) - 같은 내용의 PDF가 만료 전이면 업로드 생략"""
+    found = file_cache.get_remote(sha, PDF_MIME) if file_cache else None
+    if found:
+        return found[0], False
+    uploaded = genai.upload_file(path=file_path, mime_type=PDF_MIME)
+    if file_cache:
+        expires = getattr(uploaded, "expiration_time", None)
+        expires_at = expires.timestamp() if expires else time.time() + FILE_REMOTE_TTL
+        file_cache.set_remote(sha, PDF_MIME, uploaded.uri, getattr(uploaded, "name", None), expires_at)
+    return uploaded.uri, True
+
+def _summarize_pdf(file_path: str, sha: str) -> str:
+    uri, fresh = _pdf_file_uri(file_path, sha)
+    for attempt in range(2):
+        prompt = {
+            "role": "user",
+            "parts": [
+                {"file_data": {"file_uri": uri, "mime_type": PDF_MIME}},
+                {"text": PDF_SUMMARY_PROMPT},
+            ],
+        }
+        try:
+            return _generate_text(prompt)
+        except Exception:
+            if fresh or attempt:
+                raise
+            # 재사용한 URI가 서버에서 먼저 지워졌을 수 있음 → 한 번만 새로 올려서 재시도
+            file_cache.drop_remote(sha, PDF_MIME)
+            uri, fresh = _pdf_file_uri(file_path, sha)
+    return ""
+
+def _generate_text(prompt: str) -> str:
+    resp = g_model.generate_content(prompt)
+    return (getattr(resp, "text", "") or "").strip()
+
+def _summarize_pdf_chunked(sha: str, texts: List[str], progress: Callable[[int, int], None] | None = None) -> str:
+    """구간별 요약은 캐시 → 일부 실패 후 다시 요청하면 실패한 구간만 다시 요약"""
+    def summarize_chunk(chunk: PdfChunk) -> str:
+        return _generate_text(PDF_CHUNK_PROMPT.format(first=chunk.first_page, last=chunk.last_page, text=chunk.text))
+
+    def reduce_summaries(summaries: List[str], final: bool) -> str:
+        template = PDF_REDUCE_PROMPT if final else PDF_MERGE_PROMPT
+        return _generate_text(template.format(summaries="\n\n".join(summaries)))
+
+    return map_reduce(
+        chunk_pages(texts, pages_per_chunk=PDF_CHUNK_PAGES, max_chars=PDF_CHUNK_CHARS),
+        summarize_chunk,
+        reduce_summaries,
+        workers=PDF_MAP_WORKERS,
+        get_cached=(lambda c: file_cache.get_chunk(sha, c.first_page, c.last_page, FILE_PROMPT_VERSION)) if file_cache else None,
+        set_cached=(lambda c, text: file_cache.set_chunk(sha, c.first_page, c.last_page, FILE_PROMPT_VERSION, text)) if file_cache else None,
+        progress=progress,
+        total_pages=len(texts),
+        reduce_chars=PDF_REDUCE_CHARS,
+    )
+
+async def _offload(fn: Callable[..., Any], *args: Any) -> Any:
+    """CPU 작업: 프로세스 풀(기본) 또는 스레드에서 실행"""
+    if parse_pool is not None:
+        return await parse_pool.run(fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def _pdf_mapreduce_pages(file_path: str) -> int:
+    """맵-리듀스 대상이면 쪽수, 아니면 0"""
+    if not (PDF_MAPREDUCE and HAS_PDF_TEXT):
+        return 0
+    try:
+        pages = await _offload(page_count, file_path)
+    except JobTimeout:
+        raise
+    except Exception as e:  # 암호화/손상 PDF는 원격 처리에 맡김
+        print(f"[PDF] local read failed, fallback to upload: {e}")
+        return 0
+    return pages if pages >= PDF_MAPREDUCE_MIN_PAGES else 0
+
+async def _extract_pdf_texts(file_path: str, pages: int) -> List[str]:
+    """페이지 구간별로 나눠 프로세스 풀에서 동시에 추출 (코어 수만큼 빨라짐)"""
+    if parse_pool is None:
+        return await _offload(extract_pages, file_path)
+    step = max(1, PDF_EXTRACT_PAGES_PER_JOB)
+    ranges = [(file_path, first, min(first + step - 1, pages)) for first in range(1, pages + 1, step)]
+    parts = await parse_pool.map(extract_pages, ranges)
+    return [text for part in parts for text in part]
+
+async def summarize_file(file_path: str, file_mime: str, sha: str, progress: Callable[[int, int], None] | None = None) -> str:
+    """
+    캐시 미스일 때 실제 요약 생성 (file_mime은 SUMMARY_MIMES 중 하나)
+    - 파싱/프로파일/텍스트 추출은 프로세스 풀, 모델 호출은 스레드 → 액션 서버 이벤트 루프는 막지 않음
+    """
+    loop = asyncio.get_running_loop()
+    if file_mime == PDF_MIME:
+        pages = await _pdf_mapreduce_pages(file_path)
+        if pages:
+            texts = await _extract_pdf_texts(file_path, pages)
+            text = await loop.run_in_executor(None, _summarize_pdf_chunked, sha, texts, progress)
+            if text:
+                return text
+            print("[PDF] no extractable text (scanned?), fallback to upload")
+        return await loop.run_in_executor(None, _summarize_pdf, file_path, sha)
+    # 표: 파일 전체를 DataFrame으로 올리지 않고 청크 단위 통계 (describe와 같은 행 구성)
+    if file_mime == CSV_MIME:
+        kind, template = "csv", CSV_SUMMARY_PROMPT
+    else:
+        kind, template = ("xls" if file_mime == EXCEL_MIMES[0] else "xlsx"), EXCEL_SUMMARY_PROMPT
+    head, stats = await _offload(
+        profile_markdown, file_path, kind, PROFILE_CHUNK_ROWS, 30, PROFILE_TOP_CAPACITY, PROFILE_SAMPLE_SIZE
+    )
+    return await loop.run_in_executor(None, _generate_text, template.format(head=head, stats=stats))
+
+
 class ActionSummarizeFile(Action):
     def name(self) -> Text: return "action_summarize_file"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: DomainDict) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: DomainDict) -> List[Dict[Text, Any]]:
         file_path = tracker.get_slot("uploaded_file_path")
         file_mime = tracker.get_slot("uploaded_file_mime")
 
@@ -477,63 +769,34 @@ class ActionSummarizeFile(Action):
             guessed, _ = mimetypes.guess_type(file_path)
             file_mime = guessed or "application/octet-stream"
 
-        try:
-            if file_mime == "application/pdf":
-                uploaded = genai.upload_file(path=file_path, mime_type="application/pdf")
-                prompt = {
-                    "role": "user",
-                    "parts": [
-                        {"file_data": {"file_uri": uploaded.uri, "mime_type": "application/pdf"}},
-                        {"text": "이 문서의 핵심을 5~7개 불릿으로 요약하고, 액션아이템이 있으면 따로 정리해줘."},
-                    ],
-                }
-                resp = g_model.generate_content(prompt)
-                msg = clean_and_linkify((getattr(resp, "text", "") or "").strip())
-                dispatcher.utter_message(text=msg)
-                try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"), meta={"file_mime": file_mime})
-                except Exception as e: print(f"[LOGGER][bot] {e}")
-
-            elif file_mime in ("application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"):
-                df = pd.read_excel(file_path)
-                head = df.head(30).to_markdown(index=False)
-                stats = df.describe(include="all").to_markdown()
-                prompt = f"""
-다음 표 데이터에서 핵심 인사이트/추세/이상치/추천 액션을 간결한 불릿으로 요약해줘.
-[미리보기(최대 30행)]
-{head}
-
-[기본 통계]
-{stats}
-"""
-                resp = g_model.generate_content(prompt)
-                msg = clean_and_linkify((getattr(resp, "text", "") or "").strip())
-                dispatcher.utter_message(text=msg)
-                try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"), meta={"file_mime": file_mime})
-                except Exception as e: print(f"[LOGGER][bot] {e}")
-
-            elif file_mime == "text/csv":
-                df = pd.read_csv(file_path)
-                head = df.head(30).to_markdown(index=False)
-                stats = df.describe(include="all").to_markdown()
-                prompt = f"""
-CSV 데이터 요약: 핵심 지표/추세/이상치/권고사항을 불릿으로 정리해줘.
-[미리보기]
-{head}
+        if file_mime not in SUMMARY_MIMES:
+            msg = f"현재 지원하지 않는 파일 형식입니다: {file_mime}. PDF/Excel/CSV를 올려주세요."
+            dispatcher.utter_message(text=msg)
+            try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"))
+            except Exception as e: print(f"[LOGGER][bot] {e}")
+            return []
 
-[기본 통계]
-{stats}
-"""
-                resp = g_model.generate_content(prompt)
-                msg = clean_and_linkify((getattr(resp, "text", "") or "").strip())
-                dispatcher.utter_message(text=msg)
-                try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"), meta={"file_mime": file_mime})
-                except Exception as e: print(f"[LOGGER][bot] {e}")
-            else:
-                msg = f"현재 지원하지 않는 파일 형식입니다: {file_mime}. PDF/Excel/CSV를 올려주세요."
-                dispatcher.utter_message(text=msg)
-                try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"))
-                except Exception as e: print(f"[LOGGER][bot] {e}")
+        try:
+            # 같은 내용 + 같은 형식 + 같은 프롬프트 버전이면 업로드/생성 없이 저장된 요약 사용
+            sha = file_sha256(file_path)
+            msg = file_cache.get_summary(sha, file_mime, FILE_PROMPT_VERSION) if file_cache else None
+            cached = msg is not None
+            if not cached:
+                progress = self._progress_reporter(asyncio.get_running_loop(), tracker, sha)
+                text = await summarize_file(file_path, file_mime, sha, progress)
+                msg = clean_and_linkify(text)
+                if msg and file_cache:
+                    file_cache.set_summary(sha, file_mime, FILE_PROMPT_VERSION, msg)
+                progress.close(msg)
+            dispatcher.utter_message(text=msg)
+            try: logger.log(sender_id=tracker.sender_id, role="bot", text=msg, mode=tracker.get_slot("mode"), meta={"file_mime": file_mime, "sha256": sha, "cached": cached})
+            except Exception as e: print(f"[LOGGER][bot] {e}")
 
+        except JobTimeout as e:
+            msg = f"파일 처리 시간이 너무 길어 중단했습니다 ({e}). 파일을 나눠서 올려주세요."
+            dispatcher.utter_message(text=msg)
+            try: logger.log(sender_id=tracker.sender_id, role="system", text=msg, mode=tracker.get_slot("mode"), meta={"error":"parse_timeout"})
+            except Exception as le: print(f"[LOGGER][system] {le}")
         except Exception as e:
             msg = f"요약 중 오류가 발생했습니다: {e}"
             dispatcher.utter_message(text=msg)
@@ -542,6 +805,39 @@ CSV 데이터 요약: 핵심 지표/추세/이상치/권고사항을 불릿으
 
         return []
 
+    @staticmethod
+    def _progress_reporter(loop: asyncio.AbstractEventLoop, tracker: Tracker, sha: str) -> "SummaryProgress":
+        socketio = tracker.get_latest_input_channel() == "socketio"
+        return SummaryProgress(loop, tracker.sender_id if socketio else None, sha)
+
+
+class SummaryProgress:
+    """
+    대용량 PDF 요약 진행률: 로그 + (socket.io 클라이언트면) bot_stream 이벤트로 "n/m쪽" 전달
+    - 워커 스레드에서 호출되므로 푸시는 액션 서버 이벤트 루프로 넘김
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, recipient_id: str | None, sha: str):
+        self.loop = loop
+        self.recipient_id = recipient_id
+        self.sha = sha
+        self.stream_id = uuid.uuid4().hex
+        self.started = False
+
+    def __call__(self, done_pages: int, total_pages: int):
+        self.started = True
+        print(f"[PDF] {self.sha[:12]} {done_pages}/{total_pages} pages")
+        if self.recipient_id:
+            text = f"📄 문서 요약 중… {done_pages}/{total_pages}쪽"
+            asyncio.run_coroutine_threadsafe(stream_pusher.push(self.recipient_id, self.stream_id, text), self.loop)
+
+    def close(self, final_text: str):
+        """진행 표시를 최종 요약으로 마무리 (진행률을 보낸 적이 있을 때만)"""
+        if self.started and self.recipient_id:
+            asyncio.run_coroutine_threadsafe(
+                stream_pusher.push(self.recipient_id, self.stream_id, final_text, done=True), self.loop
+            )
+
 
 # =========================
 # 6) 스텁/히스토리 액션 (변경 없음, 저장 경로 안내만 유지)
@@ -574,3 +870,147 @@ class ActionSaveHistory(Action):
         except Exception as e:
             dispatcher.utter_message(text=f"히스토리 저장 중 오류가 발생했습니다: {e}")
         return []
+
+
+# =========================
+# 7) 히스토리 조회/검색/집계 액션 (키셋 페이지네이션 + SQLite FTS5 + 롤업)
+# =========================
+HISTORY_SEARCH_LIMIT = int(os.getenv("HISTORY_SEARCH_LIMIT", "20"))
+HISTORY_SEARCH_MAX_LIMIT = int(os.getenv("HISTORY_SEARCH_MAX_LIMIT", "200"))
+HISTORY_STATS_TOP_N = int(os.getenv("HISTORY_STATS_TOP_N", "10"))
+HISTORY_SEARCH_FILTER_SLOTS = ("filter_keyword", "filter_sender_id", "filter_from", "filter_to", "filter_limit")
+
+def _parse_limit(value: Any, default: int, cap: int) -> int:
+    try:
+        n = int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(n, cap))
+
+HISTORY_RECENT_LIMIT = int(os.getenv("HISTORY_RECENT_LIMIT", "10"))
+HISTORY_TAIL_MAX_BYTES = int(os.getenv("HISTORY_TAIL_MAX_BYTES", str(32 * 1024 * 1024)))  # JSONL 역방향 탐색 상한
+
+def _parse_cursor(value: Any) -> Tuple[str, int] | None:
+    """'time|id' → (time, id)"""
+    try:
+        t, i = str(value).rsplit("|", 1)
+        return t, int(i)
+    except (TypeError, ValueError):
+        return None
+
+class ActionShowRecentHistory(Action):
+    def name(self) -> Text: return "action_show_recent_history"
+
+    def run(self, dispatcher, tracker, domain) -> List[EventType]:
+        limit = _parse_limit(tracker.get_slot("filter_limit"), HISTORY_RECENT_LIMIT, HISTORY_SEARCH_MAX_LIMIT)
+        before = _parse_cursor(tracker.get_slot("history_cursor"))
+        reset = [SlotSet("history_cursor", None), SlotSet("filter_limit", None)]
+        cursor = None
+        try:
+            if AUTO_SAVE_HISTORY and HISTORY_INCREMENTAL and not before:
+                save_history_all(tracker)  # 아직 저장 안 된 직전 턴 포함
+            if SAVE_BACKEND in ("both", "sqlite"):
+                rows, cursor = history_store.recent(tracker.sender_id, limit, before)
+            else:
+                rows = recent_from_jsonl(JSONL_PATH, tracker.sender_id, limit, max_bytes=HISTORY_TAIL_MAX_BYTES,
+                                         latest_per_session=not HISTORY_INCREMENTAL)
+        except Exception as e:
+            dispatcher.utter_message(text=f"최근 대화 조회 중 오류가 발생했습니다: {e}")
+            return reset
+
+        if not rows:
+            dispatcher.utter_message(response="utter_no_recent_history")
+            return reset
+
+        lines = [f"🕘 최근 대화 {len(rows)}건 (최신순)"]
+        for r in rows:
+            t = (r.get("time") or "")[:19].replace("T", " ")
+            text = (r.get("text") or "").replace("\n", " ")
+            if len(text) > 80: text = text[:80] + "…"
+            lines.append(f"- [{t}] {'🙋' if r.get('role') == 'user' else '🤖'} {text}")
+        if cursor:
+            lines.append(f'이전 대화 더 보기: /show_history{{"history_cursor":"{cursor[0]}|{cursor[1]}"}}')
+        dispatcher.utter_message(text="\n".join(lines))
+        return reset
+
+class ActionHistorySearch(Action):
+    def name(self) -> Text: return "action_history_search"
+
+    def run(self, dispatcher, tracker, domain) -> List[EventType]:
+        keyword = (tracker.get_slot("filter_keyword") or "").strip()
+        sender = (tracker.get_slot("filter_sender_id") or "").strip()
+        date_from = (tracker.get_slot("filter_from") or "").strip()
+        date_to = (tracker.get_slot("filter_to") or "").strip()
+        limit = _parse_limit(tracker.get_slot("filter_limit"), HISTORY_SEARCH_LIMIT, HISTORY_SEARCH_MAX_LIMIT)
+        # 필터는 이번 검색에만 적용 (다음 검색으로 새지 않도록 초기화)
+        reset = [SlotSet(s, None) for s in HISTORY_SEARCH_FILTER_SLOTS]
+
+        try:
+            rows = history_store.search(keyword or None, sender or None, date_from or None, date_to or None, limit)
+        except ValueError:
+            dispatcher.utter_message(text="날짜는 YYYY-MM-DD 형식으로 입력해 주세요. (예: 2025-08-01)")
+            return reset
+        except Exception as e:
+            dispatcher.utter_message(text=f"히스토리 검색 중 오류가 발생했습니다: {e}")
+            return reset
+
+        conds = []
+        if keyword: conds.append(f"키워드 '{keyword}'")
+        if sender: conds.append(f"sender {sender}")
+        if date_from or date_to: conds.append(f"기간 {date_from or '…'} ~ {date_to or '…'}")
+        title = ", ".join(conds) or "전체"
+
+        if not rows:
+            dispatcher.utter_message(text=f"🔎 검색 결과가 없습니다. ({title})")
+            return reset
+
+        lines = [f"🔎 검색 결과 {len(rows)}건 ({title}, 최신순)"]
+        for r in rows:
+            t = (r.get("time") or "")[:19].replace("T", " ")
+            text = (r.get("text") or "").replace("\n", " ")
+            if len(text) > 80: text = text[:80] + "…"
+            lines.append(f"- [{t}] {r.get('sender_id')} ({r.get('role')}): {text}")
+        dispatcher.utter_message(text="\n".join(lines))
+        return reset
+
+
+class ActionHistoryStats(Action):
+    def name(self) -> Text: return "action_history_stats"
+
+    def run(self, dispatcher, tracker, domain) -> List[EventType]:
+        sender = (tracker.get_slot("filter_sender_id") or "").strip()
+        date_from = (tracker.get_slot("filter_from") or "").strip()
+        date_to = (tracker.get_slot("filter_to") or "").strip()
+        top_n = _parse_limit(tracker.get_slot("filter_limit"), HISTORY_STATS_TOP_N, HISTORY_SEARCH_MAX_LIMIT)
+        reset = [SlotSet(s, None) for s in HISTORY_SEARCH_FILTER_SLOTS]
+
+        try:
+            st = history_store.stats(date_from or None, date_to or None, sender or None, top_n)
+        except ValueError:
+            dispatcher.utter_message(text="날짜는 YYYY-MM-DD 형식으로 입력해 주세요. (예: 2025-08-01)")
+            return reset
+        except Exception as e:
+            dispatcher.utter_message(text=f"히스토리 집계 중 오류가 발생했습니다: {e}")
+            return reset
+
+        conds = []
+        if sender: conds.append(f"sender {sender}")
+        if date_from or date_to: conds.append(f"기간 {date_from or '…'} ~ {date_to or '…'}")
+        title = ", ".join(conds) or "전체"
+        if not st["total"]:
+            dispatcher.utter_message(text=f"📊 집계할 대화가 없습니다. ({title})")
+            return reset
+
+        fmt = lambda pairs: ", ".join(f"{k or '-'} {n:,}" for k, n in pairs) or "-"
+        lines = [
+            f"📊 대화 집계 ({title})",
+            f"- 메시지 {st['total']:,}건 / {len(st['days'])}일",
+            f"- 역할별: {fmt(st['by_role'])}",
+            f"- 인텐트 상위 {top_n}: {fmt(st['by_intent'])}",
+        ]
+        if not sender:
+            lines.append(f"- 모드별(사용자): {fmt(st['by_mode'])}")
+            lines.append(f"- KB 토픽 상위 {top_n}: {fmt(st['topics'])}")
+            lines.append(f"- KB 미적중/Gemini 처리: {fmt(st['fallthrough'])}")
+        dispatcher.utter_message(text="\n".join(lines))
+        return reset
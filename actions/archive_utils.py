@@ -0,0 +1,296 @@
+# archive_utils.py
+# 대화 로그 압축 보관: 중복 제거 + 일자/모드 파티션 + 압축 파일 + 조건 조회 (compact_logs.py에서 사용)
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (pandas.to_parquet 엔진)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+KST = timezone(timedelta(hours=9))
+
+# 보관 행 스키마 (history/event 공통)
+ARCHIVE_COLUMNS = ["date", "ts", "mode", "sender_id", "session_id", "role", "text", "intent"]
+# 중복 판정 키: history는 매 턴 전체 대화를 다시 쌓던 레코드, event는 실시간 로그 한 줄
+DEDUP_KEYS = {
+    "history": ["sender_id", "session_id", "ts", "role", "text"],
+    "event": ["sender_id", "ts", "role", "text"],
+}
+MANIFEST = "_manifest.json"
+
+# history.jsonl / history_internal.jsonl / history_gemini.jsonl
+HISTORY_FILE_RE = re.compile(r"^history(?:_(internal|gemini))?\.jsonl$")
+# chat_internal_2025-08-14.jsonl / chat_2025-08-14.jsonl / chat-20250814.jsonl
+EVENT_FILE_RE = re.compile(r"^chat(?:_(internal|gemini|unknown))?[_-](\d{4}-?\d{2}-?\d{2})\.jsonl$")
+
+
+def _norm_mode(value: Any) -> str:
+    v = (value or "").lower() if isinstance(value, str) else ""
+    if v in ("internal", "내부"):
+        return "internal"
+    if v in ("gemini", "외부"):
+        return "gemini"
+    return "unknown"
+
+
+def _event_ts(rec: Dict[str, Any]) -> str:
+    """ts_kst(KST, 오프셋 포함) 우선, 예전 로그의 UTC 'ts'는 KST로 변환"""
+    if rec.get("ts_kst"):
+        return str(rec["ts_kst"])
+    ts = rec.get("ts")
+    if not ts:
+        return ""
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", "+00:00")).astimezone(KST).isoformat()
+    except ValueError:
+        return str(ts)
+
+
+def _read_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def discover_sources(dirs: Iterable[str]) -> List[Dict[str, Any]]:
+    """로그 디렉터리에서 압축 대상 파일 목록 [{path, kind, mode, day}]"""
+    out = []
+    for d in dirs:
+        p = Path(d)
+        if not p.is_dir():
+            continue
+        for f in sorted(p.iterdir()):
+            m = HISTORY_FILE_RE.match(f.name)
+            if m:
+                out.append({"path": f, "kind": "history", "mode": m.group(1), "day": None})
+                continue
+            m = EVENT_FILE_RE.match(f.name)
+            if m:
+                day = m.group(2).replace("-", "")
+                out.append({"path": f, "kind": "event", "mode": m.group(1),
+                            "day": f"{day[:4]}-{day[4:6]}-{day[6:]}"})
+    return out
+
+
+def rows_from_source(src: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """원본 JSONL → 보관 행"""
+    if src["kind"] == "history":
+        file_mode = _norm_mode(src["mode"])
+        for rec in _read_jsonl(src["path"]):
+            for m in rec.get("history") or []:
+                ts = m.get("time") or rec.get("saved_at") or ""
+                yield {
+                    "date": ts[:10], "ts": ts, "mode": file_mode,
+                    "sender_id": rec.get("sender_id") or "", "session_id": rec.get("session_id") or "",
+                    "role": m.get("type") or "", "text": m.get("text") or "", "intent": m.get("intent") or "",
+                }
+    else:
+        for rec in _read_jsonl(src["path"]):
+            ts = _event_ts(rec)
+            mode = rec.get("mode") or (rec.get("meta") or {}).get("mode") or src["mode"]
+            yield {
+                "date": ts[:10] or (src["day"] or ""), "ts": ts, "mode": _norm_mode(mode),
+                "sender_id": rec.get("sender_id") or "", "session_id": "",
+                "role": rec.get("role") or "", "text": rec.get("text") or "", "intent": "",
+            }
+
+
+def dedupe(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """같은 이벤트가 여러 번 쌓인 행 제거 (모드가 알려진 사본 우선), 파일 안은 sender → ts 순"""
+    if df.empty:
+        return df
+    rank = df["mode"].map({"internal": 0, "gemini": 0}).fillna(1)
+    df = df.assign(_rank=rank).sort_values("_rank", kind="stable")
+    df = df.drop_duplicates(subset=DEDUP_KEYS[kind], keep="first").drop(columns="_rank")
+    return df.sort_values(["sender_id", "ts"], kind="stable").reset_index(drop=True)
+
+
+# ---------- 파일 포맷 (Parquet → zstd JSONL → gzip JSONL) ----------
+def default_format() -> str:
+    if HAS_PARQUET:
+        return "parquet"
+    return "jsonl.zst" if zstandard is not None else "jsonl.gz"
+
+
+def _write_part(df: pd.DataFrame, path: Path, fmt: str) -> Dict[str, Any]:
+    """
+    파티션 파일 쓰기 → sender별 위치 색인 {sender_id: [offset, length] | None}
+    - parquet: sender 정렬 + 행 그룹 통계로 필터 (위치 색인 없음)
+    - jsonl.*: sender마다 별도 압축 프레임(gzip member / zstd frame)으로 이어 붙임
+      → 특정 sender 조회 시 해당 프레임만 읽어 풀면 됨 (파일 전체는 여전히 표준 gzip/zstd)
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    index: Dict[str, Any] = {}
+    if fmt == "parquet":
+        df.to_parquet(tmp, compression="zstd", index=False, row_group_size=50_000)
+        index = {s: None for s in df["sender_id"].unique().tolist()}
+    else:
+        compress = (zstandard.ZstdCompressor(level=10).compress if fmt == "jsonl.zst"
+                    else lambda b: gzip.compress(b, compresslevel=6))
+        offset = 0
+        with open(tmp, "wb") as f:
+            for sender, part in df.groupby("sender_id", sort=True):
+                block = compress(part.to_json(orient="records", lines=True, force_ascii=False).encode("utf-8"))
+                f.write(block)
+                index[sender] = [offset, len(block)]
+                offset += len(block)
+    os.replace(tmp, path)
+    return index
+
+
+def _decompress(raw: bytes, name: str) -> bytes:
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard 패키지가 필요합니다: {name}")
+        # 여러 프레임이 이어진 파일이므로 스트림 리더로 끝까지
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True).read()
+    return gzip.decompress(raw)
+
+
+def _read_part(path: Path, columns: List[str] | None = None, sender_id: str | None = None,
+               index: Dict[str, Any] | None = None) -> pd.DataFrame:
+    name = path.name
+    if name.endswith(".parquet"):
+        filters = [("sender_id", "==", sender_id)] if sender_id else None
+        return pd.read_parquet(path, columns=columns, filters=filters)
+    with open(path, "rb") as f:
+        loc = (index or {}).get(sender_id) if sender_id else None
+        if loc:
+            f.seek(loc[0])
+            raw = f.read(loc[1])
+        else:
+            raw = f.read()
+    records = [json.loads(line) for line in _decompress(raw, name).splitlines() if line.strip()]
+    if sender_id and not loc:
+        records = [r for r in records if r.get("sender_id") == sender_id]
+    return pd.DataFrame.from_records(records, columns=columns or ARCHIVE_COLUMNS)
+
+
+def _part_name(fmt: str) -> str:
+    return f"part.{fmt}"
+
+
+# ---------- 매니페스트 (파일별 일자/모드/행 수/sender 색인 → 파일 단위 조건 제외) ----------
+def load_manifest(root: str | Path) -> Dict[str, Any]:
+    p = Path(root) / MANIFEST
+    if not p.exists():
+        return {"files": {}}
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(root: Path, manifest: Dict[str, Any]):
+    tmp = root / (MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, root / MANIFEST)
+
+
+# ---------- 압축 ----------
+def compact(src_dirs: Iterable[str], out_dir: str, fmt: str | None = None) -> Dict[str, Any]:
+    """
+    원본 로그 → {out_dir}/{kind}/date=YYYY-MM-DD/mode=.../part.{fmt}
+    - 같은 날짜의 기존 보관분과 합쳐 다시 중복 제거 (여러 번 돌려도 결과 동일)
+    - 원본은 건드리지 않음 (정리는 호출 측에서)
+    """
+    fmt = fmt or default_format()
+    if fmt == "parquet" and not HAS_PARQUET:
+        raise RuntimeError("parquet 저장에는 pyarrow가 필요합니다.")
+    if fmt == "jsonl.zst" and zstandard is None:
+        raise RuntimeError("jsonl.zst 저장에는 zstandard가 필요합니다.")
+
+    sources = discover_sources(src_dirs)
+    stats: Dict[str, Any] = {"format": fmt, "sources": len(sources), "source_bytes": 0,
+                             "rows_in": 0, "rows_out": 0, "archive_bytes": 0, "days": 0}
+    for kind in ("history", "event"):
+        rows = []
+        for src in (s for s in sources if s["kind"] == kind):
+            stats["source_bytes"] += src["path"].stat().st_size
+            rows.extend(rows_from_source(src))
+        if not rows:
+            continue
+        stats["rows_in"] += len(rows)
+        new = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+
+        root = Path(out_dir) / kind
+        root.mkdir(parents=True, exist_ok=True)
+        manifest = load_manifest(root)
+        files = manifest["files"]
+        for day, day_df in new.groupby("date", sort=True):
+            old_paths = [k for k, v in files.items() if v["date"] == day]
+            old = [_read_part(root / k) for k in old_paths if (root / k).exists()]
+            merged = dedupe(pd.concat([*old, day_df], ignore_index=True)[ARCHIVE_COLUMNS], kind)
+            written = set()
+            for mode, part in merged.groupby("mode", sort=True):
+                rel = f"date={day}/mode={mode}/{_part_name(fmt)}"
+                (root / rel).parent.mkdir(parents=True, exist_ok=True)
+                index = _write_part(part, root / rel, fmt)
+                files[rel] = {"date": day, "mode": mode, "rows": int(len(part)), "senders": index}
+                written.add(rel)
+            for rel in old_paths:
+                if rel not in written:
+                    (root / rel).unlink(missing_ok=True)
+                    files.pop(rel, None)
+            stats["days"] += 1
+        _save_manifest(root, manifest)
+        stats["rows_out"] += sum(v["rows"] for v in files.values())
+        stats["archive_bytes"] += sum((root / k).stat().st_size for k in files)
+    return stats
+
+
+# ---------- 조회 ----------
+def read_archive(
+    root: str,
+    kind: str = "history",
+    date_from: str | None = None,
+    date_to: str | None = None,
+    mode: str | None = None,
+    sender_id: str | None = None,
+    columns: List[str] | None = None,
+) -> pd.DataFrame:
+    """
+    보관 파일 조건 조회 (날짜 양끝 포함, YYYY-MM-DD)
+    - date/mode: 파티션 경로로 걸러 해당 파일만 열기
+    - sender_id: 매니페스트의 sender 색인으로 파일 제외 + 파일 안에서는 해당 sender 프레임만 읽기
+      (Parquet은 행 그룹 통계 필터)
+    """
+    base = Path(root) / kind
+    manifest = load_manifest(base)
+    mode = _norm_mode(mode) if mode else None
+    picked = []
+    for rel, meta in sorted(manifest["files"].items()):
+        if date_from and meta["date"] < date_from:
+            continue
+        if date_to and meta["date"] > date_to:
+            continue
+        if mode and meta["mode"] != mode:
+            continue
+        if sender_id and sender_id not in meta.get("senders", ()):
+            continue
+        picked.append((base / rel, meta.get("senders")))
+    cols = columns or ARCHIVE_COLUMNS
+    frames = [_read_part(p, cols, sender_id, index) for p, index in picked]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=cols)
+    return pd.concat(frames, ignore_index=True)
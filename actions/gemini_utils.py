@@ -0,0 +1,573 @@
+# gemini_utils.py
+import re, json, time, random, asyncio, hashlib, sqlite3, threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Tuple
+
+import aiohttp
+
+
+class GeminiHTTPError(Exception):
+    """Gemini가 2xx/3xx 이외의 상태코드를 반환"""
+
+    def __init__(self, status: int, body: str, retry_after: float | None = None):
+        super().__init__(f"Gemini API HTTP {status}")
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+class GeminiUnavailable(Exception):
+    """호출하지 않고 즉시 실패 (서킷 오픈, 대기열 초과/대기 시간 초과)"""
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def extract_text(resp_json: Dict[str, Any]) -> str:
+    """generateContent 응답에서 첫 후보의 첫 텍스트 파트 추출 (없으면 "")"""
+    if resp_json.get("candidates"):
+        parts = resp_json["candidates"][0].get("content", {}).get("parts", [])
+        if parts and parts[0].get("text"):
+            return parts[0]["text"]
+    return ""
+
+
+# =========================
+# 과부하/장애 보호 (동시성 제한, 적응형 타임아웃, 서킷 브레이커)
+# =========================
+class ConcurrencyGate:
+    """
+    동시 호출 수 제한 + 대기열 상한
+    - 대기열이 가득 차면 기다리지 않고 GeminiUnavailable (백프레셔)
+    - 세마포어는 첫 사용 시 실행 중인 루프에서 생성 (모듈 import 시점엔 루프가 없음, 루프가 바뀌면 새로)
+    """
+
+    def __init__(self, max_concurrent: int = 50, max_waiting: int = 200):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self._sem: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.admitted = 0   # 실행 중 + 대기 중
+        self.rejected = 0
+
+    def _get_sem(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+        return self._sem
+
+    @property
+    def waiting(self) -> int:
+        return max(0, self.admitted - self.max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self, timeout: float):
+        if self.admitted >= self.max_concurrent + self.max_waiting:
+            self.rejected += 1
+            raise GeminiUnavailable("queue full")
+        sem = self._get_sem()
+        self.admitted += 1
+        try:
+            try:
+                await asyncio.wait_for(sem.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise GeminiUnavailable("queue wait timeout")
+            try:
+                yield
+            finally:
+                sem.release()
+        finally:
+            self.admitted -= 1
+
+
+class AdaptiveTimeout:
+    """
+    최근 응답 시간 기반 타임아웃 (TCP RTO 방식: srtt + 4*rttvar, [min, max]로 제한)
+    - 타임아웃 발생 시 그 값을 관측치로 넣어 다음 타임아웃을 늘림
+    """
+
+    def __init__(self, min_timeout: float = 10.0, max_timeout: float = 30.0):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt: float | None = None
+        self.rttvar = 0.0
+
+    def observe(self, latency: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = latency, latency / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+            self.srtt = 0.875 * self.srtt + 0.125 * latency
+
+    def current(self) -> float:
+        if self.srtt is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+
+class CircuitBreaker:
+    """
+    연속 실패가 threshold에 도달하면 reset_timeout 동안 호출 차단(open)
+    - 이후 half-open: 시험 호출 1건만 허용, 성공하면 closed / 실패하면 다시 open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_at: float | None = None
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self.state, self._trial_at = "half_open", None
+        # half_open: 진행 중인 시험 호출이 없을 때만 (시험 호출이 응답 없이 사라진 경우 대비해 만료)
+        if self._trial_at is not None and now - self._trial_at < self.reset_timeout:
+            return False
+        self._trial_at = now
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            print("[GEMINI][CB] closed")
+        self.state, self.failures, self._trial_at = "closed", 0, None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"[GEMINI][CB] open (failures={self.failures}, reset={self.reset_timeout}s)")
+            self.state, self._opened_at, self._trial_at = "open", time.monotonic(), None
+
+
+class GeminiClient:
+    """
+    Gemini REST 호출용 공유 비동기 클라이언트
+    - 프로세스 전체에서 커넥션 풀(keep-alive) 재사용 → 호출마다 TCP/TLS 핸드셰이크 없음
+    - aiohttp는 HTTP/1.1만 지원 → HTTP/2 다중화 대신 호스트당 pool_size개 keep-alive 연결로 동시 처리
+    - 세션은 실행 중인 이벤트 루프에 묶이므로 첫 호출 시 지연 생성 (루프가 바뀌면 재생성)
+    - 동시성 제한/적응형 타임아웃/429·5xx 재시도(지터 백오프)/서킷 브레이커 적용,
+      전체 소요 시간은 deadline 이내
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = 100,
+        timeout: float = 30.0,
+        keepalive: float = 30.0,
+        stream_url: str | None = None,
+        gate: ConcurrencyGate | None = None,
+        timeouts: AdaptiveTimeout | None = None,
+        breaker: CircuitBreaker | None = None,
+        retries: int = 0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        deadline: float | None = None,
+    ):
+        self.url = url
+        self.stream_url = stream_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.gate = gate or ConcurrencyGate(pool_size, pool_size * 4)
+        self.timeouts = timeouts or AdaptiveTimeout(timeout, timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline or timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Content-Type": "application/json"},
+            )
+            self._loop = loop
+        return self._session
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        # full jitter: U(0, min(max, base * 2^attempt)), Retry-After가 있으면 그 이상
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        return max(delay, retry_after or 0.0)
+
+    async def _post(self, prompt: str, timeout: float) -> str:
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        async with self._get_session().post(self.url, json=data, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            if r.status >= 400:
+                raise GeminiHTTPError(r.status, await r.text(), _parse_retry_after(r.headers.get("Retry-After")))
+            j = await r.json(content_type=None)
+        return extract_text(j)
+
+    async def generate(self, prompt: str) -> str:
+        """
+        프롬프트 1건 생성 → 응답 텍스트 ("" 가능)
+        - HTTP 오류: GeminiHTTPError, 타임아웃: asyncio.TimeoutError,
+          서킷 오픈/대기열 초과: GeminiUnavailable
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise GeminiUnavailable("circuit open")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            async with self.gate.slot(remaining):
+                timeout = min(self.timeouts.current(), deadline - loop.time())
+                started = loop.time()
+                try:
+                    text = await self._post(prompt, timeout)
+                except GeminiHTTPError as e:
+                    if not e.retryable:
+                        self.breaker.record_success()  # 4xx는 업스트림 정상 (요청 문제)
+                        raise
+                    self.breaker.record_failure()
+                    error = e
+                except asyncio.TimeoutError:
+                    self.breaker.record_failure()
+                    self.timeouts.observe(timeout)
+                    raise
+                except aiohttp.ClientConnectionError as e:
+                    self.breaker.record_failure()
+                    error = e
+                else:
+                    self.breaker.record_success()
+                    self.timeouts.observe(loop.time() - started)
+                    return text
+
+            if attempt >= self.retries:
+                raise error
+            delay = self._backoff(attempt, getattr(error, "retry_after", None))
+            if loop.time() + delay >= deadline:
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        streamGenerateContent(SSE) 호출 → 텍스트 조각을 도착 순서대로 yield
+        - 오류 규칙은 generate()와 동일 (조각이 이미 나간 뒤라 재시도는 하지 않음)
+        - 슬롯 대기 + 스트림 전체가 deadline 하나 안에서 끝남
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        if not self.breaker.allow():
+            raise GeminiUnavailable("circuit open")
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        async with self.gate.slot(self.deadline):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                async with self._get_session().post(
+                    self.stream_url, json=data, timeout=aiohttp.ClientTimeout(total=remaining)
+                ) as r:
+                    if r.status >= 400:
+                        raise GeminiHTTPError(r.status, await r.text(), _parse_retry_after(r.headers.get("Retry-After")))
+                    async for raw in r.content:
+                        line = raw.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if not payload:
+                            continue
+                        chunk = extract_text(json.loads(payload))
+                        if chunk:
+                            yield chunk
+            except GeminiHTTPError as e:
+                if e.retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class StreamPusher:
+    """
+    스트리밍 조각을 Rasa socket.io 채널(my_socketio의 /stream 라우트)로 전달
+    - 전달 실패는 기록만 하고 무시 (클라이언트는 최종 bot_uttered 메시지로 답변을 받음)
+    """
+
+    def __init__(self, url: str, token: str | None = None, timeout: float = 5.0):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            headers = {"X-Stream-Token": self.token} if self.token else None
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout), headers=headers)
+            self._loop = loop
+        return self._session
+
+    async def push(self, recipient_id: str, stream_id: str, text: str, done: bool = False) -> bool:
+        payload = {"recipient_id": recipient_id, "stream_id": stream_id, "text": text, "done": done}
+        try:
+            async with self._get_session().post(self.url, json=payload) as r:
+                return r.status < 300
+        except Exception as e:
+            print(f"[GEMINI][STREAM] push failed: {e}")
+            return False
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# =========================
+# 응답 캐시 (LRU 메모리 + 선택적 SQLite, TTL)
+# =========================
+_WS_RE = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    """캐시 키용 정규화: 앞뒤 공백 제거, 연속 공백 1칸, 대소문자 무시"""
+    return _WS_RE.sub(" ", (text or "").strip()).casefold()
+
+
+class LRUTier:
+    """프로세스 내 LRU 캐시 (TTL + 최대 항목 수)"""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteTier:
+    """디스크 캐시 (재시작 후에도 유지, 여러 워커 프로세스 공유 가능)"""
+
+    def __init__(self, path: str, max_size: int = 100_000):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache(
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            expires_at REAL
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_expires ON answer_cache(expires_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Tuple[str, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM answer_cache WHERE key=? AND expires_at>=?", (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache(key, value, expires_at) VALUES(?,?,?)", (key, value, expires_at)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        # 만료 항목 삭제 후, 상한 초과분은 만료가 가장 이른 것부터 삭제
+        self._conn.execute("DELETE FROM answer_cache WHERE expires_at<?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM answer_cache WHERE key IN ("
+            " SELECT key FROM answer_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AnswerCache:
+    """
+    Gemini 답변 캐시: 메모리 LRU → (선택) SQLite 순으로 조회
+    - 키: 정규화된 질문 + 모드 + 프롬프트 템플릿 버전
+    - hits/misses 카운터는 stats()로 확인
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_size: int = 1000, sqlite_path: str | None = None, sqlite_max_size: int = 100_000):
+        self.ttl = ttl
+        self.memory = LRUTier(max_size)
+        self.disk = SQLiteTier(sqlite_path, sqlite_max_size) if sqlite_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(message: str, mode: str | None = None, version: str = "") -> str:
+        raw = f"{version}\x1f{mode or ''}\x1f{normalize_prompt(message)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.disk is not None:
+            try:
+                found = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"[GEMINI][CACHE] sqlite read failed: {e}")
+                found = None
+            if found is not None:
+                value, expires_at = found
+                self.memory.set(key, value, expires_at)  # 메모리 계층으로 승격
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"[GEMINI][CACHE] sqlite write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "memory_size": len(self.memory),
+        }
+
+
+# =========================
+# 동일 질문 동시 요청 병합 (single-flight)
+# =========================
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 호출은 업스트림 요청 1건을 공유
+    - 먼저 온 호출이 태스크를 만들고, 나머지는 같은 태스크 결과(또는 예외)를 받음
+    - 호출자 하나가 취소돼도 태스크는 계속 진행 (shield) → 다른 대기자에 영향 없음
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 대기자가 모두 취소된 경우 '예외 미회수' 경고 방지
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+class StreamFanout:
+    """
+    SingleFlight로 합쳐진 스트리밍 답변을 같은 키의 구독자 모두에게 중계
+    - 조각은 선두 호출(업스트림 스트림을 읽는 쪽)만 보냄 → 구독자별 순서 유지
+    - 늦게 합류한 구독자는 다음 조각 때 지금까지의 텍스트를 한 번에 받음
+    """
+
+    def __init__(self, pusher: StreamPusher):
+        self.pusher = pusher
+        self._subs: Dict[str, Dict[str, list]] = {}   # key → {stream_id: [recipient_id, 보낸 글자 수]}
+
+    def subscribe(self, key: str, recipient_id: str, stream_id: str):
+        self._subs.setdefault(key, {})[stream_id] = [recipient_id, 0]
+
+    def unsubscribe(self, key: str, stream_id: str):
+        subs = self._subs.get(key)
+        if subs is not None:
+            subs.pop(stream_id, None)
+            if not subs:
+                del self._subs[key]
+
+    async def publish(self, key: str, text: str):
+        """지금까지 받은 전체 텍스트 → 구독자마다 아직 안 보낸 부분만 전송"""
+        sends = []
+        for stream_id, sub in list(self._subs.get(key, {}).items()):
+            recipient_id, sent = sub
+            if len(text) > sent:
+                sub[1] = len(text)
+                sends.append(self.pusher.push(recipient_id, stream_id, text[sent:]))
+        if sends:
+            await asyncio.gather(*sends)
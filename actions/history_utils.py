@@ -0,0 +1,470 @@
+# history_utils.py
+import json, os, sqlite3, threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+# 대화 히스토리 SQLite 스키마 (기존 conversations/messages 구조 유지)
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS conversations(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id TEXT,
+        session_id TEXT,
+        saved_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conv_id INTEGER,
+        sender_id TEXT,   -- conversations.sender_id 비정규화 (sender별 최근 조회 인덱스용)
+        role TEXT,   -- 'user' or 'bot'
+        text TEXT,
+        intent TEXT,
+        time TEXT,
+        FOREIGN KEY(conv_id) REFERENCES conversations(id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations(session_id)",
+    # 검색/조회용 B-tree 인덱스 (sender → conv → messages, 기간 필터)
+    "CREATE INDEX IF NOT EXISTS idx_conversations_sender ON conversations(sender_id, session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_time ON messages(time)",
+    # 집계 롤업: 저장 시점에 증분 갱신 → 통계 조회 비용은 일수에 비례
+    """
+    CREATE TABLE IF NOT EXISTS stats_daily(
+        day TEXT, mode TEXT, intent TEXT, role TEXT, count INTEGER NOT NULL,
+        PRIMARY KEY(day, mode, intent, role)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_topics(
+        day TEXT, topic TEXT, count INTEGER NOT NULL,
+        PRIMARY KEY(day, topic)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stats_fallthrough(
+        day TEXT, reason TEXT, count INTEGER NOT NULL,   -- reason: gemini | kb_miss
+        PRIMARY KEY(day, reason)
+    ) WITHOUT ROWID
+    """,
+    # 증분 저장 워터마크: 세션별 마지막 저장 이벤트 시각 + 그 시점의 모드
+    """
+    CREATE TABLE IF NOT EXISTS save_watermarks(
+        session_id TEXT PRIMARY KEY,
+        last_ts REAL,
+        mode TEXT
+    )
+    """,
+]
+
+# 쓰기 경로에서 빼는 예전 스키마 (메시지당 행이 늘어 저장이 느려짐)
+_DROPPED = [
+    "DROP INDEX IF EXISTS idx_messages_conv",   # sender 조회는 idx_messages_sender_time 사용
+    "DROP TABLE IF EXISTS messages_bigram",     # 2글자 키워드는 최근 행 LIKE 스캔으로
+    "DROP TRIGGER IF EXISTS messages_fts_ai",   # FTS 색인은 save()에서 배치 단위로
+]
+
+# trigram으로 찾을 수 없는 3글자 미만 키워드는 최근 이만큼의 메시지만 LIKE로 훑음
+SHORT_KEYWORD_SCAN_ROWS = int(os.getenv("HISTORY_SHORT_KEYWORD_SCAN_ROWS", "50000"))
+
+
+class HistoryStore:
+    """
+    장수명 SQLite 히스토리 저장소
+    - 스키마는 생성 시 1회만, 커넥션은 프로세스 동안 재사용
+    - WAL 저널 + synchronous=NORMAL: 읽기와 쓰기가 서로 막지 않고 커밋당 fsync 최소화
+    - 턴 단위 저장은 executemany + 단일 트랜잭션 (워터마크 갱신도 같은 트랜잭션)
+    - FTS 색인은 행별 트리거 대신 저장 배치마다 INSERT ... SELECT 한 번으로
+    - 액션 서버 내 동시 호출은 락으로 직렬화, 다른 프로세스와는 busy_timeout으로 대기
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_ms / 1000)
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-16000")  # 약 16MB
+        with self._conn:
+            had_rollups = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='stats_daily'"
+            ).fetchone()
+            for ddl in _SCHEMA + _DROPPED:
+                self._conn.execute(ddl)
+            self._migrate_sender_column()
+            if not had_rollups:
+                # 기존 메시지 1회 집계 (모드/토픽 정보는 messages에 없으므로 unknown으로)
+                # 예전 저장 방식은 턴마다 대화 전체를 다시 넣었으므로 같은 메시지는 한 번만 셈
+                self._conn.execute(
+                    "INSERT INTO stats_daily(day, mode, intent, role, count) "
+                    "SELECT substr(t, 1, 10), 'unknown', COALESCE(intent, ''), COALESCE(role, ''), COUNT(*) FROM ("
+                    "  SELECT m.role, m.intent, COALESCE(m.time, MIN(c.saved_at)) AS t "
+                    "  FROM messages m JOIN conversations c ON c.id = m.conv_id "
+                    "  GROUP BY c.session_id, m.role, m.text, m.time, m.intent"
+                    ") GROUP BY 1, 3, 4"
+                )
+        self.fts_tokenizer = self._init_fts()
+
+    def _migrate_sender_column(self):
+        """messages.sender_id가 없던 기존 DB면 컬럼 추가 + 채움, 이후 (sender_id, time, id) 인덱스"""
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(messages)")}
+        if "sender_id" not in cols:
+            self._conn.execute("ALTER TABLE messages ADD COLUMN sender_id TEXT")
+            self._conn.execute(
+                "UPDATE messages SET sender_id = (SELECT c.sender_id FROM conversations c WHERE c.id = messages.conv_id)"
+            )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_sender_time ON messages(sender_id, time, id)"
+        )
+
+    def _init_fts(self) -> str:
+        """
+        messages.text 전문 검색 인덱스 (FTS5, external content)
+        - 추가는 save()에서 배치 단위로, 수정/삭제는 트리거로 동기화
+        - 한국어는 조사가 붙어 단어 단위 토큰화가 맞지 않으므로 trigram(부분 문자열) 우선,
+          미지원 SQLite면 unicode61
+        """
+        exists = self._conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='messages_fts'"
+        ).fetchone()
+        if exists:
+            return "trigram" if "trigram" in (exists[0] or "") else "unicode61"
+
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "CREATE VIRTUAL TABLE messages_fts USING fts5("
+                        f"text, content='messages', content_rowid='id', tokenize='{tokenizer}')"
+                    )
+                    self._conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                    END
+                    """)
+                    self._conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+                        INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                        INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+                    END
+                    """)
+                    # 기존에 쌓인 메시지 색인 (최초 1회)
+                    self._conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+                print(f"[HISTORY] FTS5 index ready (tokenizer={tokenizer})")
+                return tokenizer
+            except sqlite3.OperationalError as e:
+                print(f"[HISTORY] FTS5 tokenizer={tokenizer} unavailable: {e}")
+        return ""
+
+    def save(
+        self,
+        sender_id: str,
+        session_id: str,
+        history: List[Dict[str, Any]],
+        append: bool = False,
+        watermark: Tuple[float, str] | None = None,
+        rollup: List[Dict[str, Any]] | None = None,
+    ) -> int:
+        """
+        메시지 저장 → conv_id
+        - append=True면 세션의 기존 conversations 행에 이어 붙임
+        - watermark=(last_ts, mode)가 있으면 같은 트랜잭션에서 갱신
+        - 메시지의 mode/topic/src 주석으로 집계 롤업도 같은 트랜잭션에서 갱신
+          rollup: 집계할 메시지 (없으면 history 전체, 대화 전체를 매번 저장하는 방식이면 새 메시지만 넘김)
+        """
+        saved_at = datetime.now().isoformat()
+        with self._lock, self._conn:
+            c = self._conn.cursor()
+            row = None
+            if append:
+                row = c.execute(
+                    "SELECT id FROM conversations WHERE session_id=? ORDER BY id DESC LIMIT 1", (session_id,)
+                ).fetchone()
+            if row:
+                conv_id = row[0]
+                c.execute("UPDATE conversations SET saved_at=? WHERE id=?", (saved_at, conv_id))
+            else:
+                c.execute(
+                    "INSERT INTO conversations(sender_id, session_id, saved_at) VALUES(?,?,?)",
+                    (sender_id, session_id, saved_at),
+                )
+                conv_id = c.lastrowid
+            last_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+            c.executemany(
+                "INSERT INTO messages(conv_id, sender_id, role, text, intent, time) VALUES(?,?,?,?,?,?)",
+                [(conv_id, sender_id, m.get("type"), m.get("text"), m.get("intent"), m.get("time")) for m in history],
+            )
+            if self.fts_tokenizer:
+                c.execute("INSERT INTO messages_fts(rowid, text) SELECT id, text FROM messages WHERE id > ?", (last_id,))
+            self._update_rollups(c, history if rollup is None else rollup, saved_at[:10])
+            if watermark is not None:
+                c.execute(
+                    "INSERT OR REPLACE INTO save_watermarks(session_id, last_ts, mode) VALUES(?,?,?)",
+                    (session_id, watermark[0], watermark[1]),
+                )
+        return conv_id
+
+    @staticmethod
+    def _update_rollups(c: sqlite3.Cursor, history: List[Dict[str, Any]], default_day: str):
+        daily: Counter = Counter()
+        topics: Counter = Counter()
+        fallthrough: Counter = Counter()
+        for m in history:
+            day = (m.get("time") or default_day)[:10]
+            daily[(day, m.get("mode") or "unknown", m.get("intent") or "", m.get("type") or "")] += 1
+            if m.get("topic"):
+                topics[(day, m["topic"])] += 1
+            if m.get("src") in ("gemini", "kb_miss"):
+                fallthrough[(day, m["src"])] += 1
+        c.executemany(
+            "INSERT INTO stats_daily(day, mode, intent, role, count) VALUES(?,?,?,?,?) "
+            "ON CONFLICT(day, mode, intent, role) DO UPDATE SET count = count + excluded.count",
+            [(*k, n) for k, n in daily.items()],
+        )
+        if topics:
+            c.executemany(
+                "INSERT INTO stats_topics(day, topic, count) VALUES(?,?,?) "
+                "ON CONFLICT(day, topic) DO UPDATE SET count = count + excluded.count",
+                [(*k, n) for k, n in topics.items()],
+            )
+        if fallthrough:
+            c.executemany(
+                "INSERT INTO stats_fallthrough(day, reason, count) VALUES(?,?,?) "
+                "ON CONFLICT(day, reason) DO UPDATE SET count = count + excluded.count",
+                [(*k, n) for k, n in fallthrough.items()],
+            )
+
+    def get_watermark(self, session_id: str) -> Tuple[float, str] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_ts, mode FROM save_watermarks WHERE session_id=?", (session_id,)
+            ).fetchone()
+        return (row[0], row[1] or "unknown") if row else None
+
+    def set_watermark(self, session_id: str, last_ts: float, mode: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO save_watermarks(session_id, last_ts, mode) VALUES(?,?,?)",
+                (session_id, last_ts, mode),
+            )
+
+    def search(
+        self,
+        keyword: str | None = None,
+        sender_id: str | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        키워드 + sender + 기간(YYYY-MM-DD, 양끝 포함) 검색 → 최신순 상위 limit건
+        - 키워드는 FTS5 인덱스로 찾고, sender/기간은 B-tree 인덱스로 거름
+        - trigram이 못 찾는 3글자 미만 키워드는 최근 SHORT_KEYWORD_SCAN_ROWS건만 LIKE로 훑음
+        - 예전 방식(턴마다 대화 전체 저장)으로 반복 저장된 같은 메시지는 한 건으로
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        source = "messages m"
+        keyword = (keyword or "").strip()
+        if keyword:
+            if self.fts_tokenizer and (self.fts_tokenizer != "trigram" or len(keyword) >= 3):
+                source = "messages_fts f JOIN messages m ON m.id = f.rowid"
+                where.append("messages_fts MATCH ?")
+                params.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                if self.fts_tokenizer == "trigram":
+                    # 색인 조회 불가 → 최근 행만 (rowid 범위라 스캔 양이 DB 크기와 무관)
+                    where.append("m.id > (SELECT COALESCE(MAX(id), 0) FROM messages) - ?")
+                    params.append(SHORT_KEYWORD_SCAN_ROWS)
+                where.append("m.text LIKE ? ESCAPE '\\'")
+                params.append("%" + keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if sender_id:
+            where.append("m.sender_id = ?")
+            params.append(sender_id)
+        if date_from:
+            where.append("m.time >= ?")
+            params.append(_parse_day(date_from).isoformat())
+        if date_to:
+            where.append("m.time < ?")
+            params.append((_parse_day(date_to) + timedelta(days=1)).isoformat())
+
+        sql = (
+            "SELECT c.sender_id, c.session_id, m.role, m.text, m.intent, m.time "
+            f"FROM {source} JOIN conversations c ON c.id = m.conv_id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " GROUP BY c.session_id, m.role, m.text, m.time"
+            + " ORDER BY m.time DESC, MAX(m.id) DESC LIMIT ?"
+        )
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        keys = ("sender_id", "session_id", "role", "text", "intent", "time")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def recent(
+        self,
+        sender_id: str,
+        limit: int = 10,
+        before: Tuple[str, int] | None = None,
+    ) -> Tuple[List[Dict[str, Any]], Tuple[str, int] | None]:
+        """
+        sender의 최근 메시지 (최신순) + 다음 페이지 커서
+        - 키셋 페이지네이션: (time, id) < before 조건으로 idx_messages_sender_time만 역순 탐색
+          → OFFSET 없이 어느 페이지든 limit건만 읽음
+        """
+        sql = (
+            "SELECT id, (SELECT c.session_id FROM conversations c WHERE c.id = conv_id), role, text, intent, time "
+            "FROM messages "
+            "WHERE sender_id = ? AND time IS NOT NULL"
+        )
+        params: List[Any] = [sender_id]
+        if before:
+            sql += " AND (time, id) < (?, ?)"
+            params += [before[0], int(before[1])]
+        sql += " ORDER BY time DESC, id DESC LIMIT ?"
+        params.append(int(limit) + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        keys = ("id", "session_id", "role", "text", "intent", "time")
+        items = [dict(zip(keys, r)) for r in rows]
+        cursor = (rows[-1][5], rows[-1][0]) if more and rows else None
+        return items, cursor
+
+    def stats(
+        self,
+        date_from: str | None = None,
+        date_to: str | None = None,
+        sender_id: str | None = None,
+        top_n: int = 10,
+    ) -> Dict[str, Any]:
+        """
+        기간(YYYY-MM-DD, 양끝 포함) 집계
+        - 기본은 롤업 테이블만 조회 (일수에 비례)
+        - sender_id 지정 시 롤업에 sender 차원이 없으므로 인덱스로 해당 sender 메시지만 집계
+          (모드/토픽/폴스루는 제공하지 않음)
+        """
+        lo = _parse_day(date_from).date().isoformat() if date_from else None
+        hi = _parse_day(date_to).date().isoformat() if date_to else None
+        where, params = [], []
+        if lo:
+            where.append("day >= ?"); params.append(lo)
+        if hi:
+            where.append("day <= ?"); params.append(hi)
+        if sender_id:
+            # 롤업과 같은 모양의 행으로 만들어 이후 쿼리를 공유 (전체 재저장으로 반복된 메시지는 한 번만)
+            src = (
+                "(SELECT substr(time, 1, 10) AS day, 'unknown' AS mode, COALESCE(intent, '') AS intent, "
+                "COALESCE(role, '') AS role, 1 AS count FROM ("
+                "SELECT DISTINCT c.session_id, m.role, m.text, m.time, m.intent "
+                "FROM messages m JOIN conversations c ON c.id = m.conv_id WHERE m.sender_id = ?))"
+            )
+            params = [sender_id] + params
+        else:
+            src = "stats_daily"
+
+        def where_sql(*extra: str) -> str:
+            conds = where + list(extra)
+            return (" WHERE " + " AND ".join(conds)) if conds else ""
+
+        user_only = where_sql("role = 'user'")
+        with self._lock:
+            q = lambda sql, *extra: self._conn.execute(sql, (*params, *extra)).fetchall()
+            days = q(f"SELECT day, SUM(count) FROM {src}{where_sql()} GROUP BY day ORDER BY day")
+            by_role = q(f"SELECT role, SUM(count) FROM {src}{where_sql()} GROUP BY role ORDER BY 2 DESC")
+            by_mode = q(f"SELECT mode, SUM(count) FROM {src}{user_only} GROUP BY mode ORDER BY 2 DESC")
+            by_intent = q(
+                f"SELECT intent, SUM(count) FROM {src}{user_only} GROUP BY intent ORDER BY 2 DESC LIMIT ?",
+                top_n,
+            )
+            topics, fallthrough = [], []
+            if not sender_id:
+                topics = q(f"SELECT topic, SUM(count) FROM stats_topics{where_sql()} GROUP BY topic ORDER BY 2 DESC LIMIT ?", top_n)
+                fallthrough = q(f"SELECT reason, SUM(count) FROM stats_fallthrough{where_sql()} GROUP BY reason ORDER BY 2 DESC")
+        return {
+            "days": days,
+            "total": sum(n for _, n in days),
+            "by_role": by_role,
+            "by_mode": by_mode,
+            "by_intent": by_intent,
+            "topics": topics,
+            "fallthrough": fallthrough,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def tail_lines(path: str, block_size: int = 64 * 1024, max_bytes: int | None = None) -> Iterator[str]:
+    """
+    파일 끝에서부터 한 줄씩 역순으로 (블록 단위 seek, 메모리는 블록 + 걸친 한 줄 정도)
+    - max_bytes: 끝에서 이만큼만 읽고 멈춤 (없으면 파일 처음까지)
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        stop = max(0, pos - max_bytes) if max_bytes else 0
+        tail = b""
+        while pos > stop:
+            step = min(block_size, pos - stop)
+            pos -= step
+            f.seek(pos)
+            lines = (f.read(step) + tail).split(b"\n")
+            tail = lines.pop(0)   # 블록 앞쪽에 걸친 줄은 다음 블록과 합침
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode("utf-8", errors="replace")
+        if pos == 0 and tail.strip():
+            yield tail.decode("utf-8", errors="replace")
+
+
+def recent_from_jsonl(
+    path: str,
+    sender_id: str,
+    limit: int = 10,
+    max_bytes: int | None = None,
+    latest_per_session: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    JSONL 백엔드에서 sender의 최근 메시지 limit건 (최신순)
+    - 레코드를 끝에서부터 읽어 limit건이 모이면 중단 → 로그 크기와 무관
+    - latest_per_session: 매번 전체 대화를 저장하는 방식이면 세션당 마지막 레코드만 사용
+    """
+    if not os.path.exists(path):
+        return []
+    out: List[Dict[str, Any]] = []
+    seen_sessions = set()
+    for line in tail_lines(path, max_bytes=max_bytes):
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue
+        if rec.get("sender_id") != sender_id:
+            continue
+        session_id = rec.get("session_id")
+        if latest_per_session:
+            if session_id in seen_sessions:
+                continue
+            seen_sessions.add(session_id)
+        for m in reversed(rec.get("history") or []):
+            out.append({
+                "session_id": session_id,
+                "role": m.get("type"),
+                "text": m.get("text"),
+                "intent": m.get("intent"),
+                "time": m.get("time"),
+            })
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def _parse_day(value: str) -> datetime:
+    """'YYYY-MM-DD' → 해당 날짜 00:00 (형식이 틀리면 ValueError)"""
+    return datetime.strptime(value.strip(), "%Y-%m-%d")
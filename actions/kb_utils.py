@@ -0,0 +1,483 @@
+# kb_utils.py
+import os, re, gc, math, heapq, pickle, threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+import pandas as pd
+
+# KB 컬럼 (대소문자 무시)
+KB_COLUMNS = ("topic", "answer", "synonyms")
+
+# 스냅샷 포맷 버전 (테이블/매처 구조가 바뀌면 올려서 기존 스냅샷 무효화)
+KB_SNAPSHOT_VERSION = 3
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 다중 패턴 매처 (KB 동의어 검색용)
+    - KB 로드 시 1회 컴파일, 조회는 메시지 한 번 순회(O(len(text)))
+    - 매칭 규칙은 기존 find_topic과 동일:
+      가장 긴 키 우선, 길이가 같으면 먼저 등록된 키 우선
+    """
+
+    __slots__ = ("_goto", "_fail", "_best", "_rank", "_keys", "_values")
+
+    def __init__(self, items: Iterable[Tuple[str, str]] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[int] = [-1]     # 노드에서 끝나는(실패 링크 포함) 최우선 패턴 인덱스
+        self._rank: List[int] = []       # 패턴 우선순위 (클수록 우선)
+        self._keys: List[str] = []
+        self._values: List[str] = []
+        self._build(items)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _build(self, items: Iterable[Tuple[str, str]]):
+        goto, best = self._goto, self._best
+        for key, value in items:
+            if not key:
+                continue
+            node = 0
+            for ch in key:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    best.append(-1)
+                node = nxt
+            if best[node] == -1:
+                best[node] = len(self._keys)
+                self._keys.append(key)
+                self._values.append(value)
+
+        # 우선순위: 긴 키 우선, 길이가 같으면 먼저 등록된 키
+        n = len(self._keys)
+        rank = self._rank = [len(k) * (n + 1) + (n - i) for i, k in enumerate(self._keys)]
+
+        # BFS로 실패 링크 + 노드별 최우선 출력 계산
+        fail = self._fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            node_best = best[node]
+            fb = best[fail[node]]
+            if fb != -1 and (node_best == -1 or rank[fb] > rank[node_best]):
+                best[node] = fb
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0) if node else 0
+                queue.append(child)
+
+    def search(self, text: str) -> str:
+        """text에 포함된 키 중 최우선 키의 값을 반환 (없으면 "")"""
+        goto, fail, best, rank = self._goto, self._fail, self._best, self._rank
+        node, found, found_rank = 0, -1, -1
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            b = best[node]
+            if b != -1 and rank[b] > found_rank:
+                found, found_rank = b, rank[b]
+        return self._values[found] if found != -1 else ""
+
+
+# =========================
+# 오타/띄어쓰기 허용 검색 (자모 n-gram Dice, 단어 단위)
+# =========================
+def to_jamo(text: str) -> str:
+    """소문자화 + 공백 제거 + 한글 음절을 초/중/종성 자모로 분해"""
+    out: List[str] = []
+    for ch in (text or "").lower():
+        code = ord(ch) - 0xAC00
+        if 0 <= code < 11172:
+            lead, rest = divmod(code, 588)
+            vowel, tail = divmod(rest, 28)
+            out.append(chr(0x1100 + lead))
+            out.append(chr(0x1161 + vowel))
+            if tail:
+                out.append(chr(0x11A7 + tail))
+        elif not ch.isspace():
+            out.append(ch)
+    return "".join(out)
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = (2, 3)) -> set:
+    s = to_jamo(text)
+    return {s[i:i + n] for n in sizes for i in range(len(s) - n + 1)}
+
+
+def _words(text: str) -> List[str]:
+    return (text or "").lower().split()
+
+
+def _dice(a: frozenset, b: frozenset) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+class FuzzyIndex:
+    """
+    자모 n-gram 역색인 (KB 로드 시 1회 생성)
+    - 점수: 키의 단어마다 질문에서 가장 비슷한 구간과의 Dice 유사도 → 가중 평균 (0~1)
+      가중치 = 글자 수 × 단어 IDF ("회사"처럼 여러 키에 나오는 단어만 맞아서는 점수가 높지 않음)
+      Dice는 양쪽 n-gram을 모두 반영 → 질문 쪽에 키가 설명하지 못하는 글자가 많으면 점수가 내려감
+    - 비교 구간은 질문 단어의 앞부분(조사 허용)과 붙여 쓴 이웃 두 단어(띄어쓰기 차이)만
+      → 단어 경계를 넘나드는 부분 문자열("택시비 정산"의 "비정")로는 매칭하지 않음
+    - 여러 단어 키는 질문의 연속된 단어에 순서대로 맞아야 함 ("출근 버스 시간표" ≠ "출근 시간")
+    - 한두 글자 오타는 n-gram 겹침으로 흡수
+    """
+
+    __slots__ = ("_postings", "_keys", "_values")
+
+    def __init__(self, items: Iterable[Tuple[str, str]] = (), min_chars: int = 3):
+        self._postings: Dict[str, List[int]] = {}
+        self._keys: List[List[Tuple[int, float, frozenset]]] = []   # 키별 [(단어 글자 수, 가중치, 단어 n-gram)]
+        self._values: List[str] = []
+        key_words: List[List[str]] = []
+        df: Dict[str, int] = {}
+        for key, value in items:
+            words = _words(key)
+            if sum(len(w) for w in words) < min_chars:  # 너무 짧은 키는 오탐이 많아 제외 (정확 매칭으로만)
+                continue
+            key_words.append(words)
+            self._values.append(value)
+            for w in set(words):
+                df[w] = df.get(w, 0) + 1
+
+        n_keys = len(key_words)
+        for idx, words in enumerate(key_words):
+            parts = [(len(w), len(w) * math.log(1 + n_keys / df[w]), frozenset(char_ngrams(w))) for w in words]
+            self._keys.append(parts)
+            for g in frozenset().union(*(grams for _, _, grams in parts)):
+                self._postings.setdefault(g, []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _spans(words: List[str]) -> List[Dict[int, List[Tuple[int, frozenset]]]]:
+        """
+        질문 단어 위치별 비교 구간: {글자 수: [(차지하는 단어 수, n-gram)]}
+        - 단어의 모든 앞부분(조사 허용)과 '단어+다음 단어'의 앞부분(띄어쓰기 차이)
+        """
+        out = []
+        for i, w in enumerate(words):
+            spans: Dict[int, List[Tuple[int, frozenset]]] = {}
+            for used, s in ((1, w), (2, w + words[i + 1])) if i + 1 < len(words) else ((1, w),):
+                for n in range(1, len(s) + 1):
+                    # 이어 붙인 구간은 다음 단어까지 들어간 앞부분만 (아니면 단어 하나짜리와 같음)
+                    if used == 1 or n > len(w):
+                        spans.setdefault(n, []).append((used, frozenset(char_ngrams(s[:n]))))
+            out.append(spans)
+        return out
+
+    def _score(self, parts: List[Tuple[int, float, frozenset]], spans: list) -> float:
+        """키 단어를 질문의 연속된 위치에 차례로 맞춰 본 최고 가중 평균"""
+        total = sum(weight for _, weight, _ in parts)
+        best = 0.0
+        for start in range(len(spans)):
+            pos, weighted = start, 0.0
+            for n, weight, grams in parts:
+                if pos >= len(spans):
+                    break
+                top, used = 0.0, 1
+                for m in range(max(1, n - 1), n + 2):
+                    for u, q in spans[pos].get(m, ()):
+                        d = _dice(grams, q)
+                        if d > top:
+                            top, used = d, u
+                weighted += weight * top
+                pos += used
+            best = max(best, weighted / total)
+        return best
+
+    def search(self, text: str, k: int = 5, max_candidates: int = 50) -> List[Tuple[str, float]]:
+        """상위 k개 (값, 점수) - 같은 값(토픽)은 최고 점수 하나만"""
+        words = _words(text)
+        if not words:
+            return []
+        spans = self._spans(words)
+        # 후보: 질문과 n-gram을 많이 공유하는 키 max_candidates개만 정밀 채점
+        hits: Dict[int, int] = {}
+        postings = self._postings
+        for g in frozenset().union(*(char_ngrams(w) for w in words)):
+            for i in postings.get(g, ()):
+                hits[i] = hits.get(i, 0) + 1
+        candidates = heapq.nlargest(max_candidates, hits, key=hits.get)
+
+        best: Dict[str, float] = {}
+        for i in candidates:
+            score = self._score(self._keys[i], spans)
+            v = self._values[i]
+            if score > best.get(v, 0.0):
+                best[v] = score
+        return heapq.nlargest(k, best.items(), key=lambda kv: kv[1])
+
+
+class KBSnapshot(NamedTuple):
+    """KB 로드 결과 묶음 (교체 단위, 생성 후 수정하지 않음)"""
+    topics: Dict[str, str] = {}
+    synonyms: Dict[str, str] = {}
+    matcher: KeywordAutomaton = KeywordAutomaton()
+    fuzzy: FuzzyIndex = FuzzyIndex()
+    answers: Dict[str, str] = {}         # topic -> 정규화/링크 처리 완료된 답변 (바로 전송)
+    mtime: float = 0.0
+    stat_key: Tuple[int, int] = (0, 0)   # (mtime_ns, size)
+
+
+# =========================
+# KB 로딩 (컬럼 단위 벡터 연산 + 스냅샷)
+# =========================
+def read_kb_frames(path: str, sep: str = "\t", chunksize: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    KB 파일을 DataFrame 단위로 읽음 (topic/answer/synonyms 컬럼만, 모두 문자열)
+    - TXT/CSV는 chunksize > 0 이면 청크 단위 스트리밍
+    """
+    usecols = lambda c: str(c).lower() in KB_COLUMNS
+    ext = os.path.splitext(path)[1].lower()
+    if ext in [".xlsx", ".xls"]:
+        yield pd.read_excel(path, sheet_name="kb", usecols=usecols, dtype=str)
+        return
+
+    kwargs = {"usecols": usecols, "dtype": str}
+    if ext != ".csv":
+        kwargs["sep"] = sep
+    if chunksize and chunksize > 0:
+        yield from pd.read_csv(path, chunksize=chunksize, **kwargs)
+    else:
+        yield pd.read_csv(path, **kwargs)
+
+
+def build_kb_tables(frames: Iterable[pd.DataFrame]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    topics(topic -> answer), synonyms(lower key -> topic) 생성
+    - iterrows 대신 컬럼 단위 연산, 행 순서/덮어쓰기 규칙은 기존과 동일
+    """
+    topics: Dict[str, str] = {}
+    synonyms: Dict[str, str] = {}
+
+    for df in frames:
+        cols_lower = {str(c).lower(): c for c in df.columns}
+
+        def need(col: str) -> str:
+            if col in cols_lower:
+                return cols_lower[col]
+            raise ValueError(f"[KB] '{col}' 컬럼이 없습니다. 현재 컬럼: {list(df.columns)}")
+
+        tcol = need("topic")
+        acol = need("answer")
+        scol = cols_lower.get("synonyms")
+
+        df = df.reset_index(drop=True)
+        topic = df[tcol].fillna("").str.strip()
+        keep = topic != ""
+        topic = topic[keep]
+        answer = df[acol][keep].fillna("").str.strip()
+        topics.update(zip(topic.tolist(), answer.tolist()))
+
+        # 행마다 [topic, 동의어...] 순서로 키를 나열 (stable 정렬로 행 순서 유지)
+        keys = [topic.str.lower()]
+        if scol:
+            phrases = df[scol][keep].dropna().str.split(",").explode().str.strip()
+            keys.append(phrases[phrases != ""].str.lower())
+        keys = pd.concat(keys).sort_index(kind="stable")
+        synonyms.update(zip(keys.tolist(), topic.loc[keys.index].tolist()))
+
+    return topics, synonyms
+
+
+def _snapshot_key(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, KB_SNAPSHOT_VERSION)
+
+
+def load_kb_snapshot(path: str, snapshot_path: str):
+    """스냅샷이 KB 파일(mtime+size)과 일치하면 (topics, synonyms, matcher, fuzzy), 아니면 None"""
+    if not os.path.exists(snapshot_path):
+        return None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # 대량 객체 역직렬화 시 GC 순회 비용 제거
+    try:
+        with open(snapshot_path, "rb") as f:
+            snap = pickle.load(f)
+        if snap.get("key") != _snapshot_key(path):
+            return None
+        return snap["topics"], snap["synonyms"], snap["matcher"], snap["fuzzy"]
+    except Exception as e:
+        print(f"[KB] 스냅샷 로드 실패(무시): {e}")
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def save_kb_snapshot(path: str, snapshot_path: str, topics: Dict[str, str], synonyms: Dict[str, str],
+                     matcher: KeywordAutomaton, fuzzy: FuzzyIndex):
+    """스냅샷 저장 (임시 파일에 쓰고 교체 → 읽는 쪽이 깨진 파일을 보지 않음)"""
+    tmp = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        snap = {"key": _snapshot_key(path), "topics": topics, "synonyms": synonyms, "matcher": matcher, "fuzzy": fuzzy}
+        with open(tmp, "wb") as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot_path)
+    except Exception as e:
+        print(f"[KB] 스냅샷 저장 실패(무시): {e}")
+        try: os.remove(tmp)
+        except OSError: pass
+
+
+def load_kb(path: str, sep: str = "\t", chunksize: int = 0, snapshot_path: str | None = None):
+    """
+    KB 로드 → (topics, synonyms, matcher, fuzzy)
+    - snapshot_path가 있으면 스냅샷 우선, 없거나 낡았으면 파싱 후 스냅샷 갱신
+    """
+    if snapshot_path:
+        snap = load_kb_snapshot(path, snapshot_path)
+        if snap is not None:
+            return snap
+
+    topics, synonyms = build_kb_tables(read_kb_frames(path, sep=sep, chunksize=chunksize))
+    matcher = KeywordAutomaton(synonyms.items())
+    fuzzy = FuzzyIndex(synonyms.items())
+
+    if snapshot_path:
+        save_kb_snapshot(path, snapshot_path, topics, synonyms, matcher, fuzzy)
+    return topics, synonyms, matcher, fuzzy
+
+
+# ---------- 질의/답변 유틸 (액션 서버와 app.py 공용) ----------
+TIME_TRIGGERS = ["현재 시간", "지금 몇시", "몇시", "오늘 날짜", "날짜", "오늘"]
+TIME_TRIGGER_RE = re.compile("|".join(re.escape(t.lower()) for t in TIME_TRIGGERS))
+
+def is_time_question(msg: str) -> bool:
+    return TIME_TRIGGER_RE.search((msg or "").lower()) is not None
+
+URL_RE = re.compile(r"\b(https?://[^\s<>'\"]+)", re.IGNORECASE)
+ANCHOR_RE = re.compile(r"<a[^>]*href=['\"]([^'\">]+)['\"][^>]*>.*?</a>", re.IGNORECASE | re.DOTALL)
+def clean_and_linkify(text: str) -> str:
+    if not text: return text
+    s = text.replace("https//", "https://").replace("http//", "http://")
+    s = ANCHOR_RE.sub(r"\1", s)
+    return URL_RE.sub(r"<a href='\1' target='_blank'>\1</a>", s)
+
+
+class KBCache:
+    """
+    KB 캐시: 파싱 결과를 불변 스냅샷(KBSnapshot)으로 보관
+    - 요청 경로는 스냅샷 참조 1회만 읽음 (stat/재파싱 없음)
+    - 파일 변경 감지/재파싱은 백그라운드 스레드가 하고, 완성된 스냅샷으로 통째로 교체
+    - 액션 서버(actions.py)와 app.py 내부 모드 빠른 경로가 같은 구현을 사용
+    """
+    def __init__(
+        self,
+        path: str,
+        reload_interval: float = 0.0,
+        sep: str = "\t",
+        chunksize: int = 0,
+        snapshot_path: str | None = None,
+        fuzzy: bool = False,
+        fuzzy_threshold: float = 0.8,
+        render: Callable[[str], str] | None = None,
+    ):
+        self.path = path
+        self.sep = sep
+        self.chunksize = chunksize
+        self.snapshot_path = snapshot_path
+        self.fuzzy = fuzzy
+        self.fuzzy_threshold = fuzzy_threshold
+        self.render = render or clean_and_linkify
+        self._snap = KBSnapshot()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self._load(force=True)
+        if reload_interval > 0:
+            self.start_watcher(reload_interval)
+
+    # 기존 속성 호환 (항상 현재 스냅샷 기준)
+    @property
+    def topics(self) -> Dict[str, str]: return self._snap.topics
+    @property
+    def synonyms(self) -> Dict[str, str]: return self._snap.synonyms
+    @property
+    def mtime(self) -> float: return self._snap.mtime
+
+    def _load(self, force: bool = False):
+        with self._reload_lock:
+            if not os.path.exists(self.path):
+                if force:
+                    print(f"[KB] 파일이 없습니다: {self.path}")
+                return
+
+            st = os.stat(self.path)
+            if (st.st_mtime_ns, st.st_size) == self._snap.stat_key and not force:
+                return
+
+            topics, synonyms, matcher, fuzzy = load_kb(
+                self.path,
+                sep=self.sep,
+                chunksize=self.chunksize,
+                snapshot_path=self.snapshot_path,
+            )
+            # 완성된 스냅샷으로 참조만 교체 (읽는 쪽은 이전/새 스냅샷 중 하나만 봄)
+            # 답변은 재로딩 사이 불변 → 정규화/링크 처리를 로드 시 1회만
+            answers = {t: self.render(a.strip()) for t, a in topics.items() if a and a.strip()}
+            self._snap = KBSnapshot(
+                topics=topics, synonyms=synonyms, matcher=matcher, fuzzy=fuzzy, answers=answers,
+                mtime=st.st_mtime, stat_key=(st.st_mtime_ns, st.st_size),
+            )
+            print(f"[KB] 로드 완료: {self.path} (rows={len(topics)})")
+
+    def maybe_reload(self):
+        """변경 여부를 즉시 확인하고 필요 시 재로딩 (동기)"""
+        self._load()
+
+    def start_watcher(self, interval: float):
+        """백그라운드 stat 폴링으로 KB 변경 감시"""
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def _watch():
+            while not self._stop.wait(interval):
+                try:
+                    self._load()
+                except Exception as e:
+                    # 파싱 실패 시 기존 스냅샷 유지
+                    print(f"[KB] 재로딩 실패(기존 KB 유지): {e}")
+
+        self._watcher = threading.Thread(target=_watch, name="kb-reloader", daemon=True)
+        self._watcher.start()
+        print(f"[KB] 백그라운드 재로딩 시작: interval={interval}s")
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def find_topic(self, user_text: str) -> str:
+        snap = self._snap
+        topic = snap.matcher.search((user_text or "").lower())
+        if topic or not self.fuzzy:
+            return topic
+        cands = snap.fuzzy.search(user_text, k=1)
+        if cands and cands[0][1] >= self.fuzzy_threshold:
+            return cands[0][0]
+        return ""
+
+    def find_candidates(self, user_text: str, k: int = 5) -> List[Tuple[str, float]]:
+        """오타 허용 검색 상위 k개 (토픽, 점수)"""
+        return self._snap.fuzzy.search(user_text, k=k)
+
+    def get_answer(self, topic: str) -> str:
+        return self._snap.topics.get(topic, "")
+
+    def get_rendered_answer(self, topic: str) -> str:
+        """전송용 답변 (strip + render 적용 완료, 비어 있으면 "")"""
+        return self._snap.answers.get(topic, "")
@@ -1,5 +1,5 @@
 # log_utils.py
-import os, json, datetime, threading, re
+import os, json, datetime, threading, re, queue, atexit, time
 from pathlib import Path
 
 _LOCK = threading.Lock()
@@ -26,12 +26,21 @@ class ConversationLogger:
         fixed_path: str | None = None,
         split_by_mode: bool = False,
         filename_template: str = "chat{mode_suffix}_{date}.jsonl",
+        write_behind: bool = False,
+        queue_size: int = 10000,
+        flush_interval: float = 1.0,
+        batch_size: int = 256,
+        put_timeout: float = 0.05,
     ):
         """
         - base_dir: 기본 로그 디렉터리
         - fixed_path: 이 파일에만 계속 쓰기 (우선순위 최상)
         - split_by_mode: True면 모드별 파일 분리 저장 (chat_internal_YYYY-MM-DD.jsonl 등)
         - filename_template: 파일명 템플릿. {date}, {mode_suffix} 사용 가능
+        - write_behind: True면 log()는 큐에 넣기만 하고 전용 스레드가 파일에 기록
+          (queue_size: 큐 상한 / flush_interval초 또는 batch_size건마다 flush)
+          큐가 가득 차면 put_timeout초까지만 기다린 뒤 호출 스레드에서 writer와 같은 핸들로 직접 기록
+          → 로그는 버리지 않음 (sync_writes 카운트, 직접 기록까지 실패하면 dropped), stats()로 확인
         """
         self.base_dir = os.path.abspath(base_dir or os.getenv("CHAT_LOG_DIR", "./logs"))
         _ensure_dir(self.base_dir)
@@ -50,7 +59,23 @@ class ConversationLogger:
         self.split_by_mode = split_by_mode
         self.filename_template = filename_template
 
-        print(f"[ConversationLogger] base_dir={self.base_dir} path={self.path} fixed={self._fixed} split_by_mode={self.split_by_mode}")
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue | None = None
+        self._writer: threading.Thread | None = None
+        self._handles: dict = {}             # path -> 열린 파일 핸들 ((모드, 날짜)별 1개), _io_lock으로 보호
+        self._io_lock = threading.Lock()     # writer 스레드와 큐 초과 시 직접 기록이 공유
+        self.sync_writes = 0   # 큐가 가득 차서 호출 스레드가 직접 기록한 로그 수
+        self.dropped = 0       # 기록 자체가 실패한 로그 수
+        if write_behind:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._write_loop, name="conversation-logger", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+        print(f"[ConversationLogger] base_dir={self.base_dir} path={self.path} fixed={self._fixed} split_by_mode={self.split_by_mode} write_behind={self.write_behind}")
 
     def _path_for(self, mode: str | None) -> str:
         # 날짜 회전은 KST 기준
@@ -91,8 +116,6 @@ class ConversationLogger:
             return
 
         path = self._path_for(mode)
-        _ensure_dir(Path(path).parent)
-
         now = datetime.datetime.now(KST_TZ)
         entry = {
             "ts_kst": now.isoformat(timespec="seconds"),            # 예: 2025-08-14T17:12:34+09:00
@@ -105,9 +128,119 @@ class ConversationLogger:
         }
 
         line = json.dumps(entry, ensure_ascii=False)
+        if self._queue is not None and self._writer is not None and self._writer.is_alive():
+            try:
+                self._queue.put((path, line), timeout=self.put_timeout)
+                return
+            except queue.Full:
+                pass
+            # 큐 초과: writer 핸들로 직접 기록 (아직 큐에 있는 이전 로그보다 먼저 기록될 수 있음, 순서는 ts_kst로)
+            with self._io_lock:
+                ok = self._write_handle(path, line)
+                self.sync_writes += 1
+                if not ok:
+                    self.dropped += 1
+            if self.sync_writes == 1 or self.sync_writes % 1000 == 0:
+                print(f"[ConversationLogger][WARN] queue full, writing on caller thread: {self.stats()}")
+            return
+        self._write_sync(path, line)
+
+    def stats(self) -> dict:
+        """write-behind 상태 (대기 중 로그 수, 직접 기록 수, 실패 수)"""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sync_writes": self.sync_writes,
+            "dropped": self.dropped,
+        }
+
+    def _write_sync(self, path: str, line: str):
+        _ensure_dir(Path(path).parent)
         with _LOCK:
             try:
                 with open(path, "a", encoding="utf-8") as f:
                     f.write(line + "\n")
             except Exception as e:
                 print(f"[ConversationLogger][ERROR] write failed: {e} (path={path})")
+
+    # ---------- write-behind 전용 스레드 ----------
+    def _write_handle(self, path: str, line: str) -> bool:
+        """열린 핸들(없으면 열기)에 한 줄 기록 (_io_lock 안에서 호출)"""
+        f = self._handles.get(path)
+        if f is None:
+            try:
+                _ensure_dir(Path(path).parent)
+                f = self._handles[path] = open(path, "a", encoding="utf-8")
+            except Exception as e:
+                print(f"[ConversationLogger][ERROR] open failed: {e} (path={path})")
+                return False
+        try:
+            f.write(line + "\n")
+            return True
+        except Exception as e:
+            print(f"[ConversationLogger][ERROR] write failed: {e} (path={path})")
+            return False
+
+    def _write_loop(self):
+        handles = self._handles
+        day = _today_str_kst()
+        pending = 0
+        last_flush = time.monotonic()
+        stop = False
+
+        def flush_all():
+            for f in handles.values():
+                try: f.flush()
+                except Exception as e: print(f"[ConversationLogger][ERROR] flush failed: {e}")
+
+        def close_all():
+            flush_all()
+            for f in handles.values():
+                try: f.close()
+                except Exception: pass
+            handles.clear()
+
+        while not stop:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            items = []
+            try:
+                items.append(self._queue.get(timeout=timeout))
+                # 쌓여 있는 것은 한 번에 꺼내서 묶어 쓰기
+                while len(items) < self.batch_size:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            with self._io_lock:
+                for item in items:
+                    if item is None:  # 종료 신호
+                        stop = True
+                        continue
+                    if self._write_handle(*item):
+                        pending += 1
+                    else:
+                        self.dropped += 1
+
+                if stop or pending >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    flush_all()
+                    pending, last_flush = 0, time.monotonic()
+                    # KST 자정이 지나면 이전 날짜 파일 핸들 정리 (새 날짜 파일은 다음 기록 때 열림)
+                    today = _today_str_kst()
+                    if today != day:
+                        close_all()
+                        day = today
+
+        with self._io_lock:
+            close_all()
+
+    def close(self, timeout: float = 5.0):
+        """남은 로그를 모두 기록하고 writer 스레드 종료"""
+        if self._queue is None or self._writer is None or not self._writer.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print("[ConversationLogger][WARN] close: queue still full, writer not stopped")
+            return
+        self._writer.join(max(0.0, deadline - time.monotonic()))
+        if self.sync_writes or self.dropped:
+            print(f"[ConversationLogger] closed: {self.stats()}")
@@ -0,0 +1,91 @@
+# mask_utils.py
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# 기본 패턴 (이름, 정규식, 치환 문자열, 트리거)
+# - 등록 순서가 곧 같은 위치에서의 우선순위
+# - 트리거: 매치에 반드시 들어가는 문자 클래스 내용 (예: "@", r"\d"). 모든 패턴에 트리거가 있으면
+#   트리거 문자가 하나도 없는 텍스트는 정규식 없이 그대로 반환
+DEFAULT_PATTERNS: List[Tuple[str, str, str, str | None]] = [
+    ("EMAIL", r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+", "[EMAIL]", "@"),
+    ("PHONE", r"\b01[016789]-?\d{3,4}-?\d{4}\b|\b\d{2,3}-\d{3,4}-\d{4}\b", "[PHONE]", r"\d"),
+    ("RRN", r"\b\d{6}-\d{7}\b", "[RRN]", r"\d"),
+]
+
+# 선택 패턴 (MASK_EXTRA=CARD 처럼 이름으로 켬)
+OPTIONAL_PATTERNS: Dict[str, Tuple[str, str, str | None]] = {
+    "CARD": (r"\b\d{4}-?\d{4}-?\d{4}-?\d{4}\b", "[CARD]", r"\d"),
+}
+
+
+class PIIMasker:
+    """
+    개인정보 마스킹 엔진
+    - 모든 패턴을 이름 있는 그룹의 단일 alternation으로 합쳐 텍스트를 한 번만 훑음
+      (같은 위치에서는 먼저 등록된 패턴 우선)
+    - 트리거 문자 게이트: 숫자/@ 하나 없는 대부분의 메시지는 alternation 자체를 건너뜀
+    - register()로 패턴 추가 (카드번호, 사번 등). 패턴 안에는 이름 있는 그룹을 쓰지 않음
+    - 결과는 텍스트 단위 LRU로 메모 → 같은 이벤트를 다시 저장해도 재검사하지 않음
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str, str, str | None]] = DEFAULT_PATTERNS, cache_size: int = 10000):
+        self._patterns: List[Tuple[str, str, str, str | None]] = list(patterns)
+        self._cache_size = cache_size
+        self._compile()
+
+    def register(self, name: str, pattern: str, replacement: str | None = None, trigger: str | None = None):
+        """패턴 추가 (같은 이름이면 교체). trigger가 없으면 게이트를 끄고 모든 텍스트를 검사"""
+        re.compile(pattern)  # 잘못된 정규식은 여기서 바로 오류
+        if trigger:
+            re.compile(f"[{trigger}]")
+        self._patterns = [p for p in self._patterns if p[0] != name]
+        self._patterns.append((name, pattern, replacement or f"[{name}]", trigger))
+        self._compile()
+
+    @property
+    def names(self) -> List[str]:
+        return [p[0] for p in self._patterns]
+
+    def _compile(self):
+        self._replacements = {f"p{i}": p[2] for i, p in enumerate(self._patterns)}
+        self._regex = re.compile("|".join(f"(?P<p{i}>{p[1]})" for i, p in enumerate(self._patterns)))
+        triggers = [p[3] for p in self._patterns]
+        self._gate = re.compile("[" + "".join(dict.fromkeys(triggers)) + "]") if all(triggers) else None
+        self.mask = lru_cache(maxsize=self._cache_size)(self._mask)
+
+    def _mask(self, text: str) -> str:
+        if not text:
+            return text
+        if self._gate is not None and not self._gate.search(text):
+            return text
+        reps = self._replacements
+        return self._regex.sub(lambda m: reps[m.lastgroup], text)
+
+    def cache_info(self):
+        return self.mask.cache_info()
+
+
+def build_masker(extra: str = "", extra_patterns_json: str = "", cache_size: int = 10000) -> PIIMasker:
+    """
+    환경설정으로 마스커 생성
+    - extra: 켤 선택 패턴 이름 (쉼표 구분, 예: "CARD")
+    - extra_patterns_json: 사용자 패턴 JSON 목록
+      예: [{"name": "EMPNO", "pattern": "\\bE\\d{6}\\b", "replacement": "[사번]", "trigger": "\\d"}]
+    """
+    masker = PIIMasker(cache_size=cache_size)
+    for name in (n.strip().upper() for n in (extra or "").split(",")):
+        if not name:
+            continue
+        if name not in OPTIONAL_PATTERNS:
+            print(f"[MASK] unknown optional pattern: {name}")
+            continue
+        masker.register(name, *OPTIONAL_PATTERNS[name])
+    if extra_patterns_json:
+        try:
+            for p in json.loads(extra_patterns_json):
+                masker.register(p["name"], p["pattern"], p.get("replacement"), p.get("trigger"))
+        except (ValueError, KeyError, TypeError, re.error) as e:
+            print(f"[MASK] invalid MASK_PATTERNS: {e}")
+    return masker
@@ -0,0 +1,169 @@
+# pdf_utils.py
+# 대용량 PDF 맵-리듀스 요약: 로컬에서 페이지 구간별 텍스트 추출 → 구간 요약(동시 실행 상한) → 최종 요약
+# - 모델 호출/캐시는 콜백으로 받음 (actions.py가 g_model, SummaryCache 연결)
+# - 구간 요약은 끝나는 대로 캐시 → 재시도 시 실패한 구간만 다시 요약
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+HAS_PDF_TEXT = PdfReader is not None
+
+
+class PdfChunk(NamedTuple):
+    first_page: int   # 1부터
+    last_page: int
+    text: str
+
+
+class ChunkFailures(Exception):
+    """일부 구간 요약 실패 (성공한 구간은 이미 캐시에 있음)"""
+
+    def __init__(self, failed: List[Tuple[PdfChunk, BaseException]], total: int):
+        self.failed = failed
+        self.total = total
+        ranges = ", ".join(f"p{c.first_page}-{c.last_page}" for c, _ in failed[:5])
+        super().__init__(f"{len(failed)}/{total}개 구간 요약 실패 ({ranges}): {failed[0][1]}")
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, first: int = 1, last: int | None = None) -> List[str]:
+    """first~last쪽(1부터, 포함) 텍스트 목록 - 구간별로 나눠 여러 프로세스에서 동시에 추출 가능"""
+    reader = PdfReader(path)
+    last = len(reader.pages) if last is None else min(last, len(reader.pages))
+    texts = []
+    for no in range(first, last + 1):
+        try:
+            texts.append((reader.pages[no - 1].extract_text() or "").strip())
+        except Exception as e:  # 깨진 페이지 하나 때문에 전체를 버리지 않음
+            print(f"[PDF] page {no} extract failed: {e}")
+            texts.append("")
+    return texts
+
+
+def chunk_pages(texts: Iterable[str], pages_per_chunk: int = 20, max_chars: int = 30000) -> Iterator[PdfChunk]:
+    """
+    페이지 텍스트를 순서대로 받아 구간 단위로 묶음
+    - 구간은 pages_per_chunk 페이지 또는 max_chars 글자 중 먼저 닿는 쪽에서 끊음
+    - 같은 파일 + 같은 설정이면 항상 같은 구간 → 구간 캐시 키로 사용 가능
+    """
+    parts: List[str] = []
+    size, first, no = 0, 1, 0
+    for no, text in enumerate(texts, start=1):
+        if parts and (no - first >= pages_per_chunk or size + len(text) > max_chars):
+            yield PdfChunk(first, no - 1, "\n\n".join(parts))
+            parts, size, first = [], 0, no
+        text = text[:max_chars]
+        parts.append(text)
+        size += len(text)
+    if parts:
+        yield PdfChunk(first, no, "\n\n".join(parts))
+
+
+def iter_chunks(path: str, pages_per_chunk: int = 20, max_chars: int = 30000) -> Iterator[PdfChunk]:
+    """한 프로세스에서 페이지를 순서대로 읽으며 구간 반환 (파일 전체 텍스트를 메모리에 올리지 않음)"""
+    reader = PdfReader(path)
+
+    def texts() -> Iterator[str]:
+        for no, page in enumerate(reader.pages, start=1):
+            try:
+                yield (page.extract_text() or "").strip()
+            except Exception as e:
+                print(f"[PDF] page {no} extract failed: {e}")
+                yield ""
+
+    return chunk_pages(texts(), pages_per_chunk, max_chars)
+
+
+def map_reduce(
+    chunks: Iterator[PdfChunk],
+    summarize_chunk: Callable[[PdfChunk], str],
+    reduce_summaries: Callable[[List[str], bool], str],
+    workers: int = 4,
+    get_cached: Callable[[PdfChunk], str | None] | None = None,
+    set_cached: Callable[[PdfChunk, str], None] | None = None,
+    progress: Callable[[int, int], None] | None = None,
+    total_pages: int = 0,
+    reduce_chars: int = 60000,
+) -> str:
+    """
+    chunks를 추출하는 동안 이미 나온 구간은 워커 풀에서 요약 (추출과 모델 호출이 겹침)
+    - 동시 요약은 workers개까지 (추출이 앞서가도 대기 구간은 workers*2개로 제한)
+    - progress(끝난 페이지 수, 전체 페이지 수): 구간이 끝날 때마다 호출
+    - 일부 구간이 실패하면 나머지는 끝까지 요약/캐시한 뒤 ChunkFailures
+    - reduce_summaries(요약 목록, 최종 여부): 구간 요약을 합친 길이가 reduce_chars를 넘으면
+      묶음별 중간 요약(최종=False)을 거쳐 최종 요약(최종=True)
+    """
+    results: Dict[int, str] = {}
+    order: List[PdfChunk] = []
+    failed: List[Tuple[PdfChunk, BaseException]] = []
+    pending: Dict[Future, PdfChunk] = {}
+    done_pages = 0
+
+    def finish(chunk: PdfChunk, summary: str):
+        nonlocal done_pages
+        results[chunk.first_page] = summary
+        done_pages += chunk.last_page - chunk.first_page + 1
+        if progress:
+            progress(done_pages, total_pages)
+
+    def collect(block: bool):
+        if not pending:
+            return
+        done, _ = wait(list(pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for fut in done:
+            chunk = pending.pop(fut)
+            try:
+                summary = fut.result()
+            except Exception as e:
+                failed.append((chunk, e))
+                continue
+            if set_cached and summary:
+                try: set_cached(chunk, summary)
+                except Exception as e: print(f"[PDF] chunk cache write failed: {e}")
+            finish(chunk, summary)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pdf-map") as pool:
+        for chunk in chunks:
+            order.append(chunk)
+            cached = get_cached(chunk) if get_cached else None
+            if cached is not None:
+                finish(chunk, cached)
+                continue
+            if not chunk.text.strip():   # 텍스트 없는 구간(이미지 페이지 등)은 호출 생략
+                finish(chunk, "")
+                continue
+            while len(pending) >= max(1, workers) * 2:
+                collect(block=True)
+            pending[pool.submit(summarize_chunk, chunk)] = chunk
+            collect(block=False)
+        while pending:
+            collect(block=True)
+
+    if failed:
+        raise ChunkFailures(sorted(failed, key=lambda f: f[0].first_page), len(order))
+
+    summaries = [
+        f"[p{c.first_page}-{c.last_page}]\n{results[c.first_page]}" for c in order if results.get(c.first_page)
+    ]
+    # 구간이 너무 많으면 묶음 단위 중간 요약 (트리 리듀스)
+    while len(summaries) > 1 and sum(len(s) for s in summaries) > reduce_chars:
+        groups, group, size = [], [], 0
+        for s in summaries:
+            if group and size + len(s) > reduce_chars:
+                groups.append(group)
+                group, size = [], 0
+            group.append(s)
+            size += len(s)
+        groups.append(group)
+        if len(groups) == len(summaries):   # 더 묶을 수 없으면 그대로 최종 단계로
+            break
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="pdf-reduce") as pool:
+            summaries = list(pool.map(lambda g: reduce_summaries(g, False), groups))
+    return reduce_summaries(summaries, True) if summaries else ""
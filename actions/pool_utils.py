@@ -0,0 +1,102 @@
+# pool_utils.py
+# CPU 작업(파일 파싱/프로파일/PDF 텍스트 추출)용 프로세스 풀
+# - 액션 서버 이벤트 루프/GIL과 분리 → 큰 파일을 처리하는 동안에도 다른 대화 응답 지연 없음
+# - 작업별 타임아웃, 호출 취소 시 작업도 중단 (실행 중이면 워커 프로세스 종료 후 풀 재생성)
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, List, Tuple
+
+
+class JobTimeout(Exception):
+    """프로세스 풀 작업이 제한 시간 안에 끝나지 않음"""
+
+
+class ProcessJobPool:
+    """
+    ProcessPoolExecutor 래퍼 (첫 작업 때 생성)
+    - spawn 방식: 액션 서버의 스레드/커넥션 상태를 자식에 복제하지 않음
+    - 실행 중인 작업은 개별 취소가 안 되므로, 타임아웃/취소 시 워커를 모두 종료하고 풀을 새로 만듦
+      그 풀에서 함께 돌던 다른 작업은 새 풀에서 한 번 재시도
+    - max_tasks_per_child: 워커를 주기적으로 교체 (큰 파일 처리 후 메모리 반환, Python 3.11+)
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 120.0, max_tasks_per_child: int | None = None):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._generation = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.restarts = 0
+
+    def _get_pool(self) -> Tuple[ProcessPoolExecutor, int]:
+        with self._lock:
+            if self._pool is None:
+                kwargs = {"max_tasks_per_child": self.max_tasks_per_child} if self.max_tasks_per_child else {}
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), **kwargs
+                )
+            return self._pool, self._generation
+
+    def _abort(self, generation: int, fut: Future):
+        if fut.cancel():   # 아직 대기열에 있던 작업이면 빼기만
+            return
+        with self._lock:
+            if generation != self._generation or self._pool is None:
+                return     # 다른 작업이 이미 풀을 재시작함
+            pool, self._pool = self._pool, None
+            self._generation += 1
+            self.restarts += 1
+        for proc in list((getattr(pool, "_processes", None) or {}).values()):
+            proc.terminate()
+        # 대기 중이던 작업은 BrokenProcessPool로 끝남 → run()에서 새 풀로 재시도
+        pool.shutdown(wait=False)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: float | None = None) -> Any:
+        """fn(*args)를 워커 프로세스에서 실행 (fn/인자/결과는 pickle 가능해야 함)"""
+        limit = self.timeout if timeout is None else timeout
+        for attempt in range(2):
+            pool, generation = self._get_pool()
+            fut = pool.submit(fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(fut), limit)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._abort(generation, fut)
+                raise JobTimeout(f"{getattr(fn, '__name__', fn)}: {limit:.0f}초 초과") from None
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                self._abort(generation, fut)
+                raise
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                with self._lock:   # 워커가 죽은 풀은 버리고 새로 만듦
+                    if generation == self._generation:
+                        self._pool = None
+                        self._generation += 1
+
+    async def map(self, fn: Callable[..., Any], arg_list: Iterable[tuple], timeout: float | None = None) -> List[Any]:
+        """여러 작업을 동시에 실행, 하나라도 실패/취소되면 나머지도 취소"""
+        tasks = [asyncio.ensure_future(self.run(fn, *args, timeout=timeout)) for args in arg_list]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "timeouts": self.timeouts, "cancelled": self.cancelled, "restarts": self.restarts}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
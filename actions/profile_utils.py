@@ -0,0 +1,268 @@
+# profile_utils.py
+# 대용량 CSV/Excel 스트리밍 프로파일러: 청크 단위로 읽으며 병합 가능한 통계만 유지 → 파일 크기와 무관한 메모리
+# - 수치: 개수/평균/표준편차(Welford-Chan 병합), 최소/최대, 근사 분위수(bottom-k 균등 표본)
+# - 문자: 근사 고유값 수(KMV), 상위 빈도(청크별 상위 카운터 병합)
+# - 출력은 기존 df.describe(include="all")와 같은 행 구성 (요약 프롬프트 그대로 사용)
+import math
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+DESCRIBE_ROWS = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+NUMERIC_RATIO = 0.9   # 값의 90% 이상이 숫자로 읽히면 수치 컬럼
+
+
+class TopK:
+    """
+    상위 빈도 요약: 카운터 capacity개만 유지 (청크별 value_counts 상위 → 병합 → 다시 상위)
+    - 빈도가 전체/capacity 이상인 값은 놓치지 않음, 빈도는 하한 근사
+    """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+
+    def update(self, counts: pd.Series):
+        if len(counts) > self.capacity:
+            counts = counts.nlargest(self.capacity)
+        merged = self.counts
+        for value, n in counts.items():
+            merged[value] = merged.get(value, 0) + int(n)
+        if len(merged) > 2 * self.capacity:   # 매번 정렬하지 않도록 2배까지 두었다가 줄임
+            self.counts = dict(sorted(merged.items(), key=lambda kv: kv[1], reverse=True)[: self.capacity])
+
+    def top(self, k: int = 1) -> List[tuple]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+class DistinctCount:
+    """KMV 근사 고유값 수: 해시 최소 k개 유지 (k개 미만이면 정확)"""
+
+    def __init__(self, k: int = 1024):
+        self.k = k
+        self.mins = np.empty(0, dtype=np.uint64)
+
+    def update(self, values: pd.Series):
+        hashed = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        merged = np.unique(np.concatenate([self.mins, hashed]))
+        self.mins = merged[: self.k]
+
+    @property
+    def exact(self) -> bool:
+        return len(self.mins) < self.k
+
+    def estimate(self, upper: int | None = None) -> int:
+        """upper: 추정치 상한 (값 개수보다 클 수 없음, KMV 오차로 넘는 경우 잘라냄)"""
+        if self.exact:
+            return len(self.mins)
+        est = int((self.k - 1) / (float(self.mins[-1]) / 2.0 ** 64))
+        return max(len(self.mins), min(est, upper)) if upper is not None else est
+
+
+class NumericStats:
+    """평균/분산은 청크별로 구해 Chan 공식으로 병합, 분위수는 bottom-k 균등 표본"""
+
+    def __init__(self, sample_size: int = 10000, seed: int = 0):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sample_size = sample_size
+        self._rng = np.random.default_rng(seed)
+        self._keys = np.empty(0)
+        self._sample = np.empty(0)
+
+    def update(self, x: np.ndarray):
+        if not len(x):
+            return
+        n_b, mean_b = len(x), float(x.mean())
+        m2_b = float(((x - mean_b) ** 2).sum())
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+        # 값마다 난수 키 → 키가 작은 sample_size개 유지 (전체에서 균등 비복원 표본)
+        keys = np.concatenate([self._keys, self._rng.random(n_b)])
+        values = np.concatenate([self._sample, x])
+        if len(keys) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[: self.sample_size]
+            keys, values = keys[keep], values[keep]
+        self._keys, self._sample = keys, values
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float("nan")
+
+    def quantiles(self, qs=(0.25, 0.5, 0.75)) -> List[float]:
+        if not len(self._sample):
+            return [float("nan")] * len(qs)
+        return [float(v) for v in np.quantile(self._sample, qs)]
+
+
+def _coerce_numeric(values: pd.Series, probe: int = 100) -> np.ndarray:
+    """문자/혼합 컬럼: 앞부분 표본이 대부분 숫자일 때만 전체 변환 (텍스트 컬럼의 변환 비용 생략)"""
+    head = pd.to_numeric(values.iloc[:probe], errors="coerce")
+    if head.notna().mean() < 0.5:
+        return np.empty(0)
+    return pd.to_numeric(values, errors="coerce").dropna().to_numpy(dtype=float)
+
+
+class ColumnProfile:
+    def __init__(self, name: str, top_capacity: int = 200, sample_size: int = 10000):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.numeric = NumericStats(sample_size)
+        self.top = TopK(top_capacity)
+        self.distinct = DistinctCount()
+        self.is_datetime = False   # 값은 ns 단위 숫자로 누적, 출력할 때 시각으로 변환
+
+    def update(self, s: pd.Series):
+        values = s.dropna()
+        self.nulls += len(s) - len(values)
+        self.count += len(values)
+        if not len(values):
+            return
+        if pd.api.types.is_datetime64_any_dtype(values):
+            self.is_datetime = True
+            values = values.dt.tz_localize(None) if values.dt.tz is not None else values
+            nums = values.astype("datetime64[ns]").astype("int64").to_numpy(dtype=float)
+            self.numeric.update(nums)
+            return
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            # 숫자로 읽힌 청크: describe처럼 수치 통계만 (빈도/고유값 계산 생략)
+            nums = values.to_numpy(dtype=float)
+            self.numeric.update(nums[np.isfinite(nums)])
+            return
+        nums = _coerce_numeric(values)
+        self.numeric.update(nums[np.isfinite(nums)])
+        self.top.update(values.value_counts(sort=False))
+        self.distinct.update(values)
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.count > 0 and self.numeric.n >= NUMERIC_RATIO * self.count
+
+    def describe(self) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"count": self.count}
+        if self.is_numeric:
+            q25, q50, q75 = self.numeric.quantiles()
+            stats = {"mean": self.numeric.mean, "std": self.numeric.std, "min": self.numeric.min,
+                     "25%": q25, "50%": q50, "75%": q75, "max": self.numeric.max}
+            if self.is_datetime:
+                stats = {k: (pd.Timestamp(int(v)) if k != "std" else None) for k, v in stats.items()}
+            row.update(stats)
+            return row
+        unique = self.distinct.estimate(upper=self.count)
+        row["unique"] = unique if self.distinct.exact else f"~{unique:,}"   # 근사값은 ~ 표시
+        top = self.top.top(1)
+        if top:
+            row["top"], row["freq"] = str(top[0][0]), top[0][1]
+        return row
+
+
+class StreamingProfile:
+    """
+    청크(DataFrame)를 차례로 받아 컬럼별 통계를 누적
+    - 메모리: 컬럼 수 × (표본 sample_size + 카운터 top_capacity + 해시 1024) 로 고정
+    - head_rows: 프롬프트 미리보기용 앞부분만 보관
+    """
+
+    def __init__(self, head_rows: int = 30, top_capacity: int = 200, sample_size: int = 10000):
+        self.head_rows = head_rows
+        self.top_capacity = top_capacity
+        self.sample_size = sample_size
+        self.rows = 0
+        self.head: pd.DataFrame | None = None
+        self.columns: Dict[str, ColumnProfile] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        if self.head is None or len(self.head) < self.head_rows:
+            need = self.head_rows - (0 if self.head is None else len(self.head))
+            part = chunk.head(need)
+            self.head = part.copy() if self.head is None else pd.concat([self.head, part])
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            key = str(col)
+            prof = self.columns.get(key)
+            if prof is None:
+                prof = self.columns[key] = ColumnProfile(key, self.top_capacity, self.sample_size)
+            prof.update(chunk[col])
+
+    def head_markdown(self) -> str:
+        return (self.head if self.head is not None else pd.DataFrame()).to_markdown(index=False)
+
+    def describe(self) -> pd.DataFrame:
+        data = {name: prof.describe() for name, prof in self.columns.items()}
+        return pd.DataFrame(data, index=DESCRIBE_ROWS)
+
+    def stats_markdown(self) -> str:
+        return f"rows={self.rows:,} (unique의 ~는 근사값, 분위수/top도 근사값)\n" + self.describe().to_markdown()
+
+
+def iter_csv(path: str, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    # dtype은 청크마다 추론 (같은 컬럼이 청크에 따라 문자로 읽혀도 ColumnProfile이 숫자로 변환)
+    yield from pd.read_csv(path, chunksize=chunk_rows, encoding_errors="replace")
+
+
+def iter_xlsx(path: str, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    """openpyxl 읽기 전용 모드로 첫 시트를 행 단위로 읽어 청크 DataFrame으로 묶음"""
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        batch: List[tuple] = []
+
+        def frame() -> pd.DataFrame:
+            # 읽기 전용 모드는 행마다 길이가 다를 수 있음 → 헤더 폭에 맞춰 채움
+            width = len(columns)
+            return pd.DataFrame([r + (None,) * (width - len(r)) for r in batch], columns=columns)
+
+        for row in rows:
+            if len(row) > len(columns):
+                columns.extend(f"Unnamed: {i}" for i in range(len(columns), len(row)))
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield frame()
+                batch = []
+        if batch:
+            yield frame()
+    finally:
+        wb.close()
+
+
+def iter_table(path: str, kind: str, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    """kind: csv | xlsx | xls. 옛 .xls(openpyxl 미지원)는 pandas로 한 번에 읽음"""
+    if kind == "csv":
+        return iter_csv(path, chunk_rows)
+    if kind == "xlsx" and load_workbook is not None:
+        return iter_xlsx(path, chunk_rows)
+    return iter([pd.read_excel(path)])
+
+
+def profile_table(path: str, kind: str, chunk_rows: int = 50000, head_rows: int = 30,
+                  top_capacity: int = 200, sample_size: int = 10000) -> StreamingProfile:
+    prof = StreamingProfile(head_rows=head_rows, top_capacity=top_capacity, sample_size=sample_size)
+    for chunk in iter_table(path, kind, chunk_rows):
+        prof.update(chunk)
+    return prof
+
+
+def profile_markdown(path: str, kind: str, chunk_rows: int = 50000, head_rows: int = 30,
+                     top_capacity: int = 200, sample_size: int = 10000) -> Tuple[str, str]:
+    """프롬프트용 (미리보기, 통계) 마크다운 - 프로세스 풀 작업 단위 (결과만 작은 문자열로 반환)"""
+    prof = profile_table(path, kind, chunk_rows, head_rows, top_capacity, sample_size)
+    return prof.head_markdown(), prof.stats_markdown()
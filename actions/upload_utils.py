@@ -0,0 +1,216 @@
+# upload_utils.py
+# 업로드 파일 내용 주소 저장소 + 요약 캐시
+# - /upload: 디스크에 쓰면서 sha256 계산 → uploads/<sha[:2]>/<sha><ext> (같은 내용은 한 번만 저장)
+# - 요약 액션: (sha256, mime, 프롬프트 버전)으로 요약 캐시 조회, PDF 원격 파일 URI는 만료 전까지 재사용
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Dict, NamedTuple, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+SHA256_NAME_RE = re.compile(r"^([0-9a-f]{64})(?:\.[A-Za-z0-9]+)?$")
+
+
+class StoredFile(NamedTuple):
+    sha256: str
+    path: str
+    size: int
+    existed: bool   # 같은 내용이 이미 저장돼 있었는지
+
+
+def _safe_ext(filename: str) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+
+class StoreWriter:
+    """
+    청크를 받는 대로 임시 파일에 쓰면서 해시 → commit()으로 <store_dir>/<sha[:2]>/<sha><ext>에 확정
+    - read()할 스트림이 없는 경우(비동기 게이트웨이의 multipart 스트리밍)에 사용, 실패 시 abort()
+    """
+
+    def __init__(self, store_dir: str):
+        os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = store_dir
+        self.size = 0
+        self._hash = hashlib.sha256()
+        fd, self._tmp = tempfile.mkstemp(dir=store_dir, prefix=".upload-")
+        self._out = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._out.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, filename: str = "") -> StoredFile:
+        """같은 내용이 이미 있으면 임시 파일만 지우고 기존 경로 반환"""
+        try:
+            self._out.close()
+            sha = self._hash.hexdigest()
+            final_dir = os.path.join(self.store_dir, sha[:2])
+            os.makedirs(final_dir, exist_ok=True)
+            final = os.path.join(final_dir, sha + _safe_ext(filename))
+            if os.path.exists(final):
+                os.unlink(self._tmp)
+                return StoredFile(sha, final, self.size, True)
+            os.replace(self._tmp, final)
+            return StoredFile(sha, final, self.size, False)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self._out.close()
+        if os.path.exists(self._tmp):
+            os.unlink(self._tmp)
+
+
+def store_stream(stream: BinaryIO, store_dir: str, filename: str = "", chunk_size: int = CHUNK_SIZE) -> StoredFile:
+    """
+    스트림을 임시 파일에 쓰면서 해시 → <store_dir>/<sha[:2]>/<sha><ext>로 원자적 이동
+    - 파일을 한 번만 읽음 (저장 후 다시 읽어 해시하지 않음)
+    - 같은 내용이 이미 있으면 임시 파일만 지우고 기존 경로 반환
+    """
+    writer = StoreWriter(store_dir)
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(filename)
+
+
+def file_sha256(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """저장소 경로면 파일명에서, 아니면 내용을 읽어 sha256"""
+    m = SHA256_NAME_RE.match(os.path.basename(path))
+    if m:
+        return m.group(1)
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class SummaryCache:
+    """
+    파일 요약 캐시 (SQLite, 재시작/여러 워커 공유)
+    - file_summaries: (sha256, mime, prompt_version) → 요약 텍스트
+      프롬프트 문구를 바꾸면 버전을 올려서 기존 요약 무효화
+    - remote_files: (sha256, mime) → 업로드된 원격 파일 URI + 만료 시각
+    - chunk_summaries: (sha256, 페이지 구간, 프롬프트 버전) → 대용량 PDF 구간 요약
+    """
+
+    def __init__(self, path: str, remote_margin: float = 600.0):
+        self.path = path
+        self.remote_margin = remote_margin    # 만료까지 이 시간(초)보다 적게 남은 URI는 재사용하지 않음
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.remote_hits = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+        CREATE TABLE IF NOT EXISTS file_summaries(
+            sha256 TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (sha256, mime, prompt_version)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS remote_files(
+            sha256 TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            uri TEXT NOT NULL,
+            name TEXT,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (sha256, mime)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS chunk_summaries(
+            sha256 TEXT NOT NULL,
+            first_page INTEGER NOT NULL,
+            last_page INTEGER NOT NULL,
+            prompt_version TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (sha256, first_page, last_page, prompt_version)
+        ) WITHOUT ROWID;
+        """)
+        self._conn.commit()
+
+    def get_summary(self, sha256: str, mime: str, version: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM file_summaries WHERE sha256=? AND mime=? AND prompt_version=?",
+                (sha256, mime, version),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def set_summary(self, sha256: str, mime: str, version: str, summary: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_summaries(sha256, mime, prompt_version, summary, created_at) VALUES(?,?,?,?,?)",
+                (sha256, mime, version, summary, time.time()),
+            )
+            self._conn.commit()
+
+    def get_chunk(self, sha256: str, first_page: int, last_page: int, version: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM chunk_summaries WHERE sha256=? AND first_page=? AND last_page=? AND prompt_version=?",
+                (sha256, first_page, last_page, version),
+            ).fetchone()
+            return row[0] if row else None
+
+    def set_chunk(self, sha256: str, first_page: int, last_page: int, version: str, summary: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_summaries(sha256, first_page, last_page, prompt_version, summary) VALUES(?,?,?,?,?)",
+                (sha256, first_page, last_page, version, summary),
+            )
+            self._conn.commit()
+
+    def get_remote(self, sha256: str, mime: str) -> Tuple[str, str | None] | None:
+        """아직 유효한 원격 파일 (uri, name)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uri, name FROM remote_files WHERE sha256=? AND mime=? AND expires_at>?",
+                (sha256, mime, time.time() + self.remote_margin),
+            ).fetchone()
+            if row:
+                self.remote_hits += 1
+            return (row[0], row[1]) if row else None
+
+    def set_remote(self, sha256: str, mime: str, uri: str, name: str | None, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO remote_files(sha256, mime, uri, name, expires_at) VALUES(?,?,?,?,?)",
+                (sha256, mime, uri, name, expires_at),
+            )
+            self._conn.execute("DELETE FROM remote_files WHERE expires_at<?", (time.time(),))
+            self._conn.commit()
+
+    def drop_remote(self, sha256: str, mime: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM remote_files WHERE sha256=? AND mime=?", (sha256, mime))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "remote_hits": self.remote_hits}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
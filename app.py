@@ -1,5 +1,6 @@
 # app.py
-import os, json, re
+import os, json, re, time, threading, uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from pathlib import Path
 from flask import Flask, send_from_directory, request, jsonify
 from werkzeug.utils import secure_filename
@@ -7,14 +8,32 @@ import requests
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from actions.upload_utils import store_stream
+
 app = Flask(__name__)
 
 # ── 설정 ─────────────────────────────────────────────
-RASA_URL   = "http://localhost:5005"
+RASA_URL   = os.getenv("RASA_URL", "http://localhost:5005")
 SENDER_ID  = "local-user"
 UPLOAD_DIR = "uploads"
 LOG_DIR    = "logs"
 KST        = ZoneInfo("Asia/Seoul")
+
+# 내부 모드 빠른 경로: KB에 걸리는 질문은 Rasa를 거치지 않고 여기서 바로 답변
+FASTPATH_INTERNAL = os.getenv("FASTPATH_INTERNAL", "false").lower() in ("1", "true", "yes")
+KB_PATH           = os.getenv("KB_PATH", "kb.txt")
+KB_SEP            = os.getenv("KB_SEP", "\t")
+KB_SNAPSHOT_PATH  = os.getenv("KB_SNAPSHOT_PATH", f"{KB_PATH}.snapshot.pkl")
+KB_FUZZY          = os.getenv("KB_FUZZY", "false").lower() in ("1", "true", "yes")   # 액션 서버와 같은 값으로
+KB_FUZZY_THRESHOLD = float(os.getenv("KB_FUZZY_THRESHOLD", "0.8"))
+KB_RELOAD_INTERVAL = float(os.getenv("KB_RELOAD_INTERVAL", "2.0"))
+
+# 업로드 작업 큐
+UPLOAD_JOB_MAX_PENDING = int(os.getenv("UPLOAD_JOB_MAX_PENDING", "100"))   # 대기+실행 작업 상한 (초과 시 503)
+UPLOAD_JOB_TTL         = float(os.getenv("UPLOAD_JOB_TTL", "3600"))         # 끝난 작업 보관(초)
+UPLOAD_SUMMARY_TIMEOUT = float(os.getenv("UPLOAD_SUMMARY_TIMEOUT", "300"))  # 요약 요청 타임아웃(초), 백그라운드라 길게
+JOB_PUSH_URL           = os.getenv("JOB_PUSH_URL", f"{RASA_URL}/webhooks/socketio/job")
+STREAM_PUSH_TOKEN      = os.getenv("STREAM_PUSH_TOKEN")   # my_socketio와 같은 값 (선택)
 # ────────────────────────────────────────────────────
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -70,6 +89,121 @@ def log_event(event: dict):
     with open(_log_path_for_today(), "a", encoding="utf-8") as f:
         f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
+# ── Rasa 응답 정리 (app_async.py와 공용) ────────────
+def send_replies(raw) -> list:
+    """/send 응답: 모드 전환/시스템 메시지 제거 + KST 주입 + 로그"""
+    if isinstance(raw, list):
+        filtered = [m for m in raw if isinstance(m, dict) and not is_mode_change(m)]
+    elif isinstance(raw, dict):
+        filtered = [] if is_mode_change(raw) else [raw]
+    else:
+        filtered = []
+
+    msgs = []
+    for m in filtered:
+        enriched = ensure_kst_fields(m if isinstance(m, dict) else {"text": str(m)})
+        msgs.append(enriched)
+        log_event({**enriched, "role": "bot"})
+    return msgs
+
+def upload_replies(raw) -> tuple:
+    """/upload 응답: (텍스트 목록, KST 포함 메시지 목록) + 로그"""
+    replies, replies_rich = [], []
+    for m in raw or []:
+        if not isinstance(m, dict) or is_mode_change(m):
+            continue
+        if "text" in m:
+            replies.append(m["text"])
+            rich = ensure_kst_fields({"text": m["text"], "role": "bot", "meta": m.get("meta", {})})
+            replies_rich.append(rich)
+            log_event({**rich, "sender_id": SENDER_ID})
+    return replies, replies_rich
+
+# ── 내부 모드 빠른 경로 ─────────────────────────────
+# - 액션 서버와 같은 KBCache(actions/kb_utils.py)로 매칭 → 같은 질문에 같은 답변
+# - 적중 시 응답은 즉시, 대화 기록은 Rasa 트래커에 이벤트로 뒤따라 추가 (히스토리 저장은 액션 서버가 기존대로)
+# - 미적중/시간 질문/명령은 기존처럼 Rasa로 전달
+fast_kb = None
+if FASTPATH_INTERNAL:
+    try:
+        from actions.kb_utils import KBCache, is_time_question
+        fast_kb = KBCache(
+            KB_PATH, reload_interval=KB_RELOAD_INTERVAL, sep=KB_SEP, snapshot_path=KB_SNAPSHOT_PATH,
+            fuzzy=KB_FUZZY, fuzzy_threshold=KB_FUZZY_THRESHOLD,
+        )
+    except Exception as e:
+        print(f"[FASTPATH] 비활성화 (KB 로드 실패): {e}")
+
+_client_mode: dict = {}        # sender → 클라이언트가 마지막으로 보낸 모드
+_pending_set_mode: dict = {}   # sender → 아직 Rasa에 전달하지 않은 /set_mode 원문
+_tracker_writer = ThreadPoolExecutor(max_workers=1)   # 트래커 이벤트는 순서대로 1개씩
+_last_tracker_write = None
+
+def _parse_set_mode(text: str) -> str:
+    try:
+        return (json.loads(text[len("/set_mode"):] or "{}").get("mode") or "").lower()
+    except ValueError:
+        return ""
+
+def _append_tracker_events(sender: str, events: list):
+    try:
+        r = requests.post(f"{RASA_URL}/conversations/{sender}/tracker/events", json=events, timeout=10)
+        if r.status_code >= 300:
+            print(f"[FASTPATH] 트래커 기록 실패: {r.status_code} {r.text[:200]}")
+    except requests.exceptions.RequestException as e:
+        print(f"[FASTPATH] 트래커 기록 예외: {e}")
+
+def _wait_tracker_writes(timeout: float = 5.0):
+    """Rasa로 보내기 전에 앞선 빠른 경로 기록이 끝나도록 (이벤트 순서 유지)"""
+    if _last_tracker_write is not None:
+        try: _last_tracker_write.result(timeout=timeout)
+        except Exception as e: print(f"[FASTPATH] 트래커 기록 대기 실패: {e}")
+
+def flush_pending_set_mode(sender: str):
+    """보류 중인 /set_mode를 Rasa에 먼저 전달 (Rasa로 가는 요청 직전에 호출), 실패 시 RuntimeError"""
+    _wait_tracker_writes()
+    pending = _pending_set_mode.pop(sender, None)
+    if not pending:
+        return
+    try:
+        r = requests.post(f"{RASA_URL}/webhooks/rest/webhook", json={"sender": sender, "message": pending}, timeout=60)
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(f"Rasa 요청 예외: {e}")
+    if not r.ok:
+        raise RuntimeError(f"Rasa 응답 실패: {r.text}")
+
+def try_fastpath(sender: str, text: str):
+    """내부 모드 KB 적중이면 응답 메시지 목록, 아니면 None"""
+    global _last_tracker_write
+    if fast_kb is None or _client_mode.get(sender) != "internal":
+        return None
+    if text.startswith("/") or is_time_question(text):
+        return None
+    topic = fast_kb.find_topic(text)
+    answer = fast_kb.get_rendered_answer(topic) if topic else ""
+    if not answer:
+        return None
+
+    now = time.time()
+    events = []
+    pending = _pending_set_mode.pop(sender, None)
+    if pending:
+        events.append({"event": "user", "text": pending, "timestamp": now - 0.002,
+                       "parse_data": {"intent": {"name": "set_mode", "confidence": 1.0},
+                                      "entities": [{"entity": "mode", "value": "internal"}]}})
+    events += [
+        {"event": "slot", "name": "mode", "value": "internal", "timestamp": now - 0.001},
+        {"event": "user", "text": text, "timestamp": now,
+         "parse_data": {"intent": {"name": "ask_anything", "confidence": 1.0}, "entities": [], "text": text},
+         "metadata": {"fastpath": True, "topic": topic}},   # 토픽: 액션 서버 히스토리 집계(stats_topics)용
+        {"event": "bot", "text": answer, "timestamp": now + 0.001, "metadata": {"fastpath": True, "topic": topic}},
+    ]
+    _last_tracker_write = _tracker_writer.submit(_append_tracker_events, sender, events)
+
+    msg = ensure_kst_fields({"recipient_id": sender, "text": answer})
+    log_event({**msg, "role": "bot", "mode": "internal", "meta": {"fastpath": True, "topic": topic}})
+    return [msg]
+
 # ── 정적 파일 ────────────────────────────────────────
 @app.route("/")
 def serve_index():
@@ -79,24 +213,37 @@ def serve_index():
 def serve_file(path):
     return send_from_directory(".", path)
 
-# ── 업로드 ───────────────────────────────────────────
-@app.route("/upload", methods=["POST"])
-def upload():
-    if "file" not in request.files:
-        return jsonify({"ok": False, "msg": "file 필드가 없습니다."}), 400
-    f = request.files["file"]
-    if f.filename == "":
-        return jsonify({"ok": False, "msg": "파일명이 비어있습니다."}), 400
+# ── 업로드 작업 큐 ───────────────────────────────────
+# - /upload는 파일 저장 후 작업 ID만 바로 반환 (202), 트리거 + 요약은 백그라운드 워커가 처리
+# - 결과는 GET /jobs/<id> 폴링, 또는 socket.io(Rasa my_socketio /job 중계)로 완료 알림
+# - 업로드는 모두 같은 SENDER_ID 대화로 트리거되므로 워커 1개가 순서대로 처리 (슬롯/트래커가 섞이지 않도록)
+_upload_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-job")
+_jobs: dict = {}               # job_id → 작업 상태
+_jobs_lock = threading.Lock()
 
-    filename = secure_filename(f.filename)
-    save_path = os.path.join(UPLOAD_DIR, filename)
-    try:
-        f.save(save_path)
-    except Exception as e:
-        return jsonify({"ok": False, "msg": f"파일 저장 실패: {e}"}), 500
+def _job_view(job: dict) -> dict:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
 
-    mime = f.mimetype or "application/octet-stream"
+def _update_job(job_id: str, **fields) -> dict:
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job.update(fields, updated_at=now_kst_iso())
+        return _job_view(job)
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _job_view(job) if job else None
 
+def _prune_jobs():
+    """끝난 지 UPLOAD_JOB_TTL초 지난 작업 정리"""
+    cutoff = time.time() - UPLOAD_JOB_TTL
+    with _jobs_lock:
+        for job_id in [k for k, j in _jobs.items() if j["status"] in ("done", "error") and j["_finished"] < cutoff]:
+            del _jobs[job_id]
+
+def _summarize_upload(save_path: str, mime: str) -> tuple:
+    """file_uploaded 트리거 + 요약 실행 → (replies, replies_rich), 실패 시 RuntimeError(사용자 메시지)"""
     # 1) 인텐트 트리거
     try:
         trigger_payload = {
@@ -111,40 +258,126 @@ def upload():
             json=trigger_payload, timeout=30,
         )
         if r.status_code >= 300:
-            return jsonify({"ok": False, "msg": f"Rasa trigger 실패: {r.text}"}), 500
+            raise RuntimeError(f"Rasa trigger 실패: {r.text}")
     except requests.exceptions.RequestException as e:
-        return jsonify({"ok": False, "msg": f"Rasa trigger 예외: {e}"}), 500
+        raise RuntimeError(f"Rasa trigger 예외: {e}")
 
     # 2) 요약 실행
     try:
         msg_payload = {"sender": SENDER_ID, "message": "/file_uploaded"}
-        r2 = requests.post(f"{RASA_URL}/webhooks/rest/webhook", json=msg_payload, timeout=90)
+        r2 = requests.post(f"{RASA_URL}/webhooks/rest/webhook", json=msg_payload, timeout=UPLOAD_SUMMARY_TIMEOUT)
         if not r2.ok:
-            return jsonify({"ok": False, "msg": f"Rasa 응답 실패: {r2.text}"}), 500
-
-        replies, replies_rich = [], []
-        for m in r2.json():
-            if not isinstance(m, dict) or is_mode_change(m):
-                continue
-            if "text" in m:
-                replies.append(m["text"])
-                rich = ensure_kst_fields({"text": m["text"], "role": "bot", "meta": m.get("meta", {})})
-                replies_rich.append(rich)
-                log_event({**rich, "sender_id": SENDER_ID})
-
-        return jsonify({"ok": True, "path": save_path, "mime": mime,
-                        "replies": replies, "replies_rich": replies_rich})
+            raise RuntimeError(f"Rasa 응답 실패: {r2.text}")
+        return upload_replies(r2.json())
     except requests.exceptions.RequestException as e:
-        return jsonify({"ok": False, "msg": f"Rasa 요청 예외: {e}"}), 500
+        raise RuntimeError(f"Rasa 요청 예외: {e}")
+
+def _push_job(socket_id: str, job: dict):
+    """완료 알림 (실패해도 클라이언트는 /jobs 폴링으로 결과를 받음)"""
+    if not socket_id:
+        return
+    headers = {"X-Stream-Token": STREAM_PUSH_TOKEN} if STREAM_PUSH_TOKEN else None
+    try:
+        requests.post(JOB_PUSH_URL, json={"recipient_id": socket_id, "job": job}, headers=headers, timeout=5)
+    except requests.exceptions.RequestException as e:
+        print(f"[UPLOAD] job push 실패: {e}")
+
+def _run_upload_job(job_id: str, sender: str, save_path: str, mime: str, socket_id: str):
+    _update_job(job_id, status="running")
+    try:
+        # 빠른 경로에서 보류된 모드 전환을 먼저 반영해야 요약도 현재 모드로 실행됨
+        flush_pending_set_mode(sender)
+        replies, replies_rich = _summarize_upload(save_path, mime)
+        view = finish_upload_job(job_id, replies, replies_rich)
+    except Exception as e:
+        view = finish_upload_job(job_id, error=str(e))
+    _push_job(socket_id, view)
+
+def create_upload_job(stored, filename: str, mime: str):
+    """작업 상태만 등록 (실행은 호출한 게이트웨이가) → 작업 상태, 대기 작업이 가득 차면 None"""
+    _prune_jobs()
+    with _jobs_lock:
+        active = sum(1 for j in _jobs.values() if j["status"] in ("queued", "running"))
+        if active >= UPLOAD_JOB_MAX_PENDING:
+            return None
+        job_id = uuid.uuid4().hex
+        now = now_kst_iso()
+        _jobs[job_id] = {
+            "job_id": job_id, "status": "queued", "path": stored.path, "mime": mime, "filename": filename,
+            "sha256": stored.sha256, "duplicate": stored.existed, "created_at": now, "updated_at": now,
+            "replies": [], "replies_rich": [], "msg": "", "_finished": 0.0,
+        }
+    return get_job(job_id)
+
+def finish_upload_job(job_id: str, replies=None, replies_rich=None, error: str = "") -> dict:
+    if error:
+        return _update_job(job_id, status="error", msg=error, _finished=time.time())
+    return _update_job(job_id, status="done", replies=replies, replies_rich=replies_rich, _finished=time.time())
+
+def submit_upload_job(stored, filename: str, mime: str, socket_id: str = ""):
+    """작업 등록 + 워커 스레드에서 실행 → (작업 상태, Future). 대기 작업이 가득 차면 (None, None)"""
+    job = create_upload_job(stored, filename, mime)
+    if job is None:
+        return None, None
+    fut = _upload_jobs.submit(_run_upload_job, job["job_id"], SENDER_ID, stored.path, mime, socket_id)
+    return job, fut
+
+def job_response(job: dict) -> dict:
+    """작업 결과를 기존 동기 /upload 응답 형태로 (ok + replies)"""
+    return {"ok": job["status"] == "done", **job}
+
+# ── 업로드 ───────────────────────────────────────────
+@app.route("/upload", methods=["POST"])
+def upload():
+    """
+    파일 저장 후 작업 ID 반환 (202): {"ok": true, "job_id": "...", "status": "queued", ...}
+    - socket_id(폼 필드): socket.io 연결 ID를 주면 완료 시 upload_job 이벤트로 알림
+    - ?wait=1: 예전처럼 요약이 끝날 때까지 기다렸다가 결과 반환
+    """
+    if "file" not in request.files:
+        return jsonify({"ok": False, "msg": "file 필드가 없습니다."}), 400
+    f = request.files["file"]
+    if f.filename == "":
+        return jsonify({"ok": False, "msg": "파일명이 비어있습니다."}), 400
+
+    # 내용 주소 저장: 쓰면서 sha256 계산, 같은 파일은 한 번만 저장 (요약 캐시 키)
+    filename = secure_filename(f.filename)
+    try:
+        stored = store_stream(f.stream, UPLOAD_DIR, filename)
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"파일 저장 실패: {e}"}), 500
+
+    mime = f.mimetype or "application/octet-stream"
+    job, fut = submit_upload_job(stored, filename, mime, request.form.get("socket_id", ""))
+    if job is None:
+        return jsonify({"ok": False, "msg": "처리 대기 중인 업로드가 많습니다. 잠시 후 다시 시도해 주세요."}), 503
+
+    if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+        try:
+            fut.result(timeout=UPLOAD_SUMMARY_TIMEOUT + 30)
+        except FutureTimeout:
+            return jsonify({"ok": False, **get_job(job["job_id"]), "msg": "요약 대기 시간 초과 (/jobs로 확인)"}), 504
+        done = job_response(get_job(job["job_id"]))
+        return jsonify(done), (200 if done["ok"] else 500)
+    return jsonify({"ok": True, **job}), 202
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"ok": False, "msg": "작업을 찾을 수 없습니다."}), 404
+    return jsonify(job_response(job))
 
 # ── 일반 메시지 ──────────────────────────────────────
 @app.route("/send", methods=["POST"])
 def send():
     """
-    { "text": "..." } -> Rasa에 전달
+    { "text": "...", "socket_id": "..." } -> Rasa에 전달
+    - socket_id(선택): socket.io 연결 ID → metadata로 전달, 외부 모드 답변이 bot_stream 이벤트로 먼저 스트리밍됨
     - /set_mode{...}: 응답/로그 모두 폐기, [] 반환
     - 그 외: 모드 전환/시스템 메시지는 응답/로그에서 제거
     - 타임스탬프는 KST만 포함(ts_kst, ts_kst_human)
+    - FASTPATH_INTERNAL: 내부 모드 KB 적중이면 Rasa 없이 바로 답변 (try_fastpath)
     """
     data = request.get_json(force=True, silent=True) or {}
     text = (data.get("text") or "").strip()
@@ -152,11 +385,27 @@ def send():
         return jsonify({"ok": False, "msg": "text가 비었습니다."}), 400
 
     is_setmode = text.startswith("/set_mode")
-    if not is_setmode:
+    if is_setmode:
+        _client_mode[SENDER_ID] = _parse_set_mode(text)
+        if fast_kb is not None:
+            # 빠른 경로 사용 중에는 다음 메시지가 Rasa로 갈 때 함께 전달 (적중이면 트래커 이벤트로 기록)
+            _pending_set_mode[SENDER_ID] = text
+            return jsonify([])
+    else:
         log_event(ensure_kst_fields({"role": "user", "text": text, "meta": {}}))
+        fast = try_fastpath(SENDER_ID, text)
+        if fast is not None:
+            return jsonify(fast)
+
+    try:
+        flush_pending_set_mode(SENDER_ID)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "msg": str(e)}), 500
 
     try:
         payload = {"sender": SENDER_ID, "message": text}
+        if data.get("socket_id"):
+            payload["metadata"] = {"socket_id": data["socket_id"]}
         r = requests.post(f"{RASA_URL}/webhooks/rest/webhook", json=payload, timeout=60)
         if not r.ok:
             return jsonify({"ok": False, "msg": f"Rasa 응답 실패: {r.text}"}), 500
@@ -166,20 +415,7 @@ def send():
         if is_setmode:
             return jsonify([])
 
-        if isinstance(raw, list):
-            filtered = [m for m in raw if isinstance(m, dict) and not is_mode_change(m)]
-        elif isinstance(raw, dict):
-            filtered = [] if is_mode_change(raw) else [raw]
-        else:
-            filtered = []
-
-        msgs = []
-        for m in filtered:
-            enriched = ensure_kst_fields(m if isinstance(m, dict) else {"text": str(m)})
-            msgs.append(enriched)
-            log_event({**enriched, "role": "bot"})
-
-        return jsonify(msgs)
+        return jsonify(send_replies(raw))
 
     except requests.exceptions.RequestException as e:
         return jsonify({"ok": False, "msg": f"Rasa 요청 예외: {e}"}), 500
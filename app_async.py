@@ -0,0 +1,332 @@
+# app_async.py
+# 비동기 게이트웨이: app.py와 같은 /send, /upload, /jobs, /health 계약 (Sanic, ASGI 호환)
+# - Rasa 호출은 프로세스당 keep-alive 연결 풀(aiohttp) 하나를 공유 → 요청마다 TCP 연결/스레드 점유 없음
+# - 응답 대기(최대 60~90초) 중에도 이벤트 루프가 다른 요청을 처리 → 한 프로세스가 수백 명 동시 처리
+# - 업로드 요약은 같은 루프의 asyncio 태스크로 실행, 작업 상태(/jobs)·빠른 경로 상태는 프로세스 메모리
+#   → 워커(프로세스)는 1개로 실행 (uvicorn도 --workers 없이)
+# 실행: python app_async.py   또는   uvicorn app_async:app --port 8080   (ASGI)
+import asyncio
+import os
+
+import aiohttp
+from sanic import Sanic, response
+from sanic.exceptions import PayloadTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from actions.upload_utils import CHUNK_SIZE, StoreWriter
+import app as gateway
+from app import RASA_URL, SENDER_ID, UPLOAD_DIR, ensure_kst_fields, log_event, send_replies, upload_replies
+
+RASA_POOL_SIZE = int(os.getenv("RASA_POOL_SIZE", "100"))          # Rasa 동시 연결 상한
+RASA_KEEPALIVE = float(os.getenv("RASA_KEEPALIVE", "30"))         # 유휴 연결 유지(초)
+STATIC_ROOT = os.path.realpath(".")
+
+app = Sanic("rasa_gateway")
+app.config.REQUEST_MAX_SIZE = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))   # /upload은 스트리밍 (메모리와 무관, 상한은 직접 검사)
+FORM_FIELD_MAX_BYTES = 4096   # 업로드 폼의 파일 외 필드(socket_id 등) 상한
+app.config.RESPONSE_TIMEOUT = 120
+
+
+class RasaClient:
+    """Rasa REST 호출용 공유 세션 (연결 재사용, 호출별 타임아웃)"""
+
+    def __init__(self, base_url: str, pool_size: int = 100, keepalive: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self._session: aiohttp.ClientSession | None = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive)
+            self._session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def post(self, path: str, payload, timeout: float):
+        """→ (status, json 또는 text)"""
+        await self.start()
+        async with self._session.post(
+            f"{self.base_url}{path}", json=payload, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as r:
+            try:
+                body = await r.json(content_type=None)
+            except ValueError:
+                body = await r.text()
+            return r.status, body
+
+    async def push_job(self, socket_id: str, job: dict):
+        """업로드 작업 완료 알림 → Rasa my_socketio /job (실패해도 클라이언트는 /jobs 폴링으로 받음)"""
+        if not socket_id:
+            return
+        headers = {"X-Stream-Token": gateway.STREAM_PUSH_TOKEN} if gateway.STREAM_PUSH_TOKEN else None
+        try:
+            await self.start()
+            async with self._session.post(
+                gateway.JOB_PUSH_URL, json={"recipient_id": socket_id, "job": job}, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=5),
+            ):
+                pass
+        except RASA_ERRORS as e:
+            print(f"[UPLOAD] job push 실패: {e!r}")
+
+    def webhook(self, message: str, timeout: float = 60, metadata: dict | None = None):
+        payload = {"sender": SENDER_ID, "message": message}
+        if metadata:
+            payload["metadata"] = metadata
+        return self.post("/webhooks/rest/webhook", payload, timeout)
+
+
+rasa = RasaClient(RASA_URL, pool_size=RASA_POOL_SIZE, keepalive=RASA_KEEPALIVE)
+RASA_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+async def _off_loop(fn, *args):
+    """파일 기록(log_event 등)이 있는 동기 함수는 기본 스레드 풀에서 (이벤트 루프를 막지 않도록)"""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+_upload_lock: asyncio.Lock | None = None   # 업로드 작업은 같은 대화로 가므로 1개씩 순서대로
+_upload_tasks: set = set()                 # 실행 중 작업 태스크 참조 유지
+
+
+@app.listener("before_server_start")
+async def _start_client(app_, loop):
+    global _upload_lock
+    _upload_lock = asyncio.Lock()
+    await rasa.start()
+
+
+@app.listener("after_server_stop")
+async def _close_client(app_, loop):
+    await rasa.close()
+
+
+# ── 정적 파일 ────────────────────────────────────────
+@app.get("/")
+async def serve_index(request):
+    return await response.file(os.path.join(STATIC_ROOT, "index.html"))
+
+
+@app.get("/<path:path>")
+async def serve_file(request, path: str):
+    full = os.path.realpath(os.path.join(STATIC_ROOT, path))
+    if not full.startswith(STATIC_ROOT + os.sep) or not os.path.isfile(full):
+        return response.json({"ok": False, "msg": "not found"}, status=404)
+    return await response.file(full)
+
+
+# ── 업로드 ───────────────────────────────────────────
+async def _receive_upload(request):
+    """
+    multipart 본문을 청크 단위로 받아 'file' 파트는 바로 저장소에 기록 (본문 전체를 메모리에 두지 않음)
+    → (StoredFile 또는 None, 파일명, mime, 폼 필드 dict), 형식 오류/잘린 본문은 ValueError
+    """
+    ctype, opts = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != "multipart/form-data" or not opts.get("boundary"):
+        raise ValueError("multipart/form-data 요청이 아닙니다.")
+    # 스트리밍 라우트는 Sanic이 REQUEST_MAX_SIZE를 적용하지 않음 → 받은 바이트 수로 직접 검사
+    limit = app.config.REQUEST_MAX_SIZE
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise PayloadTooLarge("업로드 크기 제한을 넘었습니다.")
+    received = 0
+    decoder = MultipartDecoder(opts["boundary"].encode("latin-1"))   # 받은 청크는 바로 소비 → 버퍼는 청크 크기 정도
+    writer: StoreWriter | None = None
+    filename, mime = None, ""   # filename None: file 파트 없음, "": 파일 선택 없이 전송
+    fields: dict = {}
+    part = None          # 현재 파트: "file" | 필드 이름 | None(무시)
+    buf = bytearray()    # 스레드 풀로 넘기기 전 모아 두는 파일 청크
+    try:
+        while True:
+            chunk = await request.stream.read()
+            if chunk is not None:
+                received += len(chunk)
+                if received > limit:
+                    raise PayloadTooLarge("업로드 크기 제한을 넘었습니다.")
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == "file" and writer is None:
+                    writer = await _off_loop(StoreWriter, UPLOAD_DIR)
+                    filename, mime, part = event.filename, event.headers.get("content-type", ""), "file"
+                elif isinstance(event, Field):
+                    part = event.name
+                    fields[part] = b""
+                elif isinstance(event, (File, Field)):
+                    part = None
+                elif isinstance(event, Data):
+                    if part == "file":
+                        buf += event.data
+                        if len(buf) >= CHUNK_SIZE or not event.more_data:
+                            await _off_loop(writer.write, bytes(buf))
+                            buf.clear()
+                    elif part is not None:
+                        fields[part] += event.data
+                        if len(fields[part]) > FORM_FIELD_MAX_BYTES:
+                            raise ValueError(f"폼 필드가 너무 큽니다: {part}")
+                event = decoder.next_event()
+            if chunk is None or isinstance(event, Epilogue):
+                break
+        if writer is None:
+            return None, None, "", fields
+        if not filename:
+            await _off_loop(writer.abort)
+            return None, "", "", fields
+        stored = await _off_loop(writer.commit, secure_filename(filename))
+    except BaseException:
+        if writer is not None:
+            await _off_loop(writer.abort)
+        raise
+    return stored, filename, mime, {k: v.decode("utf-8", "replace") for k, v in fields.items()}
+
+
+@app.post("/upload", stream=True)
+async def upload(request):
+    try:
+        stored, filename, mime, fields = await _receive_upload(request)
+    except ValueError as e:
+        return response.json({"ok": False, "msg": f"업로드 요청을 읽을 수 없습니다: {e}"}, status=400)
+    except OSError as e:
+        return response.json({"ok": False, "msg": f"파일 저장 실패: {e}"}, status=500)
+    if stored is None:
+        msg = "파일명이 비어있습니다." if filename == "" else "file 필드가 없습니다."
+        return response.json({"ok": False, "msg": msg}, status=400)
+
+    filename = secure_filename(filename)
+    # 작업 상태는 app.py와 같은 저장소/형식, 실행은 이 루프의 태스크 (Rasa 호출은 공유 연결 풀)
+    mime = mime or "application/octet-stream"
+    job = gateway.create_upload_job(stored, filename, mime)
+    if job is None:
+        return response.json({"ok": False, "msg": "처리 대기 중인 업로드가 많습니다. 잠시 후 다시 시도해 주세요."}, status=503)
+    task = asyncio.ensure_future(_run_upload_job(job["job_id"], stored.path, mime, fields.get("socket_id", "")))
+    _upload_tasks.add(task)
+    task.add_done_callback(_upload_tasks.discard)
+
+    if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+        try:
+            # shield: 대기만 끝나고 작업은 계속 (결과는 /jobs로)
+            await asyncio.wait_for(asyncio.shield(task), gateway.UPLOAD_SUMMARY_TIMEOUT + 30)
+        except asyncio.TimeoutError:
+            return response.json({"ok": False, **gateway.get_job(job["job_id"]),
+                                  "msg": "요약 대기 시간 초과 (/jobs로 확인)"}, status=504, ensure_ascii=False)
+        done = gateway.job_response(gateway.get_job(job["job_id"]))
+        return response.json(done, status=200 if done["ok"] else 500, ensure_ascii=False)
+    return response.json({"ok": True, **job}, status=202, ensure_ascii=False)
+
+
+async def _flush_pending_set_mode():
+    """app.flush_pending_set_mode와 같은 동작 (보류된 /set_mode를 먼저 Rasa로), 실패 시 RuntimeError"""
+    if gateway._last_tracker_write is not None:
+        # 앞선 빠른 경로 트래커 기록이 끝난 뒤 Rasa로 (이벤트 순서 유지)
+        try: await asyncio.wait_for(asyncio.wrap_future(gateway._last_tracker_write), timeout=5)
+        except Exception as e: print(f"[FASTPATH] 트래커 기록 대기 실패: {e!r}")
+    pending = gateway._pending_set_mode.pop(SENDER_ID, None)
+    if pending:
+        try:
+            status, body = await rasa.webhook(pending)
+        except RASA_ERRORS as e:
+            raise RuntimeError(f"Rasa 요청 예외: {e!r}")
+        if status >= 300:
+            raise RuntimeError(f"Rasa 응답 실패: {body}")
+
+
+async def _summarize_upload(save_path: str, mime: str) -> tuple:
+    """app._summarize_upload와 같은 2단계 (트리거 → 요약), 실패 시 RuntimeError(사용자 메시지)"""
+    # 1) 인텐트 트리거
+    try:
+        trigger_payload = {
+            "name": "file_uploaded",
+            "entities": {"uploaded_file_path": save_path, "uploaded_file_mime": mime},
+        }
+        status, body = await rasa.post(f"/conversations/{SENDER_ID}/trigger_intent", trigger_payload, timeout=30)
+    except RASA_ERRORS as e:
+        raise RuntimeError(f"Rasa trigger 예외: {e!r}")
+    if status >= 300:
+        raise RuntimeError(f"Rasa trigger 실패: {body}")
+
+    # 2) 요약 실행
+    try:
+        status, body = await rasa.webhook("/file_uploaded", timeout=gateway.UPLOAD_SUMMARY_TIMEOUT)
+    except RASA_ERRORS as e:
+        raise RuntimeError(f"Rasa 요청 예외: {e!r}")
+    if status >= 300:
+        raise RuntimeError(f"Rasa 응답 실패: {body}")
+    return await _off_loop(upload_replies, body if isinstance(body, list) else [])
+
+
+async def _run_upload_job(job_id: str, save_path: str, mime: str, socket_id: str):
+    async with _upload_lock:
+        gateway._update_job(job_id, status="running")
+        try:
+            # 빠른 경로에서 보류된 모드 전환을 먼저 반영해야 요약도 현재 모드로 실행됨
+            await _flush_pending_set_mode()
+            replies, replies_rich = await _summarize_upload(save_path, mime)
+            view = gateway.finish_upload_job(job_id, replies, replies_rich)
+        except Exception as e:
+            view = gateway.finish_upload_job(job_id, error=str(e))
+    await rasa.push_job(socket_id, view)
+
+
+@app.get("/jobs/<job_id>")
+async def job_status(request, job_id: str):
+    job = gateway.get_job(job_id)
+    if job is None:
+        return response.json({"ok": False, "msg": "작업을 찾을 수 없습니다."}, status=404)
+    return response.json(gateway.job_response(job), ensure_ascii=False)
+
+
+# ── 일반 메시지 ──────────────────────────────────────
+@app.post("/send")
+async def send(request):
+    """app.send와 같은 동작 (빠른 경로 포함), Rasa 대기·로그 파일 기록 중 이벤트 루프를 막지 않음"""
+    try:
+        data = request.json or {}
+    except Exception:
+        data = {}
+    text = (data.get("text") or "").strip()
+    if not text:
+        return response.json({"ok": False, "msg": "text가 비었습니다."}, status=400)
+
+    is_setmode = text.startswith("/set_mode")
+    if is_setmode:
+        gateway._client_mode[SENDER_ID] = gateway._parse_set_mode(text)
+        if gateway.fast_kb is not None:
+            gateway._pending_set_mode[SENDER_ID] = text
+            return response.json([])
+    else:
+        await _off_loop(log_event, ensure_kst_fields({"role": "user", "text": text, "meta": {}}))
+        fast = await _off_loop(gateway.try_fastpath, SENDER_ID, text)
+        if fast is not None:
+            return response.json(fast, ensure_ascii=False)
+
+    try:
+        await _flush_pending_set_mode()
+    except RuntimeError as e:
+        return response.json({"ok": False, "msg": str(e)}, status=500)
+
+    try:
+        socket_id = data.get("socket_id")
+        status, body = await rasa.webhook(text, metadata={"socket_id": socket_id} if socket_id else None)
+        if status >= 300:
+            return response.json({"ok": False, "msg": f"Rasa 응답 실패: {body}"}, status=500)
+        if is_setmode:
+            return response.json([])
+        return response.json(await _off_loop(send_replies, body), ensure_ascii=False)
+    except RASA_ERRORS as e:
+        return response.json({"ok": False, "msg": f"Rasa 요청 예외: {e!r}"}, status=500)
+
+
+# ── 헬스체크 ─────────────────────────────────────────
+@app.get("/health")
+async def health(request):
+    return response.json({"ok": True})
+
+
+if __name__ == "__main__":
+    # 업로드 작업 상태(/jobs)와 빠른 경로의 모드/보류 상태가 프로세스 메모리에 있으므로 워커 1개
+    # (워커가 여럿이면 폴링이 다른 워커로 가서 404, 같은 대화로 가는 업로드도 순서가 섞임)
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "8080")), workers=1, access_log=False)
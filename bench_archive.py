@@ -0,0 +1,85 @@
+# bench_archive.py
+# 로그 압축 보관 벤치마크: 원본 JSONL(매 턴 전체 대화 재기록) 전체 스캔 vs compact + read_archive 조건 조회
+# 실행: python bench_archive.py
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from actions.archive_utils import compact, default_format, read_archive
+
+WORDS = ["휴가", "신청", "방법", "알려줘", "출장비", "정산", "회의실", "예약", "VPN", "접속이", "안돼요"]
+
+
+def make_logs(src: str, days: int, sessions_per_day: int, turns: int, rng: random.Random):
+    """actions.save_history_all(비증분)처럼 턴마다 세션 전체를 history*.jsonl에 다시 쌓음"""
+    start = datetime(2025, 8, 1, 9)
+    paths = {m: os.path.join(src, f"history_{m}.jsonl") for m in ("internal", "gemini")}
+    files = {m: open(p, "w", encoding="utf-8") for m, p in paths.items()}
+    for d in range(days):
+        for s in range(sessions_per_day):
+            mode = rng.choice(("internal", "gemini"))
+            sender = f"user{rng.randint(1, 200)}"
+            t0 = start + timedelta(days=d, minutes=s * 3)
+            history = []
+            for t in range(turns):
+                ts = t0 + timedelta(seconds=t * 10)
+                history.append({"type": "user", "text": " ".join(rng.choices(WORDS, k=6)), "intent": "ask_anything", "time": ts.isoformat()})
+                history.append({"type": "bot", "text": " ".join(rng.choices(WORDS, k=20)), "time": (ts + timedelta(seconds=2)).isoformat()})
+                rec = {"sender_id": sender, "session_id": f"{sender}-{int(t0.timestamp())}", "saved_at": ts.isoformat(), "history": history}
+                files[mode].write(json.dumps(rec, ensure_ascii=False) + "\n")
+    for f in files.values():
+        f.close()
+    return list(paths.values())
+
+
+def scan_raw(paths, date_from, date_to, mode, sender):
+    """원본에서 같은 조건 조회 (전체 파일 파싱 + 중복 제거)"""
+    seen, out = set(), []
+    for p in paths:
+        if mode not in os.path.basename(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec["sender_id"] != sender:
+                    continue
+                for m in rec["history"]:
+                    if not (date_from <= m["time"][:10] <= date_to):
+                        continue
+                    key = (rec["session_id"], m["time"], m["type"], m["text"])
+                    if key not in seen:
+                        seen.add(key)
+                        out.append(m)
+    return out
+
+
+if __name__ == "__main__":
+    rng = random.Random(18)
+    with tempfile.TemporaryDirectory() as tmp:
+        src, out = os.path.join(tmp, "logs"), os.path.join(tmp, "archive")
+        os.makedirs(src)
+        paths = make_logs(src, days=14, sessions_per_day=60, turns=8, rng=rng)
+
+        t0 = time.perf_counter()
+        st = compact([src], out)
+        t_compact = time.perf_counter() - t0
+
+        busiest = read_archive(out, "history", "2025-08-05", "2025-08-07", "gemini")["sender_id"].value_counts().idxmax()
+        q = ("2025-08-05", "2025-08-07", "gemini", busiest)
+        t0 = time.perf_counter()
+        raw = scan_raw(paths, *q)
+        t_raw = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        df = read_archive(out, "history", date_from=q[0], date_to=q[1], mode=q[2], sender_id=q[3])
+        t_arc = time.perf_counter() - t0
+        assert len(raw) == len(df), (len(raw), len(df))
+
+        print(f"=== 로그 압축 보관 벤치마크 (format={default_format()}) ===")
+        print(f"rows       : {st['rows_in']:,} → {st['rows_out']:,}")
+        print(f"disk       : {st['source_bytes'] / 1e6:.1f}MB → {st['archive_bytes'] / 1e6:.2f}MB "
+              f"({st['source_bytes'] / st['archive_bytes']:.0f}x), compact {t_compact:.1f}s")
+        print(f"query      : raw scan {t_raw * 1e3:.1f}ms vs read_archive {t_arc * 1e3:.1f}ms "
+              f"({t_raw / t_arc:.0f}x, {len(df)} rows)")
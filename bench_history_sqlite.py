@@ -0,0 +1,104 @@
+# bench_history_sqlite.py
+# 히스토리 SQLite 저장 벤치마크: 기존 insert_sqlite(매 턴 connect + CREATE + 행별 execute) vs HistoryStore
+# 실행: python bench_history_sqlite.py
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from actions.history_utils import HistoryStore
+
+
+def legacy_init(path: str):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS conversations(id INTEGER PRIMARY KEY AUTOINCREMENT, sender_id TEXT, session_id TEXT, saved_at TEXT)")
+    c.execute("CREATE TABLE IF NOT EXISTS messages(id INTEGER PRIMARY KEY AUTOINCREMENT, conv_id INTEGER, role TEXT, text TEXT, intent TEXT, time TEXT)")
+    conn.commit()
+    conn.close()
+
+
+def legacy_insert(path: str, sender_id: str, session_id: str, history: list):
+    """기존 actions.insert_sqlite 구현"""
+    legacy_init(path)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("INSERT INTO conversations(sender_id, session_id, saved_at) VALUES(?,?,?)",
+              (sender_id, session_id, datetime.now().isoformat()))
+    conv_id = c.lastrowid
+    for m in history:
+        c.execute("INSERT INTO messages(conv_id, role, text, intent, time) VALUES(?,?,?,?,?)",
+                  (conv_id, m.get("type"), m.get("text"), m.get("intent"), m.get("time")))
+    conn.commit()
+    conn.close()
+
+
+def make_turn(i: int, size: int) -> list:
+    now = datetime.now().isoformat()
+    return [{"type": "user" if j % 2 == 0 else "bot", "text": f"메시지 {i}-{j} " * 5, "intent": "ask_anything", "time": now}
+            for j in range(size)]
+
+
+def bench(turns: int, msgs_per_turn: int):
+    d = tempfile.mkdtemp()
+    batches = [make_turn(i, msgs_per_turn) for i in range(turns)]
+    total = turns * msgs_per_turn
+
+    legacy_path = os.path.join(d, "legacy.sqlite")
+    t0 = time.perf_counter()
+    for i, h in enumerate(batches):
+        legacy_insert(legacy_path, "u", f"s{i % 50}", h)
+    t_legacy = time.perf_counter() - t0
+
+    store = HistoryStore(os.path.join(d, "store.sqlite"))
+    t0 = time.perf_counter()
+    for i, h in enumerate(batches):
+        store.save("u", f"s{i % 50}", h, append=True, watermark=(float(i), "internal"))
+    t_store = time.perf_counter() - t0
+    store.close()
+
+    print(
+        f"turns={turns:>5}  msgs/turn={msgs_per_turn:>3}  "
+        f"legacy={total / t_legacy:10,.0f} msgs/s  store={total / t_store:10,.0f} msgs/s  "
+        f"speedup={t_legacy / t_store:6.1f}x"
+    )
+
+
+def bench_conversation(sessions: int, turns: int):
+    """
+    실제 저장 패턴 비교: 기존은 턴마다 대화 전체를 다시 저장, HistoryStore는 워터마크 이후 새 메시지(턴당 2건)만
+    """
+    d = tempfile.mkdtemp()
+    conv = make_turn(0, turns * 2)
+
+    legacy_path = os.path.join(d, "legacy.sqlite")
+    t0 = time.perf_counter()
+    for s in range(sessions):
+        for k in range(1, turns + 1):
+            legacy_insert(legacy_path, "u", f"s{s}", conv[:k * 2])
+    t_legacy = time.perf_counter() - t0
+
+    store = HistoryStore(os.path.join(d, "store.sqlite"))
+    t0 = time.perf_counter()
+    for s in range(sessions):
+        for k in range(1, turns + 1):
+            store.save("u", f"s{s}", conv[(k - 1) * 2:k * 2], append=True, watermark=(float(k), "internal"))
+    t_store = time.perf_counter() - t0
+    store.close()
+
+    n = sessions * turns
+    print(
+        f"sessions={sessions:>3}  turns/session={turns:>3}  "
+        f"legacy={t_legacy / n * 1000:7.2f} ms/turn  store={t_store / n * 1000:7.2f} ms/turn  "
+        f"speedup={t_legacy / t_store:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    print("=== 히스토리 SQLite 저장 벤치마크 (같은 메시지 수) ===")
+    for turns, size in [(500, 2), (500, 10), (200, 100)]:
+        bench(turns, size)
+    print("=== 대화 단위 저장 (기존: 전체 재저장 / store: 증분) ===")
+    for sessions, turns in [(20, 10), (10, 50)]:
+        bench_conversation(sessions, turns)
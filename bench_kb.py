@@ -0,0 +1,109 @@
+# bench_kb.py
+# KB 동의어 매칭 벤치마크: 기존 find_topic(정렬 + 선형 탐색) vs KeywordAutomaton
+# + 오타 허용 검색(FuzzyIndex) 정확도: kb.txt 기준 라벨 질문 세트, 임계값별 정답/오답/놓침
+# 실행: python bench_kb.py
+import os
+import random
+import time
+
+from actions.kb_utils import KeywordAutomaton, load_kb
+
+SYLLABLES = [chr(c) for c in range(0xAC00, 0xAC00 + 400)]  # 한글 음절 일부
+
+
+def legacy_find_topic(synonyms: dict, text: str) -> str:
+    """기존 KBCache.find_topic 구현 (매 호출마다 정렬 + 부분문자열 선형 탐색)"""
+    keys = sorted(synonyms.keys(), key=len, reverse=True)
+    for k in keys:
+        if k and (k in text):
+            return synonyms[k]
+    return ""
+
+
+def make_synonyms(n: int, rng: random.Random) -> dict:
+    synonyms = {}
+    while len(synonyms) < n:
+        key = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 8)))
+        synonyms[key] = f"topic{len(synonyms) // 3}"
+    return synonyms
+
+
+def make_messages(synonyms: dict, count: int, rng: random.Random) -> list:
+    keys = list(synonyms.keys())
+    msgs = []
+    for i in range(count):
+        filler = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(10, 40)))
+        if i % 2 == 0:
+            k = rng.choice(keys)
+            cut = rng.randint(0, len(filler))
+            filler = filler[:cut] + " " + k + " " + filler[cut:]
+        msgs.append(filler.lower())
+    return msgs
+
+
+def bench(n: int, queries: int):
+    rng = random.Random(n)
+    synonyms = make_synonyms(n, rng)
+    msgs = make_messages(synonyms, queries, rng)
+
+    t0 = time.perf_counter()
+    matcher = KeywordAutomaton(synonyms.items())
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    legacy = [legacy_find_topic(synonyms, m) for m in msgs]
+    t_legacy = (time.perf_counter() - t0) / queries
+
+    t0 = time.perf_counter()
+    fast = [matcher.search(m) for m in msgs]
+    t_fast = (time.perf_counter() - t0) / queries
+
+    assert legacy == fast, "결과 불일치"
+    print(
+        f"synonyms={n:>7,}  build={build * 1e3:9.1f}ms  "
+        f"legacy={t_legacy * 1e6:12.1f}us/query  automaton={t_fast * 1e6:8.1f}us/query  "
+        f"speedup={t_legacy / t_fast:9.1f}x"
+    )
+
+
+# (질문, 기대 토픽) - 정확 매칭에 걸리지 않는 오타/띄어쓰기 질문, 기대 토픽 ""은 KB에 없는 질문 (내부 답변하면 오답)
+FUZZY_LABELS = [
+    ("휴가 신쳥 어떻게 해요", "휴가신청"), ("휴가신쳥", "휴가신청"), ("출장 신쳥", "출장신청"),
+    ("회의실예얃", "회의실예약"), ("회으실 예약", "회의실예약"), ("재직증명셔 발급", "재직증명서"),
+    ("원격지윈 요청", "원격지원"), ("퇴근시깐", "퇴근시간"), ("보안규졍", "보안규정"),
+    ("구매싱청", "구매신청"), ("헬프데스끄 문의", "헬프데스크"), ("연차수담", "연차수당"),
+    ("택시비 정산", ""), ("출장비 정산 방법", ""), ("오늘 점심 메뉴", ""), ("회사 이념", ""),
+    ("택시 타도 되나요", ""), ("주차장 위치", ""), ("자금 관리", ""), ("비밀번호 변경", ""),
+    ("프린터 고장", ""), ("보안 점검 일정", ""), ("출근 버스 시간표", ""), ("회의록 양식", ""),
+    ("구매 대행", ""), ("시스템 점검", ""), ("연구 과제 신청", ""), ("재무제표 공시", ""),
+]
+
+
+def bench_fuzzy(kb_path: str = "kb.txt"):
+    if not os.path.exists(kb_path):
+        print(f"(오타 검색 정확도 생략: {kb_path} 없음)")
+        return
+    _, _, matcher, fuzzy = load_kb(kb_path)
+    labels = [(q, t) for q, t in FUZZY_LABELS if not matcher.search(q.lower())]
+    results = [(fuzzy.search(q, k=1) or [("", 0.0)])[0] for q, _ in labels]
+    for threshold in (0.7, 0.75, 0.8, 0.85):
+        tp = fp = fn = 0
+        wrong = []
+        for (q, expected), (topic, score) in zip(labels, results):
+            got = topic if score >= threshold else ""
+            if got and got == expected:
+                tp += 1
+            elif got:
+                fp += 1
+                wrong.append(f"{q}→{got}")
+            elif expected:
+                fn += 1
+        print(f"threshold={threshold:.2f}  정답={tp:>2}  오답={fp:>2}  놓침={fn:>2}  {' '.join(wrong)}")
+
+
+if __name__ == "__main__":
+    print("=== KB 동의어 매칭 벤치마크 ===")
+    for n, q in [(30, 2000), (3_000, 500), (300_000, 20)]:
+        bench(n, q)
+    print("=== 오타 허용 검색 정확도 (kb.txt 라벨 세트) ===")
+    bench_fuzzy()
@@ -0,0 +1,67 @@
+# bench_mask.py
+# 개인정보 마스킹 처리량 벤치마크 (MB/s): 기존 정규식 3회 치환 vs PIIMasker 단일 패스 vs 메모 적중
+# 실행: python bench_mask.py
+import random
+import re
+import time
+
+from actions.mask_utils import PIIMasker
+
+EMAIL_RE = re.compile(r"([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)")
+PHONE_RE = re.compile(r"(\b01[016789]-?\d{3,4}-?\d{4}\b|\b\d{2,3}-\d{3,4}-\d{4}\b)")
+RRN_RE = re.compile(r"\b\d{6}-\d{7}\b")
+
+WORDS = ["휴가", "신청", "방법", "알려줘", "출장비", "정산", "회의실", "예약", "VPN", "접속이", "안돼요", "비밀번호", "초기화"]
+
+
+def legacy_mask(text: str) -> str:
+    """기존 mask_text 구현 (패턴마다 전체 텍스트를 한 번씩)"""
+    if not text: return text
+    text = EMAIL_RE.sub("[EMAIL]", text)
+    text = PHONE_RE.sub("[PHONE]", text)
+    text = RRN_RE.sub("[RRN]", text)
+    return text
+
+
+def make_messages(count: int, rng: random.Random) -> list:
+    msgs = []
+    for _ in range(count):
+        parts = [rng.choice(WORDS) for _ in range(rng.randint(5, 30))]
+        r = rng.random()
+        if r < 0.1:
+            parts.insert(rng.randint(0, len(parts)), f"user{rng.randint(1, 999)}@example.com")
+        elif r < 0.2:
+            parts.insert(rng.randint(0, len(parts)), f"010-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}")
+        elif r < 0.25:
+            parts.insert(rng.randint(0, len(parts)), f"{rng.randint(100000, 999999)}-{rng.randint(1000000, 9999999)}")
+        msgs.append(" ".join(parts))
+    return msgs
+
+
+def mbps(fn, msgs, size_mb: float, rounds: int = 3) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for m in msgs:
+            fn(m)
+        best = min(best, time.perf_counter() - t0)
+    return size_mb / best
+
+
+if __name__ == "__main__":
+    rng = random.Random(17)
+    msgs = make_messages(50_000, rng)
+    size_mb = sum(len(m.encode("utf-8")) for m in msgs) / 1e6
+
+    masker = PIIMasker(cache_size=len(msgs))
+    assert [legacy_mask(m) for m in msgs] == [masker._mask(m) for m in msgs], "결과 불일치"
+
+    print(f"=== 마스킹 벤치마크 ({len(msgs):,} msgs, {size_mb:.1f} MB) ===")
+    legacy = mbps(legacy_mask, msgs, size_mb)
+    single = mbps(masker._mask, msgs, size_mb)
+    masker.mask.cache_clear()
+    for m in msgs: masker.mask(m)   # 메모 채움 (이미 저장된 이벤트 재저장 상황)
+    cached = mbps(masker.mask, msgs, size_mb)
+    print(f"legacy(3 passes) : {legacy:8.1f} MB/s")
+    print(f"single pass      : {single:8.1f} MB/s  ({single / legacy:.1f}x)")
+    print(f"memoized (hit)   : {cached:8.1f} MB/s  ({cached / legacy:.1f}x)")
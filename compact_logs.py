@@ -0,0 +1,38 @@
+# compact_logs.py
+# 대화 로그 압축: history*.jsonl / chat_{mode}_{date}.jsonl / chat-YYYYMMDD.jsonl
+#   → 중복 제거 + 일자/모드 파티션 압축 파일 (archive/{history,event}/date=.../mode=.../part.*)
+# 실행: python compact_logs.py [--src chat_logs logs] [--out archive] [--format parquet|jsonl.zst|jsonl.gz] [--prune]
+# 조회: from actions.archive_utils import read_archive
+#       read_archive("archive", "history", date_from="2025-08-01", date_to="2025-08-14", mode="gemini", sender_id="local-user")
+import argparse
+from datetime import datetime
+
+from actions.archive_utils import KST, compact, default_format, discover_sources
+
+
+def main():
+    ap = argparse.ArgumentParser(description="대화 로그 중복 제거 + 압축 보관")
+    ap.add_argument("--src", nargs="+", default=["chat_logs", "logs"], help="원본 로그 디렉터리")
+    ap.add_argument("--out", default="archive", help="보관 디렉터리")
+    ap.add_argument("--format", choices=["parquet", "jsonl.zst", "jsonl.gz"], default=None,
+                    help=f"보관 포맷 (기본: 설치된 패키지 기준 {default_format()})")
+    ap.add_argument("--prune", action="store_true",
+                    help="압축 후 오늘 이전 날짜의 실시간 로그 원본(chat_*.jsonl, chat-*.jsonl) 삭제 (history*.jsonl은 유지)")
+    args = ap.parse_args()
+
+    st = compact(args.src, args.out, args.format)
+    ratio = st["source_bytes"] / st["archive_bytes"] if st["archive_bytes"] else 0
+    print(f"[COMPACT] format={st['format']} sources={st['sources']} days={st['days']}")
+    print(f"[COMPACT] rows {st['rows_in']:,} → {st['rows_out']:,} (중복 제거)")
+    print(f"[COMPACT] bytes {st['source_bytes']:,} → {st['archive_bytes']:,} ({ratio:.1f}x)")
+
+    if args.prune:
+        today = datetime.now(KST).strftime("%Y-%m-%d")
+        for src in discover_sources(args.src):
+            if src["kind"] == "event" and src["day"] and src["day"] < today:
+                src["path"].unlink()
+                print(f"[COMPACT] pruned {src['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
+import os
+
 from rasa.core.channels.socketio import SocketIOInput
-from sanic import Blueprint
+from sanic import Blueprint, response
 import socketio
 
 class PatchedSocketIOInput(SocketIOInput):
+    # 🔁 Gemini 스트리밍 조각 이벤트: {"stream_id", "text", "done"}
+    #    done=True 메시지의 text는 전체 답변(최종본), 이후 bot_uttered로 같은 답변이 한 번 더 옴
+    bot_stream_evt = "bot_stream"
+    # 📎 업로드 작업 완료 이벤트: 게이트웨이 /jobs/<id> 응답과 같은 형태
+    upload_job_evt = "upload_job"
+
     def blueprint(self, on_new_message):
         sio = socketio.AsyncServer(async_mode="sanic", cors_allowed_origins="*")
         app = Blueprint("socketio_webhook", __name__)
@@ -25,4 +33,34 @@ class PatchedSocketIOInput(SocketIOInput):
                 )
             )
 
+        # ✅ 액션 서버 → 클라이언트 스트리밍 중계 (POST /webhooks/socketio/stream)
+        def authorized(request) -> bool:
+            token = os.getenv("STREAM_PUSH_TOKEN")
+            return not token or request.headers.get("X-Stream-Token") == token
+
+        @app.route("/stream", methods=["POST"])
+        async def push_stream(request):
+            if not authorized(request):
+                return response.json({"ok": False, "msg": "invalid token"}, status=403)
+            data = request.json or {}
+            recipient_id = data.get("recipient_id")
+            if not recipient_id:
+                return response.json({"ok": False, "msg": "recipient_id가 없습니다."}, status=400)
+            payload = {"stream_id": data.get("stream_id"), "text": data.get("text") or "", "done": bool(data.get("done"))}
+            await sio.emit(self.bot_stream_evt, payload, room=recipient_id, namespace=self.namespace)
+            return response.json({"ok": True})
+
+        # ✅ 게이트웨이 → 클라이언트 업로드 작업 완료 알림 (POST /webhooks/socketio/job)
+        @app.route("/job", methods=["POST"])
+        async def push_job(request):
+            if not authorized(request):
+                return response.json({"ok": False, "msg": "invalid token"}, status=403)
+            data = request.json or {}
+            recipient_id = data.get("recipient_id")
+            job = data.get("job")
+            if not recipient_id or not isinstance(job, dict):
+                return response.json({"ok": False, "msg": "recipient_id/job이 없습니다."}, status=400)
+            await sio.emit(self.upload_job_evt, job, room=recipient_id, namespace=self.namespace)
+            return response.json({"ok": True})
+
         return app  # ✅ Sanic Blueprint 반환